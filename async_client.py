@@ -0,0 +1,433 @@
+import time
+import asyncio
+import contextlib
+import hashlib
+import importlib.util
+
+try:
+    import httpx
+except ImportError:  # httpx is optional; without it the threaded requests-based functions are used.
+    httpx = None
+
+from confluence_api import (
+    build_headers, confluence_base_url, page_summary, attachment_summary, HashingReader, HASH_CHUNK_SIZE,
+    hash_cache_key, hash_cache_lock, open_file_source, sha256_of_file_source, plan_page_update,
+    describe_page_update, update_operation, DEFAULT_MAX_CONFLICT_RETRIES
+)
+from multipart_stream import MultipartFileStream, STREAM_CHUNK_SIZE
+from metrics import record_span
+from page_cache import remember_page, forget_page
+from request_layer import (
+    DEFAULT_REQUESTS_PER_SECOND, DEFAULT_MAX_RETRIES, THROTTLE_STATUS_CODES, RETRYABLE_STATUS_CODES,
+    IDEMPOTENT_METHODS, backoff_delay, retry_after_seconds
+)
+
+# asyncio counterpart of the Confluence calls in confluence_api.py, built on one pooled httpx.AsyncClient
+# (keep-alive HTTP/1.1, or HTTP/2 when the h2 package is installed). Concurrency is bounded by a semaphore
+# and the request rate by a shared pacer, so a single thread can keep hundreds of requests in flight.
+# Retries, Retry-After handling, metrics spans and log messages follow the synchronous request layer.
+#
+#   async with AsyncConfluenceClient(api_base_url, pat, log_func) as client:
+#       page = await client.create_page("Title", "SPACE", storage)
+
+ASYNC_CLIENT_AVAILABLE = httpx is not None
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+DEFAULT_ASYNC_CONCURRENCY = 64
+
+
+async def _iterate_stream(stream):
+    # MultipartFileStream reads in bounded chunks; hand them to httpx without loading the file. Reading may
+    # decompress a ZIP member and hashes the payload (HashingReader), so it runs in a worker thread.
+    while True:
+        chunk = await asyncio.to_thread(stream.read, STREAM_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+@contextlib.asynccontextmanager
+async def _open_file_source_in_thread(file_source):
+    # Opening a source may decompress a ZIP member or spool it into the attachment store; keep that off the loop.
+    file_context = await asyncio.to_thread(open_file_source, file_source)
+    file_obj = await asyncio.to_thread(file_context.__enter__)
+    try:
+        yield file_obj
+    finally:
+        await asyncio.to_thread(file_context.__exit__, None, None, None)
+
+
+class AsyncConfluenceClient:
+    def __init__(self, api_base_url, confluence_pat, log_func, max_concurrency=DEFAULT_ASYNC_CONCURRENCY,
+                 requests_per_second=DEFAULT_REQUESTS_PER_SECOND, max_retries=DEFAULT_MAX_RETRIES, timeout=60.0):
+        if not ASYNC_CLIENT_AVAILABLE:
+            raise RuntimeError("The async client requires httpx (pip install httpx).")
+        self.api_base_url = api_base_url
+        self.log_func = log_func
+        self.headers_content, self.headers_attachment = build_headers(confluence_pat)
+        self.max_retries = max_retries
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._pacing_lock = asyncio.Lock()
+        self._seconds_per_request = 1.0 / max(0.1, float(requests_per_second))
+        self._next_request_at = 0.0
+        self._paused_until = 0.0
+        self._client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE, timeout=timeout,
+            limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    # --- Request Layer ---
+    async def _wait_for_turn(self):
+        # Spaces request starts evenly at the configured rate and honors a Retry-After pause.
+        loop = asyncio.get_running_loop()
+        async with self._pacing_lock:
+            now = loop.time()
+            start_at = max(now, self._next_request_at, self._paused_until)
+            self._next_request_at = start_at + self._seconds_per_request
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+    async def _send(self, method, url, operation, page_id=None, headers=None, json=None, params=None,
+                    body_stream=None, stream=False):
+        # Returns the final response (read, unless stream=True) or raises the last transport error.
+        started = time.monotonic()
+        bytes_per_attempt = body_stream.len if body_stream is not None else 0
+        request_headers = dict(headers or self.headers_content)
+        if body_stream is not None:
+            request_headers.update({"Content-Type": body_stream.content_type, "Content-Length": str(body_stream.len)})
+        attempt = 0
+        while True:
+            await self._wait_for_turn()
+            if body_stream is not None:
+                body_stream.seek(0)
+            request = self._client.build_request(
+                method, url, headers=request_headers, json=json, params=params,
+                content=_iterate_stream(body_stream) if body_stream is not None else None
+            )
+            if json is not None:
+                bytes_per_attempt = len(request.content)
+            try:
+                async with self._semaphore:
+                    response = await self._client.send(request, stream=True)
+                    if not stream:
+                        await response.aread()
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries or method not in IDEMPOTENT_METHODS:
+                    record_span(operation, method, page_id, None, time.monotonic() - started, attempt,
+                                bytes_per_attempt * (attempt + 1), error=type(e).__name__)
+                    raise
+                delay = backoff_delay(attempt)
+            else:
+                throttled = response.status_code in THROTTLE_STATUS_CODES
+                retryable = throttled or (response.status_code in RETRYABLE_STATUS_CODES
+                                          and method in IDEMPOTENT_METHODS)
+                if not retryable or attempt >= self.max_retries:
+                    record_span(operation, method, page_id, response.status_code, time.monotonic() - started,
+                                attempt, bytes_per_attempt * (attempt + 1))
+                    return response
+                server_delay = retry_after_seconds(response)
+                delay = server_delay if server_delay is not None else backoff_delay(attempt)
+                if server_delay is not None:
+                    self._paused_until = max(self._paused_until, asyncio.get_running_loop().time() + server_delay)
+                await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _log_http_error(self, message, error):
+        self.log_func(f"{message}: {error} (Status {error.response.status_code})")
+        try:
+            self.log_func(f"Response content: {error.response.text[:500]}...")
+        except Exception:
+            self.log_func("Could not decode error response content.")
+
+    # --- Pages ---
+    async def create_page(self, title, space_key, storage_format_data, parent_id=None):
+        page_data = {
+            "type": "page", "title": title, "space": {"key": space_key},
+            "body": {"storage": {"value": storage_format_data, "representation": "storage"}},
+        }
+        if parent_id:
+            page_data["ancestors"] = [{"id": str(parent_id)}]
+            self.log_func(f"Attempting to create page '{title}' in space '{space_key}' under parent ID "
+                          f"'{parent_id}'...")
+        else:
+            self.log_func(f"Attempting to create page '{title}' in space '{space_key}' (at space root)...")
+        try:
+            response = await self._send("POST", f"{self.api_base_url}/content", "create_page", json=page_data)
+            response.raise_for_status()
+            page = dict(page_summary(response.json(), self.api_base_url),
+                        parent_id=str(parent_id) if parent_id else None)
+            self.log_func(f"SUCCESS: Created page '{page['title']}' (ID: {page['id']}, Version: {page['version']})")
+            forget_page(page["id"], parent_ids=(parent_id,))
+            remember_page(page, space_key)
+            return {"id": page["id"], "link": page["link"], "version": page["version"], "title": page["title"]}
+        except httpx.HTTPStatusError as e:
+            self._log_http_error("ERROR creating page", e)
+        except Exception as e:
+            self.log_func(f"Unexpected error in AsyncConfluenceClient.create_page: {e}")
+        return None
+
+    async def get_page(self, page_id, expand="body.storage,version,ancestors"):
+        try:
+            response = await self._send("GET", f"{self.api_base_url}/content/{page_id}", "get_page", page_id=page_id,
+                                        params={"expand": expand})
+            response.raise_for_status()
+            return page_summary(response.json(), self.api_base_url)
+        except httpx.HTTPStatusError as e:
+            self.log_func(f"ERROR fetching page ID '{page_id}': {e} (Status {e.response.status_code})")
+        except Exception as e:
+            self.log_func(f"Unexpected error in AsyncConfluenceClient.get_page: {e}")
+        return None
+
+    async def find_page_by_title(self, space_key, title, expand="body.storage,version,ancestors"):
+        # Returns the page summary, None if no page has this title in the space, or False if the lookup failed.
+        try:
+            response = await self._send("GET", f"{self.api_base_url}/content", "find_page",
+                                        params={"spaceKey": space_key, "title": title, "type": "page",
+                                                "expand": expand})
+            response.raise_for_status()
+            results = response.json().get('results', [])
+            return page_summary(results[0], self.api_base_url) if results else None
+        except httpx.HTTPStatusError as e:
+            self.log_func(f"ERROR looking up page '{title}' in space '{space_key}': {e} "
+                          f"(Status {e.response.status_code})")
+        except Exception as e:
+            self.log_func(f"Unexpected error in AsyncConfluenceClient.find_page_by_title: {e}")
+        return False
+
+    async def _list_paginated(self, api_url, operation, page_id, page_size):
+        results = []
+        start = 0
+        while True:
+            response = await self._send("GET", api_url, operation, page_id=page_id,
+                                        params={"start": start, "limit": page_size, "expand": "version"})
+            response.raise_for_status()
+            page_info = response.json()
+            batch = page_info.get('results', [])
+            results += batch
+            if not batch or not page_info.get('_links', {}).get('next'):
+                return results
+            start += len(batch)
+
+    async def list_child_pages(self, page_id, page_size=200):
+        try:
+            children = await self._list_paginated(f"{self.api_base_url}/content/{page_id}/child/page",
+                                                  "list_children", page_id, page_size)
+            return [dict(page_summary(child_info, self.api_base_url), parent_id=str(page_id))
+                    for child_info in children]
+        except httpx.HTTPStatusError as e:
+            self.log_func(f"ERROR listing child pages of page ID '{page_id}': {e} (Status {e.response.status_code})")
+        except Exception as e:
+            self.log_func(f"Unexpected error in AsyncConfluenceClient.list_child_pages: {e}")
+        return None
+
+    async def apply_page_changes(self, page_id, space_key, title=None, parent_id=None, storage_format_data=None,
+                                 current_page=None, max_conflict_retries=DEFAULT_MAX_CONFLICT_RETRIES):
+        # Same as confluence_api.apply_page_changes_api: one merged PUT, refetch and replan on a version conflict.
+        page = current_page
+        expand = "body.storage,version,ancestors" if storage_format_data is not None else "version,ancestors"
+        for attempt in range(max_conflict_retries + 1):
+            if page is None:
+                page = await self.get_page(page_id, expand=expand)
+                if not page:
+                    return None
+            update_data = plan_page_update(page, space_key, title, parent_id, storage_format_data)
+            if update_data is None:
+                self.log_func(f"UNCHANGED: Page '{page['title']}' (ID: {page_id}, Version: {page['version']}) "
+                              f"already has these changes.")
+                return dict(page, action="unchanged")
+            self.log_func(f"Attempting to update page ID '{page_id}' (Ver: {page['version']}): "
+                          f"{describe_page_update(page, update_data)}...")
+            try:
+                response = await self._send("PUT", f"{self.api_base_url}/content/{page_id}",
+                                            update_operation(page, update_data), page_id=page_id, json=update_data)
+                if response.status_code == 409 and attempt < max_conflict_retries:
+                    self.log_func(f"WARNING: Version {page['version']} of page ID '{page_id}' is stale, refetching "
+                                  f"and retrying the update...")
+                    page = None
+                    continue
+                response.raise_for_status()
+                updated_page = page_summary(response.json(), self.api_base_url)
+                if not updated_page["parent_id"]:
+                    updated_page["parent_id"] = str(parent_id) if "ancestors" in update_data else page.get("parent_id")
+                self.log_func(f"SUCCESS: Updated page '{updated_page['title']}' (ID: {page_id}). "
+                              f"New Version: {updated_page['version']}")
+                forget_page(page_id, parent_ids=(page.get("parent_id"), parent_id),
+                            titles=((space_key, updated_page["title"]),))
+                return dict(updated_page, action="updated")
+            except httpx.HTTPStatusError as e:
+                self._log_http_error(f"ERROR updating page ID '{page_id}'", e)
+                if "title already exists" in e.response.text.lower():
+                    self.log_func("  >>> This often means the new title is already in use in this space.")
+            except Exception as e:
+                self.log_func(f"Unexpected error in AsyncConfluenceClient.apply_page_changes: {e}")
+            return None
+        return None
+
+    async def move_page(self, page_id_to_move, current_page_title, space_key, new_parent_id, current_version):
+        current_page = {"id": page_id_to_move, "title": current_page_title, "version": current_version,
+                        "parent_id": None}
+        updated_page = await self.apply_page_changes(page_id_to_move, space_key, parent_id=new_parent_id,
+                                                     current_page=current_page)
+        if not updated_page:
+            return False, current_version
+        return True, updated_page["version"]
+
+    async def update_page_title(self, page_id_to_update, new_page_title, space_key, current_version):
+        current_page = {"id": page_id_to_update, "title": None, "version": current_version, "parent_id": None}
+        updated_page = await self.apply_page_changes(page_id_to_update, space_key, title=new_page_title,
+                                                     current_page=current_page)
+        if not updated_page:
+            return False, current_version, None
+        return True, updated_page["version"], updated_page["title"]
+
+    # --- Attachments ---
+    async def list_attachments(self, page_id, page_size=200):
+        # Returns {filename: attachment summary} for every attachment on the page, or None on error.
+        try:
+            results = await self._list_paginated(f"{self.api_base_url}/content/{page_id}/child/attachment",
+                                                 "list_attachments", page_id, page_size)
+            attachments = {summary["title"]: summary for summary in map(attachment_summary, results)}
+            self.log_func(f"  Found {len(attachments)} existing attachment(s) on page ID {page_id}.")
+            return attachments
+        except httpx.HTTPStatusError as e:
+            self.log_func(f"  ERROR listing attachments of page ID {page_id}: {e} (Status {e.response.status_code})")
+        except Exception as e:
+            self.log_func(f"  Unexpected error listing attachments of page ID {page_id}: {e}")
+        return None
+
+    async def upload_attachment(self, page_id, filename_on_confluence, file_obj, file_size=None, attachment_id=None,
+                                progress_callback=None, log_func=None):
+        # Posts a new attachment, or a new version of attachment_id. file_obj is a readable, rewindable file
+        # object that is streamed in bounded chunks. Returns the attachment summary, or False.
+        log_func = log_func or self.log_func
+        if attachment_id:
+            api_url = f"{self.api_base_url}/content/{page_id}/child/attachment/{attachment_id}/data"
+            log_func(f"  Uploading new version of '{filename_on_confluence}' (attachment ID {attachment_id})...")
+        else:
+            api_url = f"{self.api_base_url}/content/{page_id}/child/attachment"
+            log_func(f"  Uploading as '{filename_on_confluence}' to page ID {page_id}...")
+        try:
+            body = MultipartFileStream('file', filename_on_confluence, file_obj, file_size=file_size,
+                                       progress_callback=progress_callback)
+            response = await self._send("POST", api_url, "update_attachment" if attachment_id else "upload_attachment",
+                                        page_id=page_id, headers=self.headers_attachment, body_stream=body)
+            response.raise_for_status()
+            if attachment_id:
+                attachment_info = attachment_summary(response.json())
+                log_func(f"  SUCCESS: Updated '{filename_on_confluence}' to version {attachment_info['version']}")
+                return attachment_info
+            log_func(f"  SUCCESS: Uploaded '{filename_on_confluence}'")
+            return attachment_summary((response.json().get('results') or [{}])[0])
+        except httpx.HTTPStatusError as e:
+            log_func(f"  ERROR uploading '{filename_on_confluence}': {e} (Status {e.response.status_code})")
+            if e.response.status_code == 403:
+                log_func("  >>> Forbidden: Check PAT permissions for adding attachments.")
+            log_func(f"  Response content: {e.response.text[:200]}...")
+        except Exception as e:
+            log_func(f"  Unexpected error uploading '{filename_on_confluence}': {e}")
+        return False
+
+    async def remote_attachment_sha256(self, attachment_info, hash_cache):
+        cache_key = hash_cache_key(attachment_info)
+        with hash_cache_lock:
+            cached_hash = hash_cache.get(cache_key)
+        if cached_hash:
+            return cached_hash
+        download_url = f"{confluence_base_url(self.api_base_url)}{attachment_info['download']}"
+        hasher = hashlib.sha256()
+        response = await self._send("GET", download_url, "download_attachment", stream=True)
+        try:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(HASH_CHUNK_SIZE):
+                hasher.update(chunk)
+        finally:
+            await response.aclose()
+        with hash_cache_lock:
+            hash_cache[cache_key] = hasher.hexdigest()
+        return hasher.hexdigest()
+
+    async def upload_attachments(self, page_id, upload_jobs, existing_attachments=None, hash_cache=None,
+                                 progress_callback=None, result_callback=None):
+        # Same contract as confluence_api.upload_attachments_parallel, on one thread: upload_jobs are
+        # (filename_on_confluence, file_source, file_size); identical files already on the page are skipped and
+        # changed ones get a new version. Each upload's log lines are flushed together when it finishes.
+        # Returns (succeeded, failed, unchanged).
+        counts = {"succeeded": 0, "failed": 0, "unchanged": 0}
+        if hash_cache is None:
+            hash_cache = {}
+        # At most max_concurrency uploads hash or hold an open source at a time, not one per attachment.
+        upload_slots = asyncio.Semaphore(self.max_concurrency)
+
+        async def _upload_one(filename_on_confluence, file_source, file_size):
+            async with upload_slots:
+                return await _upload_one_in_slot(filename_on_confluence, file_source, file_size)
+
+        async def _upload_one_in_slot(filename_on_confluence, file_source, file_size):
+            job_logs = []
+            try:
+                existing = existing_attachments.get(filename_on_confluence) if existing_attachments else None
+                if existing and (file_size is None or existing["size"] in (None, file_size)):
+                    local_hash = await asyncio.to_thread(sha256_of_file_source, file_source)
+                    if local_hash == await self.remote_attachment_sha256(existing, hash_cache):
+                        job_logs.append(f"  UNCHANGED: '{filename_on_confluence}' matches the attachment on the page.")
+                        if result_callback:
+                            result_callback(filename_on_confluence, "unchanged", existing, local_hash)
+                        return "unchanged", job_logs
+                async with _open_file_source_in_thread(file_source) as file_obj:
+                    hashing_reader = HashingReader(file_obj)
+                    result = await self.upload_attachment(
+                        page_id, filename_on_confluence, hashing_reader, file_size=file_size,
+                        attachment_id=existing["id"] if existing else None, progress_callback=progress_callback,
+                        log_func=job_logs.append
+                    )
+                if result and result.get("id") and result.get("version"):
+                    with hash_cache_lock:
+                        hash_cache[hash_cache_key(result)] = hashing_reader.hexdigest()
+                if result and result_callback:
+                    result_callback(filename_on_confluence, "succeeded", result, hashing_reader.hexdigest())
+                return ("succeeded" if result else "failed"), job_logs
+            except Exception as e_upload_call:
+                job_logs.append(f"  ERROR during upload of '{filename_on_confluence}': {e_upload_call}")
+                return "failed", job_logs
+
+        if upload_jobs:
+            self.log_func(f"  Uploading {len(upload_jobs)} attachment(s) on one thread, up to "
+                          f"{self.max_concurrency} request(s) in flight...")
+        for finished in asyncio.as_completed([_upload_one(*job) for job in upload_jobs]):
+            outcome, job_logs = await finished
+            for line in job_logs:
+                self.log_func(line)
+            counts[outcome] += 1
+        return counts["succeeded"], counts["failed"], counts["unchanged"]
+
+
+def upload_attachments_async(page_id, upload_jobs, api_base_url, confluence_pat, log_func,
+                             max_concurrency=DEFAULT_ASYNC_CONCURRENCY, requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+                             existing_attachments=None, hash_cache=None, progress_callback=None, poll_callback=None,
+                             poll_interval=0.5, result_callback=None):
+    # Blocking entry point for synchronous callers (the Streamlit script, CLI tools): runs all uploads on an
+    # event loop in the calling thread, so progress_callback and poll_callback run on that thread as well.
+    async def _run():
+        async with AsyncConfluenceClient(api_base_url, confluence_pat, log_func, max_concurrency=max_concurrency,
+                                         requests_per_second=requests_per_second) as client:
+            uploads = asyncio.ensure_future(client.upload_attachments(
+                page_id, upload_jobs, existing_attachments=existing_attachments, hash_cache=hash_cache,
+                progress_callback=progress_callback, result_callback=result_callback
+            ))
+            while not uploads.done():
+                await asyncio.wait([uploads], timeout=poll_interval)
+                if poll_callback:
+                    poll_callback()
+            return uploads.result()
+
+    return asyncio.run(_run())
@@ -0,0 +1,180 @@
+import os
+import json
+import uuid
+import hashlib
+import threading
+
+from confluence_api import HASH_CHUNK_SIZE, open_file_source
+
+# Local content-addressed store for attachment data, shared by all sessions of the app. Each file is spooled
+# to disk once under its SHA-256 (objects/ab/abcdef...), and uploads then stream from the stored copy instead of
+# holding uploads or decompressed ZIP members in memory. ZIP members are also indexed by the SHA-256 of their
+# archive plus their name, so the same bundle uploaded again is hashed once as a whole but not decompressed.
+# When the store grows beyond max_bytes, the least recently used files are evicted.
+
+DEFAULT_ATTACHMENT_STORE_DIR = os.path.join(os.path.expanduser("~"), ".confluence_publisher", "attachment_store")
+DEFAULT_ATTACHMENT_STORE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+ZIP_INDEX_FILE_NAME = "zip_members.json"
+MAX_ZIP_INDEX_ENTRIES = 100000
+
+
+class AttachmentStore:
+    def __init__(self, root_dir=DEFAULT_ATTACHMENT_STORE_DIR, max_bytes=DEFAULT_ATTACHMENT_STORE_MAX_BYTES):
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self._objects_dir = os.path.join(root_dir, "objects")
+        self._zip_index_file = os.path.join(root_dir, ZIP_INDEX_FILE_NAME)
+        os.makedirs(self._objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        try:
+            with open(self._zip_index_file, 'r', encoding='utf-8') as f:
+                self._zip_index = json.load(f)
+        except (OSError, ValueError):
+            self._zip_index = {}
+        self._zip_index_changed = False
+        self._total_bytes = sum(size for _, _, size in self._stored_objects())
+        self.hits = 0
+        self.spooled = 0
+        self.evictions = 0
+
+    def _stored_objects(self):
+        # Yields (path, last use, size) of every stored file.
+        for prefix_entry in os.scandir(self._objects_dir):
+            if not prefix_entry.is_dir():
+                continue
+            for entry in os.scandir(prefix_entry.path):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_mtime, stat.st_size
+
+    def path_for(self, sha256):
+        return os.path.join(self._objects_dir, sha256[:2], sha256)
+
+    def contains(self, sha256):
+        return os.path.isfile(self.path_for(sha256))
+
+    def open(self, sha256):
+        # The file's mtime records its last use for eviction.
+        path = self.path_for(sha256)
+        file_obj = open(path, 'rb')
+        os.utime(path)
+        return file_obj
+
+    def spool(self, file_source, zip_key=None):
+        # Copies file_source (bytes, or a callable returning a context manager that yields a readable file) into
+        # the store unless a ZIP member with the same zip_key is already there. Returns the SHA-256.
+        if zip_key:
+            with self._lock:
+                sha256 = self._zip_index.get(zip_key)
+            if sha256 and self.contains(sha256):
+                self.hits += 1
+                os.utime(self.path_for(sha256))
+                return sha256
+
+        tmp_path = os.path.join(self._objects_dir, f"{uuid.uuid4().hex}.tmp")
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open_file_source(file_source) as file_obj, open(tmp_path, 'wb') as tmp_file:
+                for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+                    tmp_file.write(chunk)
+                    size += len(chunk)
+            sha256 = hasher.hexdigest()
+            path = self.path_for(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._lock:
+                if os.path.isfile(path):
+                    self.hits += 1
+                    os.utime(path)
+                else:
+                    os.replace(tmp_path, path)
+                    self._total_bytes += size
+                    self.spooled += 1
+                if zip_key:
+                    # Most recently spooled last, so the oldest entries go once the index is full. Written to disk
+                    # by save_zip_index, once the archive's members are uploaded.
+                    self._zip_index.pop(zip_key, None)
+                    self._zip_index[zip_key] = sha256
+                    self._zip_index_changed = True
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict(keep=sha256)
+        return sha256
+
+    def save_zip_index(self):
+        # Writes the ZIP member index if members were spooled or evicted since the last save.
+        with self._lock:
+            if self._zip_index_changed:
+                self._save_zip_index()
+
+    def _save_zip_index(self):
+        for old_zip_key in list(self._zip_index)[:max(0, len(self._zip_index) - MAX_ZIP_INDEX_ENTRIES)]:
+            del self._zip_index[old_zip_key]
+        tmp_file = f"{self._zip_index_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._zip_index, f)
+        os.replace(tmp_file, self._zip_index_file)
+        self._zip_index_changed = False
+
+    def evict(self, keep=None):
+        # Removes the least recently used files until the store fits in max_bytes. Files being read stay readable
+        # (the open handle outlives the unlink); a source whose file was evicted spools it again on next use.
+        with self._lock:
+            if self._total_bytes <= self.max_bytes:
+                return
+            for path, _, size in sorted(self._stored_objects(), key=lambda stored_object: stored_object[1]):
+                if self._total_bytes <= self.max_bytes:
+                    break
+                if os.path.basename(path) == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._total_bytes -= size
+                self.evictions += 1
+            # Drop index entries of evicted members so the index stays as small as the store.
+            self._zip_index = {zip_key: sha256 for zip_key, sha256 in self._zip_index.items() if self.contains(sha256)}
+            self._zip_index_changed = True
+
+    def source(self, open_original, zip_key=None):
+        return StoredFileSource(self, open_original, zip_key=zip_key)
+
+    def zip_member_source(self, zip_ref, zip_info, archive_sha256):
+        # The same archive always holds the same bytes under a name, so a known member is found without
+        # decompressing it. (CRC-32 and size alone are not collision-resistant.)
+        return self.source(lambda: zip_ref.open(zip_info), zip_key=f"{archive_sha256}:{zip_info.filename}")
+
+    def stats(self):
+        with self._lock:
+            return {"bytes": self._total_bytes, "max_bytes": self.max_bytes, "hits": self.hits,
+                    "spooled": self.spooled, "evictions": self.evictions}
+
+
+class StoredFileSource:
+    # An upload_jobs file source backed by the store: calling it opens the stored copy, spooling it from the
+    # original source on first use (or again after an eviction). sha256 is known without re-reading the file.
+    def __init__(self, store, open_original, zip_key=None):
+        self.store = store
+        self._open_original = open_original
+        self._zip_key = zip_key
+        self._sha256 = None
+        self._lock = threading.Lock()
+
+    @property
+    def sha256(self):
+        with self._lock:
+            if self._sha256 is None or not self.store.contains(self._sha256):
+                self._sha256 = self.store.spool(self._open_original, zip_key=self._zip_key)
+            return self._sha256
+
+    def __call__(self):
+        try:
+            return self.store.open(self.sha256)
+        except FileNotFoundError:
+            # Evicted between the lookup and the open; spool it again.
+            with self._lock:
+                self._sha256 = None
+            return self.store.open(self.sha256)
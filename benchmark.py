@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+import request_layer
+from bulk_publisher import publish_tree
+from confluence_api import build_headers, create_http_session
+from metrics import reset_metrics, metrics_summary
+from mock_confluence import MockConfluenceServer
+
+# End-to-end benchmark of the bulk publish flow against the local mock server (mock_confluence.py).
+# Each scenario generates a page tree on disk, publishes it with bulk_publisher.publish_tree and reports
+# pages/s, attachments/s, MB/s and p50/p95 request latency. Results can be saved as JSON and compared
+# against a saved baseline; the exit code is 1 when a scenario regressed by more than --max-regression.
+#
+#   python benchmark.py --output baseline.json
+#   python benchmark.py --latency-ms 20 --baseline baseline.json
+
+BENCHMARK_SPACE_KEY = "BENCH"
+BENCHMARK_TOKEN = "benchmark-token"
+
+# (pages, attachments per page, attachment size in bytes)
+QUICK_SCENARIOS = [
+    (10, 0, 0),
+    (10, 5, 64 * 1024),
+    (5, 2, 4 * 1024 * 1024),
+]
+FULL_SCENARIOS = [
+    (1, 0, 0),
+    (50, 0, 0),
+    (200, 0, 0),
+    (20, 10, 16 * 1024),
+    (20, 50, 16 * 1024),
+    (10, 5, 1024 * 1024),
+    (5, 2, 16 * 1024 * 1024),
+]
+
+
+def _size_label(size_bytes):
+    if size_bytes >= 1024 * 1024:
+        return f"{size_bytes // (1024 * 1024)}MB"
+    if size_bytes >= 1024:
+        return f"{size_bytes // 1024}KB"
+    return f"{size_bytes}B"
+
+
+def scenario_name(pages, attachments_per_page, attachment_size):
+    return f"pages={pages} attachments={attachments_per_page}x{_size_label(attachment_size)}"
+
+
+def write_page_tree(root_dir, pages, attachments_per_page, attachment_size):
+    # Flat tree of pages, each referencing its own attachments. Attachment content is random so that
+    # nothing along the way (dedup, compression) can make a run cheaper than a real one.
+    for page_number in range(pages):
+        title = f"Benchmark Page {page_number:04d}"
+        filenames = [f"file-{page_number:04d}-{attachment_number:03d}.bin"
+                     for attachment_number in range(attachments_per_page)]
+        body = f"<h1>{title}</h1><p>Generated by benchmark.py.</p>" + "".join(
+            f'<p><ac:link><ri:attachment ri:filename="{filename}" /></ac:link></p>' for filename in filenames)
+        with open(os.path.join(root_dir, f"{title}.xml"), 'w', encoding='utf-8') as f:
+            f.write(body)
+        if filenames:
+            attachments_dir = os.path.join(root_dir, f"{title}.attachments")
+            os.makedirs(attachments_dir)
+            for filename in filenames:
+                with open(os.path.join(attachments_dir, filename), 'wb') as f:
+                    f.write(os.urandom(attachment_size))
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenario(pages, attachments_per_page, attachment_size, server_options, page_workers, upload_workers,
+                 rate_limit):
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def _record_latency(response, *args, **kwargs):
+        # elapsed covers sending the request (including any upload body) until the response headers arrive.
+        with latencies_lock:
+            latencies.append(("attachment" if "/child/attachment" in response.url else "page",
+                              response.elapsed.total_seconds()))
+
+    # A fresh throttle per scenario, so one scenario's throttling does not slow down the next.
+    request_layer.REQUEST_THROTTLE = request_layer.RequestThrottle(rate_limit, page_workers * upload_workers)
+    reset_metrics()
+    server = MockConfluenceServer(token=BENCHMARK_TOKEN, **server_options).start()
+    try:
+        headers_content, headers_attachment = build_headers(BENCHMARK_TOKEN)
+        api_base_url = f"{server.base_url}/rest/api"
+        session = create_http_session(page_workers * upload_workers)
+        session.hooks['response'].append(_record_latency)
+        with server.state.lock:
+            server.state.pages["1"] = {"id": "1", "title": "Benchmark Root", "space": BENCHMARK_SPACE_KEY,
+                                       "version": 1, "body": "", "ancestors": [], "when": ""}
+            server.state.attachments["1"] = {}
+        with tempfile.TemporaryDirectory(prefix="confluence-benchmark-") as root_dir:
+            write_page_tree(root_dir, pages, attachments_per_page, attachment_size)
+            started = time.monotonic()
+            summary = publish_tree(root_dir, BENCHMARK_SPACE_KEY, "1", headers_content, headers_attachment,
+                                   api_base_url, lambda message: None, page_workers=page_workers,
+                                   upload_workers=upload_workers, session=session)
+            seconds = time.monotonic() - started
+        session.close()
+    finally:
+        server.stop()
+
+    stats = request_layer.request_stats()
+    attachments = summary["attachments_succeeded"]
+    all_latencies = [latency for _, latency in latencies]
+    upload_latencies = [latency for kind, latency in latencies if kind == "attachment"]
+    return {
+        "scenario": scenario_name(pages, attachments_per_page, attachment_size),
+        "pages": pages, "attachments_per_page": attachments_per_page, "attachment_size": attachment_size,
+        "seconds": round(seconds, 3),
+        "pages_per_second": round(summary["pages_created"] / seconds, 2),
+        "attachments_per_second": round(attachments / seconds, 2),
+        "mb_per_second": round(attachments * attachment_size / 1e6 / seconds, 2),
+        "latency_p50_ms": round(percentile(all_latencies, 0.50) * 1000, 1),
+        "latency_p95_ms": round(percentile(all_latencies, 0.95) * 1000, 1),
+        "upload_latency_p50_ms": round(percentile(upload_latencies, 0.50) * 1000, 1),
+        "upload_latency_p95_ms": round(percentile(upload_latencies, 0.95) * 1000, 1),
+        "requests": stats["requests"], "retries": stats["retries"], "throttle_events": stats["throttle_events"],
+        "pages_failed": summary["pages_failed"] + summary["pages_skipped"],
+        "attachments_failed": summary["attachments_failed"],
+        "operations": metrics_summary()["operations"],
+    }
+
+
+def compare_to_baseline(results, baseline, max_regression):
+    # Throughput may not drop, and p95 latency may not grow, by more than max_regression (a fraction).
+    regressions = []
+    baseline_by_name = {result["scenario"]: result for result in baseline.get("results", [])}
+    for result in results:
+        previous = baseline_by_name.get(result["scenario"])
+        if not previous:
+            continue
+        for key in ("pages_per_second", "attachments_per_second", "mb_per_second"):
+            if previous[key] and result[key] < previous[key] * (1 - max_regression):
+                regressions.append(f"{result['scenario']}: {key} {previous[key]} -> {result[key]}")
+        if previous["latency_p95_ms"] and result["latency_p95_ms"] > previous["latency_p95_ms"] * (1 + max_regression):
+            regressions.append(f"{result['scenario']}: latency_p95_ms {previous['latency_p95_ms']} -> "
+                               f"{result['latency_p95_ms']}")
+    return regressions
+
+
+def print_results(results):
+    columns = (("scenario", "Scenario", 36), ("seconds", "Secs", 8), ("pages_per_second", "Pages/s", 9),
+               ("attachments_per_second", "Att/s", 9), ("mb_per_second", "MB/s", 8), ("latency_p50_ms", "p50 ms", 8),
+               ("latency_p95_ms", "p95 ms", 8), ("retries", "Retries", 8), ("attachments_failed", "Failed", 7))
+    print("".join(f"{title:<{width}}" for _, title, width in columns))
+    for result in results:
+        print("".join(f"{str(result[key]):<{width}}" for key, _, width in columns))
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the bulk publish flow against a local mock Confluence.")
+    parser.add_argument("--full", action="store_true", help="Run the full scenario matrix instead of the quick one.")
+    parser.add_argument("--scenario", action="append", metavar="PAGES:ATTACHMENTS:SIZE_KB",
+                        help="Run a custom scenario (repeatable), e.g. 100:3:512.")
+    parser.add_argument("--page-workers", type=int, default=4)
+    parser.add_argument("--upload-workers", type=int, default=8)
+    parser.add_argument("--rate-limit", type=float, default=1000.0, help="Client request rate limit (req/s).")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mock server latency per request.")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--throttle-rps", type=float, default=0.0, help="Mock server rate limit (0 = off).")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of mock requests that fail.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare against results previously written with --output.")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed fractional drop in throughput / growth in p95 latency (default 0.2).")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.scenario:
+        scenarios = []
+        for spec in args.scenario:
+            pages, attachments_per_page, size_kb = (int(part) for part in spec.split(":"))
+            scenarios.append((pages, attachments_per_page, size_kb * 1024))
+    else:
+        scenarios = FULL_SCENARIOS if args.full else QUICK_SCENARIOS
+    server_options = {"latency_ms": args.latency_ms, "latency_jitter_ms": args.latency_jitter_ms,
+                      "throttle_rps": args.throttle_rps, "failure_rate": args.failure_rate}
+
+    results = []
+    for pages, attachments_per_page, attachment_size in scenarios:
+        print(f"Running {scenario_name(pages, attachments_per_page, attachment_size)}...", file=sys.stderr)
+        results.append(run_scenario(pages, attachments_per_page, attachment_size, server_options,
+                                    args.page_workers, args.upload_workers, args.rate_limit))
+    print_results(results)
+
+    report = {"settings": dict(server_options, page_workers=args.page_workers, upload_workers=args.upload_workers,
+                               rate_limit=args.rate_limit), "results": results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_to_baseline(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from confluence_api import (
+    build_headers, create_http_session, create_confluence_page_storage_api,
+    upsert_page_api, list_page_attachments_api, load_attachment_hash_cache, save_attachment_hash_cache,
+    upload_attachments_parallel, resolve_page_reference_api, file_path_source
+)
+from storage_analyzer import analyze_storage
+from image_optimizer import optimize_upload_jobs
+from request_layer import DEFAULT_REQUESTS_PER_SECOND, configure_request_throttle, describe_request_stats
+from metrics import describe_metrics_summary, export_metrics_json, export_metrics_prometheus
+from cli_log import print_log
+from page_labels import DEFAULT_LABEL_WORKERS, parse_label_list, apply_labels_parallel
+from publish_journal import (
+    DEFAULT_JOURNAL_FILE, RUN_COMPLETED, RUN_FAILED, PublishJournal, skip_journaled_uploads
+)
+
+# Headless publisher: turns a directory tree of storage-format XML files into a Confluence page tree.
+#
+#   docs/
+#     Getting Started.xml              -> page "Getting Started"
+#     Getting Started.attachments/     -> files referenced by Getting Started.xml via ri:filename
+#     Getting Started/                 -> child pages of "Getting Started" (same layout, recursively)
+#       Installation.xml
+#
+# A directory without a matching .xml file becomes a placeholder page that lists its children.
+# Parents are always created before their children; independent subtrees are published concurrently.
+
+PAGE_FILE_EXTENSION = ".xml"
+ATTACHMENTS_DIR_SUFFIX = ".attachments"
+PLACEHOLDER_PAGE_BODY = '<ac:structured-macro ac:name="children" />'
+DEFAULT_PAGE_WORKERS = 4
+DEFAULT_UPLOAD_WORKERS = 8
+
+
+# --- Tree Discovery ---
+def _page_node(title, xml_path, attachments_dir, relative_path):
+    return {"title": title, "xml_path": xml_path, "attachments_dir": attachments_dir,
+            "relative_path": relative_path, "children": []}
+
+
+def scan_page_tree(root_dir, relative_dir=""):
+    current_dir = os.path.join(root_dir, relative_dir)
+    entries = sorted(os.listdir(current_dir))
+    page_titles = []
+    for entry in entries:
+        entry_path = os.path.join(current_dir, entry)
+        if os.path.isfile(entry_path) and entry.lower().endswith(PAGE_FILE_EXTENSION):
+            page_titles.append(entry[:-len(PAGE_FILE_EXTENSION)])
+        elif os.path.isdir(entry_path) and not entry.endswith(ATTACHMENTS_DIR_SUFFIX):
+            page_titles.append(entry)
+
+    nodes = []
+    for title in sorted(set(page_titles)):
+        xml_path = os.path.join(current_dir, title + PAGE_FILE_EXTENSION)
+        attachments_dir = os.path.join(current_dir, title + ATTACHMENTS_DIR_SUFFIX)
+        node = _page_node(
+            title,
+            xml_path if os.path.isfile(xml_path) else None,
+            attachments_dir if os.path.isdir(attachments_dir) else None,
+            os.path.join(relative_dir, title)
+        )
+        if os.path.isdir(os.path.join(current_dir, title)):
+            node["children"] = scan_page_tree(root_dir, node["relative_path"])
+        nodes.append(node)
+    return nodes
+
+
+def count_pages(nodes):
+    return sum(1 + count_pages(node["children"]) for node in nodes)
+
+
+# --- Publishing ---
+def publish_page_node(node, space_key, parent_id, headers_content, headers_attachment, api_base_url, log_func,
+                      session, upload_workers, skip_unchanged_attachments=False, hash_cache=None, upsert=False,
+                      image_pool=None, max_image_dimension=None, journal=None, run_id=None):
+    result = {"page": None, "attachments_succeeded": 0, "attachments_failed": 0, "attachments_unchanged": 0,
+              "attachments_resumed": 0}
+    if node["xml_path"]:
+        with open(node["xml_path"], 'r', encoding='utf-8') as f:
+            storage_content = f.read()
+    else:
+        log_func(f"No '{node['title']}{PAGE_FILE_EXTENSION}' found, creating a placeholder page for its children.")
+        storage_content = PLACEHOLDER_PAGE_BODY
+
+    storage_analysis = analyze_storage(storage_content)
+    if storage_analysis["error"]:
+        log_func(f"ERROR: '{node['xml_path']}': {storage_analysis['error']}. Page not published.")
+        return result
+
+    journaled_page = journal.journaled_page(run_id, node["relative_path"]) if journal else None
+    if journaled_page:
+        creation_info = dict(journaled_page, action="resumed")
+        log_func(f"RESUMED: Page '{node['title']}' was already published by this run (ID: {creation_info['id']}).")
+    elif upsert:
+        creation_info = upsert_page_api(
+            node["title"], space_key, storage_content, parent_id, headers_content, api_base_url, log_func=log_func,
+            session=session
+        )
+    else:
+        creation_info = create_confluence_page_storage_api(
+            node["title"], space_key, storage_content, parent_id, headers_content, api_base_url, log_func=log_func,
+            session=session
+        )
+        if creation_info:
+            creation_info["action"] = "created"
+    if not creation_info:
+        return result
+    if journal and not journaled_page:
+        journal.record_page(run_id, node["relative_path"], creation_info)
+    result["page"] = creation_info
+
+    referenced_attachments = storage_analysis["attachments"]
+    if not referenced_attachments:
+        return result
+
+    upload_jobs = []
+    for ref_fn_in_content in referenced_attachments:
+        filename_on_confluence = os.path.basename(ref_fn_in_content)
+        file_path = os.path.join(node["attachments_dir"], filename_on_confluence) if node["attachments_dir"] else None
+        if file_path and os.path.isfile(file_path):
+            upload_jobs.append((filename_on_confluence, file_path_source(file_path), os.path.getsize(file_path)))
+        else:
+            log_func(f"  SKIPPING: Referenced attachment '{filename_on_confluence}' not found in "
+                     f"'{node['title']}{ATTACHMENTS_DIR_SUFFIX}'.")
+            result["attachments_failed"] += 1
+
+    if image_pool and upload_jobs:
+        upload_jobs = optimize_upload_jobs(upload_jobs, log_func, max_dimension=max_image_dimension,
+                                           executor=image_pool)
+    result_callback = None
+    if journal and upload_jobs:
+        upload_jobs, result["attachments_resumed"] = skip_journaled_uploads(
+            journal, run_id, node["relative_path"], upload_jobs, log_func)
+        result_callback = journal.attachment_recorder(run_id, node["relative_path"])
+    existing_attachments = None
+    if skip_unchanged_attachments and upload_jobs:
+        existing_attachments = list_page_attachments_api(creation_info["id"], headers_attachment, api_base_url,
+                                                         log_func=log_func, session=session)
+    succeeded, failed, unchanged = upload_attachments_parallel(
+        creation_info["id"], upload_jobs, headers_attachment, api_base_url, log_func=log_func,
+        max_workers=upload_workers, session=session, existing_attachments=existing_attachments, hash_cache=hash_cache,
+        result_callback=result_callback
+    )
+    result["attachments_succeeded"] += succeeded
+    result["attachments_failed"] += failed
+    result["attachments_unchanged"] += unchanged
+    return result
+
+
+def publish_tree(root_dir, space_key, parent_id, headers_content, headers_attachment, api_base_url, log_func,
+                 page_workers=DEFAULT_PAGE_WORKERS, upload_workers=DEFAULT_UPLOAD_WORKERS,
+                 skip_unchanged_attachments=False, upsert=False, optimize_images=False,
+                 max_image_dimension=None, session=None, journal=None, run_id=None):
+    # Dependency-aware scheduler: a page is submitted as soon as its parent exists, so sibling subtrees
+    # proceed in parallel. Each page task buffers its log lines, which are flushed from this thread
+    # when the task finishes so the output of concurrent pages is not interleaved.
+    # With a journal, every created page and uploaded attachment is recorded under run_id, and pages and
+    # attachments the run already recorded are reused instead of published again.
+    nodes = scan_page_tree(root_dir)
+    total_pages = count_pages(nodes)
+    log_func(f"Found {total_pages} page(s) under '{root_dir}'. Publishing with {page_workers} page worker(s)...")
+
+    summary = {"pages_created": 0, "pages_updated": 0, "pages_unchanged": 0, "pages_resumed": 0, "pages_failed": 0,
+               "pages_skipped": 0, "attachments_succeeded": 0, "attachments_failed": 0, "attachments_unchanged": 0,
+               "attachments_resumed": 0, "page_ids": {}}
+    session = session or create_http_session(page_workers * upload_workers)
+    hash_cache = load_attachment_hash_cache() if skip_unchanged_attachments else None
+    image_pool = ProcessPoolExecutor() if optimize_images else None
+
+    def _run(node, node_parent_id):
+        page_logs = []
+        try:
+            return publish_page_node(node, space_key, node_parent_id, headers_content, headers_attachment,
+                                     api_base_url, page_logs.append, session, upload_workers,
+                                     skip_unchanged_attachments=skip_unchanged_attachments,
+                                     hash_cache=hash_cache, upsert=upsert, image_pool=image_pool,
+                                     max_image_dimension=max_image_dimension, journal=journal,
+                                     run_id=run_id), page_logs
+        except Exception as e:
+            page_logs.append(f"ERROR publishing '{node['relative_path']}': {e}")
+            return None, page_logs
+
+    with ThreadPoolExecutor(max_workers=page_workers) as executor:
+        pending = {executor.submit(_run, node, parent_id): node for node in nodes}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = pending.pop(future)
+                result, page_logs = future.result()
+                for line in page_logs:
+                    log_func(line)
+                if not result or not result["page"]:
+                    skipped = count_pages(node["children"])
+                    summary["pages_failed"] += 1
+                    summary["pages_skipped"] += skipped
+                    log_func(f"ERROR: Could not publish '{node['relative_path']}'"
+                             + (f", skipping its {skipped} descendant page(s)." if skipped else "."))
+                    continue
+                summary[f"pages_{result['page']['action']}"] += 1
+                summary["page_ids"][node["relative_path"]] = result["page"]["id"]
+                for key in ("attachments_succeeded", "attachments_failed", "attachments_unchanged",
+                            "attachments_resumed"):
+                    summary[key] += result[key]
+                for child in node["children"]:
+                    pending[executor.submit(_run, child, result["page"]["id"])] = child
+
+    if image_pool:
+        image_pool.shutdown()
+    if hash_cache is not None:
+        try:
+            save_attachment_hash_cache(hash_cache)
+        except OSError as e_cache:
+            log_func(f"WARNING: Could not save attachment hash cache: {e_cache}")
+    if journal:
+        failed = summary["pages_failed"] or summary["attachments_failed"]
+        journal.finish_run(run_id, RUN_FAILED if failed else RUN_COMPLETED)
+    log_func(f"Publish summary: {summary['pages_created']} page(s) created, {summary['pages_updated']} updated, "
+             f"{summary['pages_unchanged']} unchanged, {summary['pages_resumed']} resumed, "
+             f"{summary['pages_failed']} failed, {summary['pages_skipped']} skipped. "
+             f"Attachments: {summary['attachments_succeeded']} succeeded, {summary['attachments_failed']} "
+             f"failed/skipped, {summary['attachments_unchanged']} unchanged, {summary['attachments_resumed']} resumed.")
+    log_func(describe_request_stats())
+    log_func(describe_metrics_summary())
+    return summary
+
+
+# --- Command Line ---
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Publish a directory tree of Confluence storage-format XML files as a page hierarchy."
+    )
+    parser.add_argument("root_dir", help="Directory containing <title>.xml pages, <title>/ child folders and "
+                                         "<title>.attachments/ attachment folders.")
+    parser.add_argument("--url", required=True, help="Confluence base URL, e.g. https://confluence.example.com/")
+    parser.add_argument("--space", required=True, help="Space key to publish into.")
+    parser.add_argument("--parent-id", default=None,
+                        help="Page ID or title of the page to publish the tree under (default: space root).")
+    parser.add_argument("--pat", default=os.environ.get("CONFLUENCE_PAT"),
+                        help="Confluence Personal Access Token (default: $CONFLUENCE_PAT).")
+    parser.add_argument("--page-workers", type=int, default=DEFAULT_PAGE_WORKERS,
+                        help="How many pages are published at the same time.")
+    parser.add_argument("--upload-workers", type=int, default=DEFAULT_UPLOAD_WORKERS,
+                        help="How many attachments are uploaded at the same time per page.")
+    parser.add_argument("--rate-limit", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help="Maximum Confluence API requests per second across all workers.")
+    parser.add_argument("--skip-unchanged-attachments", action="store_true",
+                        help="Compare with attachments already on the page and skip identical files.")
+    parser.add_argument("--optimize-images", action="store_true",
+                        help="Recompress PNG/JPEG attachments and strip metadata before upload (requires Pillow).")
+    parser.add_argument("--max-image-dimension", type=int, default=None,
+                        help="With --optimize-images, scale down images larger than this many pixels.")
+    parser.add_argument("--upsert", action="store_true",
+                        help="Update pages that already exist (matched by space and title) instead of failing, "
+                             "writing a new version only when the content changed.")
+    parser.add_argument("--metrics-json", default=None,
+                        help="Write per-call API timings and the run summary to this JSON file.")
+    parser.add_argument("--metrics-prometheus", default=None,
+                        help="Write the run's API metrics to this file in Prometheus text format.")
+    parser.add_argument("--labels", default=None,
+                        help="Labels (separated by spaces or commas) to add to every published page afterwards.")
+    parser.add_argument("--journal", nargs="?", const=DEFAULT_JOURNAL_FILE, default=None, metavar="PATH",
+                        help="Record each published page and attachment in a local SQLite journal so an "
+                             f"interrupted run can be resumed (default path: {DEFAULT_JOURNAL_FILE}).")
+    parser.add_argument("--resume", nargs="?", const="latest", default=None, metavar="RUN_ID",
+                        help="Resume the latest unfinished run for this directory and space (or the given run), "
+                             "skipping pages and attachments it already published. Implies --journal.")
+    parser.add_argument("--list-runs", action="store_true", help="List the runs in the journal and exit.")
+    return parser
+
+
+def print_journal_runs(journal):
+    runs = journal.list_runs()
+    if not runs:
+        print_log(f"No runs in the journal '{journal.path}'.")
+    for run in runs:
+        print_log(f"{run['run_id']}  {run['status']:<9}  {run['updated_at']}  space={run['space_key']}  "
+                  f"pages={run['pages']}  attachments={run['attachments']}  {run['source_key']}")
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    journal_path = args.journal or DEFAULT_JOURNAL_FILE
+    if args.list_runs:
+        print_journal_runs(PublishJournal(journal_path))
+        return 0
+    if not args.pat:
+        print_log("ERROR: No PAT given. Use --pat or set CONFLUENCE_PAT.")
+        return 2
+    if not os.path.isdir(args.root_dir):
+        print_log(f"ERROR: '{args.root_dir}' is not a directory.")
+        return 2
+    api_base_url = f"{args.url.rstrip('/')}/rest/api"
+    headers_content, headers_attachment = build_headers(args.pat)
+    page_workers = max(1, args.page_workers)
+    upload_workers = max(1, args.upload_workers)
+    configure_request_throttle(args.rate_limit, page_workers * upload_workers)
+    parent_id = resolve_page_reference_api(args.parent_id, args.space, headers_content, api_base_url, print_log)
+    if args.parent_id and not parent_id:
+        return 2
+
+    journal = run_id = None
+    if args.journal or args.resume:
+        journal = PublishJournal(journal_path)
+        source_key = os.path.abspath(args.root_dir)
+        if args.resume == "latest":
+            run = journal.find_resumable_run("tree", source_key, args.space, parent_id)
+        else:
+            run = journal.get_run(args.resume) if args.resume else None
+        if args.resume and not run:
+            print_log(f"ERROR: No unfinished run to resume for '{source_key}' in space '{args.space}' under parent "
+                      f"page {parent_id or '(none)'}.")
+            return 2
+        # Resuming into another space or under another parent would reuse pages published somewhere else.
+        if run and (run["kind"], run["source_key"], run["space_key"], run["parent_id"]) \
+                != ("tree", source_key, args.space, parent_id):
+            print_log(f"ERROR: Run {run['run_id']} published '{run['source_key']}' to space '{run['space_key']}' "
+                      f"under parent page {run['parent_id'] or '(none)'}; it cannot be resumed for '{source_key}' "
+                      f"in space '{args.space}' under parent page {parent_id or '(none)'}.")
+            return 2
+        if run:
+            run_id = run["run_id"]
+            journal.resume_run(run_id)
+            print_log(f"Resuming run {run_id} (started {run['created_at']}).")
+        else:
+            run_id = journal.start_run("tree", source_key, args.space, parent_id=parent_id,
+                                       options={"upsert": args.upsert})
+            print_log(f"Journaling this run as {run_id} in '{journal.path}'.")
+    summary = publish_tree(
+        args.root_dir, args.space, parent_id, headers_content, headers_attachment, api_base_url, print_log,
+        page_workers=page_workers, upload_workers=upload_workers,
+        skip_unchanged_attachments=args.skip_unchanged_attachments, upsert=args.upsert,
+        optimize_images=args.optimize_images, max_image_dimension=args.max_image_dimension,
+        journal=journal, run_id=run_id
+    )
+    label_summary = None
+    if args.labels and summary["page_ids"]:
+        label_summary = apply_labels_parallel(
+            summary["page_ids"].values(), parse_label_list(args.labels), headers_content, api_base_url, print_log,
+            max_workers=max(DEFAULT_LABEL_WORKERS, page_workers)
+        )
+    for metrics_path, export in ((args.metrics_json, export_metrics_json),
+                                 (args.metrics_prometheus, export_metrics_prometheus)):
+        if metrics_path:
+            try:
+                with open(metrics_path, 'w', encoding='utf-8') as f:
+                    f.write(export())
+            except OSError as e_metrics:
+                print_log(f"WARNING: Could not write metrics to '{metrics_path}': {e_metrics}")
+    labels_failed = label_summary and label_summary["failed"]
+    return 1 if summary["pages_failed"] or summary["attachments_failed"] or labels_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,13 @@
+import threading
+from datetime import datetime
+
+# Timestamped console logging shared by the command-line tools. print_log is passed as log_func to the API
+# helpers, which call it from worker threads, so lines are printed under a lock.
+
+_print_lock = threading.Lock()
+
+
+def print_log(message):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with _print_lock:
+        print(f"[{timestamp}] {message}", flush=True)
@@ -0,0 +1,866 @@
+import os
+import re
+import io
+import json
+import hashlib
+import tempfile
+import threading
+import contextlib
+import functools
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from request_layer import send_request
+from multipart_stream import MultipartFileStream
+from page_cache import (
+    cached_page, cached_page_by_title, cached_children, is_cache_miss, remember_page, remember_missing_title,
+    remember_children, forget_page
+)
+
+# Confluence REST API calls shared by the Streamlit app (confluence_uploader.py) and the headless tools.
+# Every function takes the api_base_url ("<confluence url>/rest/api"), the request headers and a log_func,
+# and reports problems through log_func instead of raising.
+
+def confluence_base_url(api_base_url):
+    return api_base_url.rstrip('/').rsplit('/rest/api', 1)[0]
+
+
+def build_headers(confluence_pat):
+    # Returns (headers for JSON content calls, headers for multipart attachment calls).
+    headers_content = {
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {confluence_pat}"
+    }
+    headers_attachment = {
+        "Accept": "application/json",
+        "X-Atlassian-Token": "nocheck",
+        "Authorization": f"Bearer {confluence_pat}"
+    }
+    return headers_content, headers_attachment
+
+
+def create_http_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def create_confluence_page_storage_api(title, space_key, storage_format_data, parent_id, headers, api_base_url,
+                                       log_func, session=None):
+    api_url = f"{api_base_url}/content"
+    page_data = {
+        "type": "page", "title": title, "space": {"key": space_key},
+        "body": {"storage": {"value": storage_format_data, "representation": "storage"}},
+    }
+    if parent_id:
+        page_data["ancestors"] = [{"id": str(parent_id)}]
+        log_func(f"Attempting to create page '{title}' in space '{space_key}' under parent ID '{parent_id}'...")
+    else:
+        log_func(f"Attempting to create page '{title}' in space '{space_key}' (at space root)...")
+
+    try:
+        response = send_request("POST", api_url, session=session, operation="create_page", headers=headers,
+                                json=page_data, timeout=30)
+        response.raise_for_status()
+        page_info = response.json()
+        page_id = page_info.get('id')
+        version_number = page_info.get('version', {}).get('number')
+        created_title = page_info.get('title')
+        web_ui_suffix = page_info.get('_links', {}).get('webui', '')
+        page_link_relative = web_ui_suffix if web_ui_suffix and web_ui_suffix.startswith(
+            '/') else f"/pages/viewpage.action?pageId={page_id}"
+        page_link_full = f"{confluence_base_url(api_base_url)}{page_link_relative}"
+        log_func(f"SUCCESS: Created page '{created_title}' (ID: {page_id}, Version: {version_number})")
+        forget_page(page_id, parent_ids=(parent_id,))
+        remember_page(dict(page_summary(page_info, api_base_url), parent_id=str(parent_id) if parent_id else None),
+                      space_key)
+        return {"id": page_id, "link": page_link_full, "version": version_number, "title": created_title}
+    except requests.exceptions.HTTPError as e:
+        log_func(f"ERROR creating page: {e} (Status {e.response.status_code})")
+        try:
+            log_func(f"Response content: {e.response.text[:500]}...")
+        except Exception:
+            log_func("Could not decode error response content.")
+    except Exception as e:
+        log_func(f"Unexpected error in create_confluence_page_storage_api: {e}")
+    return None
+
+
+def page_summary(page_info, api_base_url):
+    page_id = page_info.get('id')
+    web_ui_suffix = page_info.get('_links', {}).get('webui', '')
+    page_link_relative = web_ui_suffix if web_ui_suffix and web_ui_suffix.startswith(
+        '/') else f"/pages/viewpage.action?pageId={page_id}"
+    ancestors = page_info.get('ancestors') or []
+    return {
+        "id": page_id,
+        "title": page_info.get('title'),
+        "version": page_info.get('version', {}).get('number'),
+        "last_modified": page_info.get('version', {}).get('when'),
+        "link": f"{confluence_base_url(api_base_url)}{page_link_relative}",
+        "body": page_info.get('body', {}).get('storage', {}).get('value'),
+        "parent_id": ancestors[-1].get('id') if ancestors else None,
+        "ancestor_ids": [str(ancestor.get('id')) for ancestor in ancestors],
+    }
+
+
+def get_page_api(page_id, headers, api_base_url, log_func, session=None, expand="body.storage,version,ancestors"):
+    api_url = f"{api_base_url}/content/{page_id}"
+    try:
+        response = send_request("GET", api_url, session=session, operation="get_page", page_id=page_id,
+                                headers=headers, params={"expand": expand}, timeout=30)
+        response.raise_for_status()
+        return page_summary(response.json(), api_base_url)
+    except requests.exceptions.HTTPError as e:
+        log_func(f"ERROR fetching page ID '{page_id}': {e} (Status {e.response.status_code})")
+    except Exception as e:
+        log_func(f"Unexpected error in get_page_api: {e}")
+    return None
+
+
+def find_page_by_title_api(space_key, title, headers, api_base_url, log_func, session=None,
+                           expand="body.storage,version,ancestors"):
+    # Returns the page summary, None if no page has this title in the space, or False if the lookup failed.
+    api_url = f"{api_base_url}/content"
+    try:
+        response = send_request("GET", api_url, session=session, operation="find_page", headers=headers, timeout=30,
+                                params={"spaceKey": space_key, "title": title, "type": "page", "expand": expand})
+        response.raise_for_status()
+        results = response.json().get('results', [])
+        return page_summary(results[0], api_base_url) if results else None
+    except requests.exceptions.HTTPError as e:
+        log_func(f"ERROR looking up page '{title}' in space '{space_key}': {e} (Status {e.response.status_code})")
+    except Exception as e:
+        log_func(f"Unexpected error in find_page_by_title_api: {e}")
+    return False
+
+
+def list_child_pages_api(page_id, headers, api_base_url, log_func, session=None, page_size=200):
+    # Returns the summaries (without body) of the direct child pages, following pagination, or None on error.
+    api_url = f"{api_base_url}/content/{page_id}/child/page"
+    children = []
+    start = 0
+    try:
+        while True:
+            response = send_request("GET", api_url, session=session, operation="list_children", page_id=page_id,
+                                    headers=headers, timeout=30,
+                                    params={"start": start, "limit": page_size, "expand": "version"})
+            response.raise_for_status()
+            page_info = response.json()
+            results = page_info.get('results', [])
+            children += [dict(page_summary(child_info, api_base_url), parent_id=str(page_id))
+                         for child_info in results]
+            if not results or not page_info.get('_links', {}).get('next'):
+                break
+            start += len(results)
+        return children
+    except requests.exceptions.HTTPError as e:
+        log_func(f"ERROR listing child pages of page ID '{page_id}': {e} (Status {e.response.status_code})")
+    except Exception as e:
+        log_func(f"Unexpected error in list_child_pages_api: {e}")
+    return None
+
+
+def search_pages_cql_api(cql, headers, api_base_url, log_func, session=None, expand="version,ancestors",
+                         page_size=100):
+    # Returns the summaries of all pages matching the CQL query, following pagination, or None on error.
+    api_url = f"{api_base_url}/content/search"
+    pages = []
+    start = 0
+    try:
+        while True:
+            response = send_request("GET", api_url, session=session, operation="search_pages", headers=headers,
+                                    params={"cql": cql, "start": start, "limit": page_size, "expand": expand},
+                                    timeout=60)
+            response.raise_for_status()
+            search_info = response.json()
+            results = search_info.get('results', [])
+            pages += [page_summary(page_info, api_base_url) for page_info in results]
+            # Confluence may return fewer results than the limit (it lowers it for expanded searches), so only
+            # the next link says whether there are more.
+            if not results or not search_info.get('_links', {}).get('next'):
+                break
+            start += len(results)
+        return pages
+    except requests.exceptions.HTTPError as e:
+        log_func(f"ERROR searching pages ({cql[:100]}): {e} (Status {e.response.status_code})")
+    except Exception as e:
+        log_func(f"Unexpected error in search_pages_cql_api: {e}")
+    return None
+
+
+def get_pages_by_ids_api(page_ids, headers, api_base_url, log_func, session=None, batch_size=100):
+    # Fetches version and ancestors of many pages with one CQL search per batch_size IDs instead of one GET per
+    # page. Returns {page_id: summary without body} (missing IDs are left out), or None on error.
+    page_ids = list(dict.fromkeys(str(page_id) for page_id in page_ids))
+    pages = {}
+    for batch_start in range(0, len(page_ids), batch_size):
+        batch = page_ids[batch_start:batch_start + batch_size]
+        results = search_pages_cql_api(f"id in ({','.join(batch)})", headers, api_base_url, log_func,
+                                       session=session, page_size=len(batch))
+        if results is None:
+            return None
+        pages.update((str(page["id"]), page) for page in results)
+    return pages
+
+
+# --- Cached Page Metadata ---
+# Lookups through page_cache.PAGE_METADATA_CACHE. They return the same values as the uncached functions,
+# except that cached pages have no body.
+def get_page_metadata_cached(page_id, headers, api_base_url, log_func, session=None):
+    page = cached_page(page_id)
+    if is_cache_miss(page):
+        page = get_page_api(page_id, headers, api_base_url, log_func, session=session, expand="version,ancestors")
+        if page:
+            remember_page(page, None)
+    return page
+
+
+def find_page_by_title_cached(space_key, title, headers, api_base_url, log_func, session=None):
+    page = cached_page_by_title(space_key, title)
+    if is_cache_miss(page):
+        page = find_page_by_title_api(space_key, title, headers, api_base_url, log_func, session=session,
+                                      expand="version,ancestors")
+        if page:
+            remember_page(page, space_key)
+        elif page is None:
+            remember_missing_title(space_key, title)
+    return page
+
+
+def list_child_pages_cached(page_id, headers, api_base_url, log_func, session=None):
+    children = cached_children(page_id)
+    if is_cache_miss(children):
+        children = list_child_pages_api(page_id, headers, api_base_url, log_func, session=session)
+        if children is not None:
+            remember_children(page_id, children)
+    return children
+
+
+def current_page_version_cached(page_id, headers, api_base_url, log_func, session=None):
+    page = get_page_metadata_cached(page_id, headers, api_base_url, log_func, session=session)
+    return page["version"] if page else None
+
+
+def check_title_available_api(space_key, title, headers, api_base_url, log_func, session=None, page_id=None):
+    # True if no other page in the space uses the title (the page being renamed, page_id, may), False if it is
+    # taken, None if the lookup failed.
+    existing_page = find_page_by_title_cached(space_key, title, headers, api_base_url, log_func, session=session)
+    if existing_page is False:
+        return None
+    if existing_page and str(existing_page["id"]) != str(page_id):
+        log_func(f"Title '{title}' is already used by page ID {existing_page['id']} in space '{space_key}'.")
+        return False
+    return True
+
+
+def resolve_page_reference_api(page_reference, space_key, headers, api_base_url, log_func, session=None):
+    # Accepts a page ID or a page title in the space; returns the page ID as a string, or None.
+    page_reference = str(page_reference or "").strip()
+    if not page_reference or page_reference.isdigit():
+        return page_reference or None
+    page = find_page_by_title_cached(space_key, page_reference, headers, api_base_url, log_func, session=session)
+    if not page:
+        if page is None:
+            log_func(f"ERROR: No page titled '{page_reference}' in space '{space_key}'.")
+        return None
+    log_func(f"Resolved page '{page_reference}' to ID {page['id']}.")
+    return str(page["id"])
+
+
+# --- Upsert ---
+def normalize_storage(storage_format_data):
+    # Confluence re-serializes stored bodies, so compare on a canonical form that ignores
+    # formatting-only differences (line endings, indentation, self-closing tag spacing).
+    normalized = storage_format_data.replace("\r\n", "\n")
+    normalized = re.sub(r">\s+<", "><", normalized)
+    normalized = re.sub(r"\s+", " ", normalized).strip()
+    normalized = re.sub(r"<(br|hr)>", r"<\1/>", normalized)
+    normalized = re.sub(r"\s*/>", "/>", normalized)
+    return normalized
+
+
+def storage_hash(storage_format_data):
+    return hashlib.sha256(normalize_storage(storage_format_data or "").encode('utf-8')).hexdigest()
+
+
+def upsert_page_api(title, space_key, storage_format_data, parent_id, headers, api_base_url, log_func, session=None,
+                    page_id=None):
+    # Looks the page up by ID (if given) or by space + title. Creates it when missing, PUTs one new version only
+    # when the normalized body, title or parent changed, and otherwise leaves it untouched.
+    # Returns the page info with an extra "action": "created", "updated" or "unchanged".
+    if page_id:
+        existing_page = get_page_api(page_id, headers, api_base_url, log_func, session=session)
+        if not existing_page:
+            return None
+    else:
+        existing_page = find_page_by_title_api(space_key, title, headers, api_base_url, log_func, session=session)
+        if existing_page is False:
+            return None
+
+    if not existing_page:
+        creation_info = create_confluence_page_storage_api(title, space_key, storage_format_data, parent_id, headers,
+                                                           api_base_url, log_func, session=session)
+        return dict(creation_info, action="created") if creation_info else None
+
+    return apply_page_changes_api(existing_page["id"], space_key, headers, api_base_url, log_func, session=session,
+                                  title=title, parent_id=parent_id, storage_format_data=storage_format_data,
+                                  current_page=existing_page)
+
+
+def attachment_summary(attachment_info):
+    return {
+        "id": attachment_info.get('id'),
+        "title": attachment_info.get('title'),
+        "size": attachment_info.get('extensions', {}).get('fileSize'),
+        "version": attachment_info.get('version', {}).get('number'),
+        "download": attachment_info.get('_links', {}).get('download'),
+    }
+
+
+def _multipart_file_body(filename_on_confluence, file_data, file_size, headers, progress_callback):
+    # file_data may be bytes or a readable file object; either way the body is streamed in bounded chunks.
+    if isinstance(file_data, (bytes, bytearray)):
+        file_size = len(file_data)
+        file_data = io.BytesIO(file_data)
+    body = MultipartFileStream('file', filename_on_confluence, file_data, file_size=file_size,
+                               progress_callback=progress_callback)
+    return body, dict(headers, **{"Content-Type": body.content_type})
+
+
+def upload_attachment_api(page_id, filename_on_confluence, file_data, headers, api_base_url, log_func, session=None,
+                          file_size=None, progress_callback=None):
+    api_url = f"{api_base_url}/content/{page_id}/child/attachment"
+    try:
+        body, request_headers = _multipart_file_body(filename_on_confluence, file_data, file_size, headers,
+                                                     progress_callback)
+        log_func(f"  Uploading as '{filename_on_confluence}' to page ID {page_id}...")
+        resp = send_request("POST", api_url, session=session, operation="upload_attachment", page_id=page_id,
+                            headers=request_headers, data=body, timeout=60)
+        resp.raise_for_status()
+        log_func(f"  SUCCESS: Uploaded '{filename_on_confluence}'")
+        results = resp.json().get('results') or [{}]
+        return attachment_summary(results[0])
+    except requests.exceptions.HTTPError as e:
+        log_func(f"  ERROR uploading '{filename_on_confluence}': {e} (Status {e.response.status_code})")
+        if e.response.status_code == 409:
+            log_func("  >>> Conflict: Attachment with this name might already exist on the page.")
+        elif e.response.status_code == 403:
+            log_func("  >>> Forbidden: Check PAT permissions for adding attachments.")
+        try:
+            log_func(f"  Response content: {e.response.text[:200]}...")
+        except Exception:
+            log_func("Could not decode error response content.")
+    except Exception as e:
+        log_func(f"  Unexpected error uploading '{filename_on_confluence}': {e}")
+    return False
+
+
+def update_attachment_data_api(page_id, attachment_id, filename_on_confluence, file_data, headers, api_base_url,
+                               log_func, session=None, file_size=None, progress_callback=None):
+    api_url = f"{api_base_url}/content/{page_id}/child/attachment/{attachment_id}/data"
+    try:
+        body, request_headers = _multipart_file_body(filename_on_confluence, file_data, file_size, headers,
+                                                     progress_callback)
+        log_func(f"  Uploading new version of '{filename_on_confluence}' (attachment ID {attachment_id})...")
+        resp = send_request("POST", api_url, session=session, operation="update_attachment", page_id=page_id,
+                            headers=request_headers, data=body, timeout=60)
+        resp.raise_for_status()
+        attachment_info = attachment_summary(resp.json())
+        log_func(f"  SUCCESS: Updated '{filename_on_confluence}' to version {attachment_info['version']}")
+        return attachment_info
+    except requests.exceptions.HTTPError as e:
+        log_func(f"  ERROR updating '{filename_on_confluence}': {e} (Status {e.response.status_code})")
+        try:
+            log_func(f"  Response content: {e.response.text[:200]}...")
+        except Exception:
+            log_func("Could not decode error response content.")
+    except Exception as e:
+        log_func(f"  Unexpected error updating '{filename_on_confluence}': {e}")
+    return False
+
+
+def list_page_attachments_api(page_id, headers, api_base_url, log_func, session=None, page_size=200):
+    # Returns {filename: attachment summary} for every attachment on the page, following pagination.
+    api_url = f"{api_base_url}/content/{page_id}/child/attachment"
+    attachments = {}
+    start = 0
+    try:
+        while True:
+            resp = send_request("GET", api_url, session=session, operation="list_attachments", page_id=page_id,
+                                headers=headers, timeout=30,
+                                params={"start": start, "limit": page_size, "expand": "version"})
+            resp.raise_for_status()
+            page_info = resp.json()
+            results = page_info.get('results', [])
+            for attachment_info in results:
+                summary = attachment_summary(attachment_info)
+                attachments[summary["title"]] = summary
+            if not results or not page_info.get('_links', {}).get('next'):
+                break
+            start += len(results)
+        log_func(f"  Found {len(attachments)} existing attachment(s) on page ID {page_id}.")
+        return attachments
+    except requests.exceptions.HTTPError as e:
+        log_func(f"  ERROR listing attachments of page ID {page_id}: {e} (Status {e.response.status_code})")
+    except Exception as e:
+        log_func(f"  Unexpected error listing attachments of page ID {page_id}: {e}")
+    return None
+
+
+# --- Attachment Sources ---
+def upload_buffer(file_obj):
+    # A read-only view of an in-memory upload's data. getbuffer() would copy a BytesIO built from bytes (such as
+    # Streamlit's UploadedFile), while getvalue() returns that bytes object itself.
+    if isinstance(file_obj, BufferReader):
+        return file_obj.getbuffer()
+    return memoryview(file_obj.getvalue())
+
+
+class BufferReader(io.RawIOBase):
+    # Read-only, seekable file over a shared buffer (e.g. upload_buffer() of an upload) without copying it. Each
+    # reader has its own position, so any number of them can read the same upload at the same time.
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def getbuffer(self):
+        return self._view
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._position + size)
+        chunk = self._view[self._position:end].tobytes()
+        self._position = max(self._position, end)
+        return chunk
+
+    def readinto(self, buffer):
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._position = offset
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def index_zip_attachments(zip_file_obj, archive_description, attachment_sources, log_func, store=None):
+    # Builds basename -> (open_func, source_description, size) from the ZIP's central directory only.
+    # Member data is decompressed lazily, when (and if) the member is actually uploaded. With an
+    # attachment_store.AttachmentStore, members are spooled to (or found in) the store on first use.
+    zip_ref = zipfile.ZipFile(zip_file_obj, 'r')
+    archive_sha256 = None
+    if store:
+        hasher = hashlib.sha256()
+        zip_file_obj.seek(0)
+        for chunk in iter(lambda: zip_file_obj.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+        archive_sha256 = hasher.hexdigest()
+    indexed_count = 0
+    for zip_info in zip_ref.infolist():
+        if zip_info.is_dir():
+            continue
+        name_in_zip = zip_info.filename
+        base_name_in_zip = os.path.basename(name_in_zip)
+        if base_name_in_zip in attachment_sources:
+            log_func(
+                f"    WARNING: Attachment '{base_name_in_zip}' from '{archive_description}' (path: '{name_in_zip}') overrides a previously found file.")
+        open_func = store.zip_member_source(zip_ref, zip_info, archive_sha256) if store \
+            else functools.partial(zip_ref.open, zip_info)
+        attachment_sources[base_name_in_zip] = (open_func, f"{archive_description}/{name_in_zip}", zip_info.file_size)
+        indexed_count += 1
+    log_func(f"    Indexed {indexed_count} file(s) in ZIP '{archive_description}'.")
+    return zip_ref
+
+
+# --- Attachment Hash Cache ---
+# Maps "<attachment id>:<version>" -> SHA-256 of that attachment version, so remote attachments are
+# downloaded at most once to be hashed, and not at all if we uploaded that version ourselves.
+ATTACHMENT_HASH_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".confluence_publisher", "attachment_hashes.json")
+HASH_CHUNK_SIZE = 1024 * 1024
+hash_cache_lock = threading.Lock()
+
+
+def load_attachment_hash_cache(cache_file=ATTACHMENT_HASH_CACHE_FILE):
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_attachment_hash_cache(hash_cache, cache_file=ATTACHMENT_HASH_CACHE_FILE):
+    # Concurrent jobs save the cache too: each writes its own temporary file, and the rename happens under the
+    # lock so an older snapshot never replaces a newer one.
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp_fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file), suffix=".tmp")
+    try:
+        with hash_cache_lock:
+            with os.fdopen(tmp_fd, 'w', encoding='utf-8') as f:
+                json.dump(hash_cache, f)
+            os.replace(tmp_file, cache_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def hash_cache_key(attachment_info):
+    return f"{attachment_info['id']}:{attachment_info['version']}"
+
+
+class HashingReader:
+    # File wrapper that computes the SHA-256 of everything read through it, so an upload hashes its
+    # payload without a second pass over the source.
+    def __init__(self, file_obj):
+        self._file_obj = file_obj
+        self._hasher = hashlib.sha256()
+
+    def read(self, size=-1):
+        chunk = self._file_obj.read(size)
+        self._hasher.update(chunk)
+        return chunk
+
+    def seek(self, offset, whence=0):
+        # Only rewinding is meaningful for a running hash (the request layer rewinds bodies before a retry).
+        position = self._file_obj.seek(offset, whence)
+        if position == 0:
+            self._hasher = hashlib.sha256()
+        return position
+
+    def tell(self):
+        return self._file_obj.tell()
+
+    def hexdigest(self):
+        return self._hasher.hexdigest()
+
+
+def open_file_source(file_source):
+    if callable(file_source):
+        return file_source()
+    return contextlib.nullcontext(io.BytesIO(file_source))
+
+
+def file_path_source(path):
+    return functools.partial(open, path, 'rb')
+
+
+def sha256_of_file_source(file_source):
+    # Sources from attachment_store.AttachmentStore already know their hash.
+    known_sha256 = getattr(file_source, "sha256", None)
+    if known_sha256:
+        return known_sha256
+    hasher = hashlib.sha256()
+    with open_file_source(file_source) as file_obj:
+        for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def remote_attachment_sha256(attachment_info, headers, api_base_url, hash_cache, session=None):
+    cache_key = hash_cache_key(attachment_info)
+    with hash_cache_lock:
+        cached_hash = hash_cache.get(cache_key)
+    if cached_hash:
+        return cached_hash
+    download_url = f"{confluence_base_url(api_base_url)}{attachment_info['download']}"
+    hasher = hashlib.sha256()
+    with send_request("GET", download_url, session=session, operation="download_attachment", headers=headers,
+                      stream=True, timeout=60) as resp:
+        resp.raise_for_status()
+        for chunk in resp.iter_content(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+    with hash_cache_lock:
+        hash_cache[cache_key] = hasher.hexdigest()
+    return hasher.hexdigest()
+
+
+def download_attachment_api(attachment_info, target_path, headers, api_base_url, log_func, session=None):
+    # Streams the attachment to target_path through a temporary file, so an interrupted download never leaves a
+    # truncated file behind. Returns the number of bytes written, or None on error.
+    download_url = f"{confluence_base_url(api_base_url)}{attachment_info['download']}"
+    tmp_path = f"{target_path}.part"
+    try:
+        size = 0
+        with send_request("GET", download_url, session=session, operation="download_attachment", headers=headers,
+                          stream=True, timeout=60) as resp:
+            resp.raise_for_status()
+            with open(tmp_path, 'wb') as f:
+                for chunk in resp.iter_content(HASH_CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+        os.replace(tmp_path, target_path)
+        return size
+    except requests.exceptions.HTTPError as e:
+        log_func(f"  ERROR downloading attachment '{attachment_info['title']}': {e} "
+                 f"(Status {e.response.status_code})")
+    except Exception as e:
+        log_func(f"  Unexpected error downloading attachment '{attachment_info['title']}': {e}")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return None
+
+
+def upload_attachments_parallel(page_id, upload_jobs, headers, api_base_url, log_func, max_workers, session=None,
+                                existing_attachments=None, hash_cache=None, progress_callback=None,
+                                poll_callback=None, poll_interval=0.5, result_callback=None):
+    # upload_jobs: list of (filename_on_confluence, file_source, file_size), where file_source is either bytes or
+    # a callable returning a context manager that yields a readable file object. Sources are opened only
+    # inside the worker, so at most one file per worker is being read at any time.
+    # When existing_attachments ({filename: attachment summary}) is given, identical files (same size and
+    # SHA-256) are skipped, changed files are posted as a new version and only new files are uploaded.
+    # Worker threads must not touch st.session_state, so each upload buffers its own log lines
+    # and they are flushed through log_func from this thread as the uploads complete.
+    # progress_callback(filename, bytes_sent, total_bytes) is called from the worker threads while a file is
+    # streamed; poll_callback() is called from this thread every poll_interval seconds, e.g. to redraw a UI.
+    # result_callback(filename, outcome, attachment_info, sha256) is called from the worker thread after each
+    # successful or unchanged upload, e.g. to journal it. Returns (succeeded, failed, unchanged).
+    succ_uploads = 0
+    fail_uploads = 0
+    unchanged_uploads = 0
+    if not upload_jobs:
+        return succ_uploads, fail_uploads, unchanged_uploads
+    if hash_cache is None:
+        hash_cache = {}
+
+    def _upload_one(filename_on_confluence, file_source, file_size):
+        job_logs = []
+        try:
+            existing = existing_attachments.get(filename_on_confluence) if existing_attachments else None
+            if existing and (file_size is None or existing["size"] in (None, file_size)):
+                local_hash = sha256_of_file_source(file_source)
+                remote_hash = remote_attachment_sha256(existing, headers, api_base_url, hash_cache, session=session)
+                if local_hash == remote_hash:
+                    job_logs.append(f"  UNCHANGED: '{filename_on_confluence}' matches the attachment on the page.")
+                    if result_callback:
+                        result_callback(filename_on_confluence, "unchanged", existing, local_hash)
+                    return "unchanged", job_logs
+            with open_file_source(file_source) as file_obj:
+                hashing_reader = HashingReader(file_obj)
+                if existing:
+                    result = update_attachment_data_api(page_id, existing["id"], filename_on_confluence,
+                                                        hashing_reader, headers, api_base_url,
+                                                        log_func=job_logs.append, session=session,
+                                                        file_size=file_size, progress_callback=progress_callback)
+                else:
+                    result = upload_attachment_api(page_id, filename_on_confluence, hashing_reader, headers,
+                                                   api_base_url, log_func=job_logs.append, session=session,
+                                                   file_size=file_size, progress_callback=progress_callback)
+            if result and result.get("id") and result.get("version"):
+                with hash_cache_lock:
+                    hash_cache[hash_cache_key(result)] = hashing_reader.hexdigest()
+            if result and result_callback:
+                result_callback(filename_on_confluence, "succeeded", result, hashing_reader.hexdigest())
+            return ("succeeded" if result else "failed"), job_logs
+        except Exception as e_upload_call:
+            job_logs.append(f"  ERROR during upload of '{filename_on_confluence}': {e_upload_call}")
+            return "failed", job_logs
+
+    worker_count = max(1, min(max_workers, len(upload_jobs)))
+    log_func(f"  Uploading {len(upload_jobs)} attachment(s) with {worker_count} parallel worker(s)...")
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        pending = {executor.submit(_upload_one, fn, source, size) for fn, source, size in upload_jobs}
+        while pending:
+            done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome, job_logs = future.result()
+                for line in job_logs:
+                    log_func(line)
+                if outcome == "succeeded":
+                    succ_uploads += 1
+                elif outcome == "unchanged":
+                    unchanged_uploads += 1
+                else:
+                    fail_uploads += 1
+            if poll_callback:
+                poll_callback()
+    return succ_uploads, fail_uploads, unchanged_uploads
+
+
+# --- Labels ---
+def list_page_labels_api(page_id, headers, api_base_url, log_func, session=None, page_size=200):
+    # Returns the names of the page's labels, following pagination, or None on error.
+    api_url = f"{api_base_url}/content/{page_id}/label"
+    labels = []
+    start = 0
+    try:
+        while True:
+            response = send_request("GET", api_url, session=session, operation="list_labels", page_id=page_id,
+                                    headers=headers, params={"start": start, "limit": page_size}, timeout=30)
+            response.raise_for_status()
+            label_info = response.json()
+            results = label_info.get('results', [])
+            labels += [label.get('name') for label in results]
+            if not results or not label_info.get('_links', {}).get('next'):
+                break
+            start += len(results)
+        return labels
+    except requests.exceptions.HTTPError as e:
+        log_func(f"ERROR listing labels of page ID '{page_id}': {e} (Status {e.response.status_code})")
+    except Exception as e:
+        log_func(f"Unexpected error in list_page_labels_api: {e}")
+    return None
+
+
+def add_page_labels_api(page_id, labels, headers, api_base_url, log_func, session=None):
+    # Adds all labels with one POST. Returns the page's label names afterwards, or None on error.
+    api_url = f"{api_base_url}/content/{page_id}/label"
+    try:
+        response = send_request("POST", api_url, session=session, operation="add_labels", page_id=page_id,
+                                headers=headers, json=[{"prefix": "global", "name": label} for label in labels],
+                                timeout=30)
+        response.raise_for_status()
+        log_func(f"SUCCESS: Added {len(labels)} label(s) to page ID {page_id}: {', '.join(labels)}")
+        return [label.get('name') for label in response.json().get('results', [])]
+    except requests.exceptions.HTTPError as e:
+        log_func(f"ERROR adding labels to page ID '{page_id}': {e} (Status {e.response.status_code})")
+        _log_response_error(e.response, log_func)
+    except Exception as e:
+        log_func(f"Unexpected error in add_page_labels_api: {e}")
+    return None
+
+
+# --- Merged Page Updates ---
+# Title, parent and body changes to a page are planned together and sent as one versioned PUT. The version
+# comes from the page the caller already holds (e.g. right after creating it) and is only refetched when
+# Confluence answers 409 because someone else edited the page in between.
+DEFAULT_MAX_CONFLICT_RETRIES = 3
+
+
+def plan_page_update(page, space_key, title=None, parent_id=None, storage_format_data=None):
+    # Returns the PUT payload applying every change that differs from page (a page summary), or None if the page
+    # already matches. The body is only compared when page carries one.
+    title_changed = bool(title) and title != page.get("title")
+    parent_changed = bool(parent_id) and str(page.get("parent_id")) != str(parent_id)
+    body_changed = storage_format_data is not None and (
+        page.get("body") is None or storage_hash(page["body"]) != storage_hash(storage_format_data))
+    if not (title_changed or parent_changed or body_changed):
+        return None
+    update_data = {
+        "id": str(page["id"]), "type": "page", "title": title or page["title"], "space": {"key": space_key},
+        "version": {"number": page["version"] + 1}
+    }
+    if parent_changed:
+        update_data["ancestors"] = [{"id": str(parent_id)}]
+    if body_changed:
+        update_data["body"] = {"storage": {"value": storage_format_data, "representation": "storage"}}
+    return update_data
+
+
+def describe_page_update(page, update_data):
+    changes = []
+    if update_data["title"] != page.get("title"):
+        changes.append(f"title '{update_data['title']}'")
+    if "ancestors" in update_data:
+        changes.append(f"parent ID '{update_data['ancestors'][0]['id']}'")
+    if "body" in update_data:
+        changes.append("content")
+    return ", ".join(changes)
+
+
+def update_operation(page, update_data):
+    # Metrics name of the PUT: a pure move or rename keeps its own name, anything else is an update.
+    if "body" in update_data or ("ancestors" in update_data and update_data["title"] != page.get("title")):
+        return "update_page"
+    return "move_page" if "ancestors" in update_data else "update_title"
+
+
+def _log_response_error(response, log_func):
+    try:
+        error_detail = response.json().get('message', response.text[:500])
+    except ValueError:
+        error_detail = response.text[:500]
+    if error_detail:
+        log_func(f"Response content: {error_detail}...")
+        if "title already exists" in error_detail.lower():
+            log_func("  >>> This often means the new title is already in use in this space.")
+
+
+def apply_page_changes_api(page_id, space_key, headers, api_base_url, log_func, session=None, title=None,
+                           parent_id=None, storage_format_data=None, current_page=None,
+                           max_conflict_retries=DEFAULT_MAX_CONFLICT_RETRIES):
+    # Applies title / parent / body changes with a single PUT. current_page (a page summary with at least id, title,
+    # version and parent_id) saves the initial GET; on a version conflict the page is refetched and the merged
+    # update planned again. Returns the updated page summary with "action" ("updated" or "unchanged"), or None.
+    api_url = f"{api_base_url}/content/{page_id}"
+    page = current_page
+    expand = "body.storage,version,ancestors" if storage_format_data is not None else "version,ancestors"
+    for attempt in range(max_conflict_retries + 1):
+        if page is None:
+            page = get_page_api(page_id, headers, api_base_url, log_func, session=session, expand=expand)
+            if not page:
+                return None
+        update_data = plan_page_update(page, space_key, title, parent_id, storage_format_data)
+        if update_data is None:
+            log_func(f"UNCHANGED: Page '{page['title']}' (ID: {page_id}, Version: {page['version']}) already has "
+                     f"these changes.")
+            return dict(page, action="unchanged")
+        log_func(f"Attempting to update page ID '{page_id}' (Ver: {page['version']}): "
+                 f"{describe_page_update(page, update_data)}...")
+        try:
+            response = send_request("PUT", api_url, session=session, operation=update_operation(page, update_data),
+                                    page_id=page_id, headers=headers, json=update_data, timeout=30)
+            if response.status_code == 409 and attempt < max_conflict_retries:
+                log_func(f"WARNING: Version {page['version']} of page ID '{page_id}' is stale, refetching and "
+                         f"retrying the update...")
+                page = None
+                continue
+            response.raise_for_status()
+            updated_page = page_summary(response.json(), api_base_url)
+            if not updated_page["parent_id"]:
+                updated_page["parent_id"] = str(parent_id) if "ancestors" in update_data else page.get("parent_id")
+            log_func(f"SUCCESS: Updated page '{updated_page['title']}' (ID: {page_id}). "
+                     f"New Version: {updated_page['version']}")
+            forget_page(page_id, parent_ids=(page.get("parent_id"), parent_id),
+                        titles=((space_key, updated_page["title"]),))
+            return dict(updated_page, action="updated")
+        except requests.exceptions.HTTPError as e:
+            log_func(f"ERROR updating page ID '{page_id}': {e} (Status {e.response.status_code})")
+            _log_response_error(e.response, log_func)
+        except Exception as e:
+            log_func(f"Unexpected error in apply_page_changes_api: {e}")
+        return None
+    return None
+
+
+def move_confluence_page_api(page_id_to_move, current_page_title, space_key, new_parent_id, current_version, headers,
+                             api_base_url, log_func, session=None):
+    # Returns (success, new_version).
+    current_page = {"id": page_id_to_move, "title": current_page_title, "version": current_version,
+                    "parent_id": None}
+    updated_page = apply_page_changes_api(page_id_to_move, space_key, headers, api_base_url, log_func,
+                                          session=session, parent_id=new_parent_id, current_page=current_page)
+    if not updated_page:
+        return False, current_version
+    return True, updated_page["version"]
+
+
+def update_page_title_api(page_id_to_update, new_page_title, space_key, current_version, headers, api_base_url,
+                          log_func, session=None):
+    # Returns (success, new_version, confirmed_title).
+    current_page = {"id": page_id_to_update, "title": None, "version": current_version, "parent_id": None}
+    updated_page = apply_page_changes_api(page_id_to_update, space_key, headers, api_base_url, log_func,
+                                          session=session, title=new_page_title, current_page=current_page)
+    if not updated_page:
+        return False, current_version, None
+    return True, updated_page["version"], updated_page["title"]
@@ -1,16 +1,48 @@
 import streamlit as st
-import requests
 import os
-import re
-from datetime import datetime
-import zipfile
-import io
+import html
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+from confluence_api import (
+    build_headers, create_http_session, BufferReader, upload_buffer, index_zip_attachments,
+    apply_page_changes_api, check_title_available_api, resolve_page_reference_api
+)
+from storage_analyzer import analyze_storage
+from storage_splitter import DEFAULT_SPLIT_MAX_BYTES, DEFAULT_SPLIT_MAX_IMAGES, split_storage, describe_split
+from image_optimizer import IMAGE_OPTIMIZATION_AVAILABLE
+from request_layer import (
+    DEFAULT_REQUESTS_PER_SECOND, configure_request_throttle, reset_request_stats, describe_request_stats
+)
+from async_client import ASYNC_CLIENT_AVAILABLE, DEFAULT_ASYNC_CONCURRENCY
+from log_store import DEFAULT_MAX_LOG_RECORDS, LOG_LEVELS, LogStore, format_log_record
+from metrics import (
+    reset_metrics, metrics_summary, export_metrics_json, export_metrics_prometheus
+)
+from attachment_store import DEFAULT_ATTACHMENT_STORE_MAX_BYTES, AttachmentStore
+from page_labels import DEFAULT_LABEL_WORKERS, parse_label_list, collect_subtree_page_ids, apply_labels_parallel
+from page_mover import (
+    DEFAULT_MOVE_WORKERS, parse_move_mapping, resolve_moves, plan_children_move, move_pages_parallel
+)
+from publish_journal import PublishJournal
+from job_queue import JobQueue
+from page_publisher import DEFAULT_SPLIT_PAGE_WORKERS, publish_page
+from template_publisher import (
+    DATASET_FORMATS, InvalidDatasetRow, compile_page_template, render_page, dataset_format, iter_dataset_rows,
+    open_uploaded_dataset, publish_template_rows
+)
 
 DEFAULT_CONFLUENCE_URL = "https://confluence.bsh-group.com/"
 
 
 DEFAULT_SPACE_KEY = ""
 FALLBACK_PAGE_TITLE_BASE = "Automated Page FallBack Title"
+DEFAULT_UPLOAD_WORKERS = 8
+MAX_UPLOAD_WORKERS = 32
+TEMPLATE_PAGE_WORKERS = 4
+MAX_ASYNC_CONCURRENCY = 512
+LOG_LINES_PER_PAGE = 100
+PUBLISH_JOBS_SHOWN = 10
 
 st.set_page_config(page_title="Docupedia Page Publisher", layout="wide")
 st.title("Docupedia Page Publishing Tool")
@@ -24,8 +56,10 @@ if 'current_page_title' not in st.session_state:
     st.session_state.current_page_title = None
 if 'page_link' not in st.session_state:
     st.session_state.page_link = None
-if 'logs' not in st.session_state:
-    st.session_state.logs = []
+if 'log_store' not in st.session_state:
+    st.session_state.log_store = LogStore(DEFAULT_MAX_LOG_RECORDS)
+if 'publish_jobs' not in st.session_state:
+    st.session_state.publish_jobs = []  # {"job_id", "log_position", "applied"} per job queued from this session
 
 # Tag Collector utility state
 if 'tag_collector_input' not in st.session_state:
@@ -35,9 +69,9 @@ if 'tag_collector_output' not in st.session_state:
 
 
 # --- Logging Helper ---
-def add_log(message):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    st.session_state.logs.append(f"[{timestamp}] {message}")
+def add_log(message, level=None):
+    # The level is inferred from the message prefix (SUCCESS:/WARNING:/ERROR) unless given.
+    st.session_state.log_store.append(message, level=level, page_id=st.session_state.page_id)
 
 
 # --- Sidebar ---
@@ -59,6 +93,81 @@ with st.sidebar:
         help="Your Confluence Personal Access Token.",
         key="pat_input_sidebar"
     )
+    UPLOAD_WORKERS = int(st.number_input(
+        "Parallel Attachment Uploads",
+        min_value=1,
+        max_value=MAX_UPLOAD_WORKERS,
+        value=DEFAULT_UPLOAD_WORKERS,
+        help="How many attachments are uploaded at the same time over a shared, keep-alive connection pool.",
+        key="upload_workers_input_sidebar"
+    ))
+    REQUESTS_PER_SECOND = st.number_input(
+        "Max API Requests per Second",
+        min_value=1.0,
+        value=DEFAULT_REQUESTS_PER_SECOND,
+        help="Shared rate limit for all Confluence API calls. Throttled (429/503) calls are retried after the"
+             " server's Retry-After, and concurrency shrinks automatically while the server is throttling.",
+        key="requests_per_second_input_sidebar"
+    )
+    configure_request_throttle(REQUESTS_PER_SECOND, MAX_UPLOAD_WORKERS)
+    USE_ASYNC_UPLOADS = st.checkbox(
+        "Async uploads (single thread)",
+        value=False,
+        disabled=not ASYNC_CLIENT_AVAILABLE,
+        help="Upload attachments from one event loop over a pooled httpx connection instead of worker threads,"
+             " allowing many more requests in flight." if ASYNC_CLIENT_AVAILABLE
+        else "Requires httpx (pip install httpx).",
+        key="use_async_uploads_checkbox_sidebar"
+    )
+    ASYNC_CONCURRENCY = int(st.number_input(
+        "Max Requests in Flight (async)",
+        min_value=1,
+        max_value=MAX_ASYNC_CONCURRENCY,
+        value=DEFAULT_ASYNC_CONCURRENCY,
+        disabled=not USE_ASYNC_UPLOADS,
+        key="async_concurrency_input_sidebar"
+    ))
+    RESUME_INTERRUPTED_PUBLISHES = st.checkbox(
+        "Resume Interrupted Publishes",
+        value=True,
+        help="Journal each created page and uploaded attachment locally. Publishing the same content again after"
+             " a crash or refresh reuses the page and skips attachments that were already uploaded.",
+        key="resume_publishes_checkbox_sidebar"
+    )
+    USE_ATTACHMENT_STORE = st.checkbox(
+        "Spool Attachments to Local Store",
+        value=True,
+        help="Keep uploaded files and ZIP members in a local content-addressed store on disk and upload from there."
+             " The same bundle uploaded again is found by its ZIP checksums without being unpacked or re-hashed.",
+        key="use_attachment_store_checkbox_sidebar"
+    )
+    ATTACHMENT_STORE_MAX_MB = st.number_input(
+        "Attachment Store Size (MB)",
+        min_value=100,
+        value=DEFAULT_ATTACHMENT_STORE_MAX_BYTES // (1024 * 1024),
+        step=100,
+        disabled=not USE_ATTACHMENT_STORE,
+        help="The least recently used files are removed once the store grows beyond this size.",
+        key="attachment_store_max_mb_input_sidebar"
+    )
+    MAX_LOG_RECORDS = st.number_input(
+        "Max Log Lines Kept",
+        min_value=100,
+        value=DEFAULT_MAX_LOG_RECORDS,
+        step=100,
+        help="Older log lines are dropped from the log panel once this many are kept.",
+        key="max_log_records_input_sidebar"
+    )
+    LOG_SPILL_PATH = st.text_input(
+        "Log File (optional)",
+        help="Also append every log line to this file (JSON lines), including lines dropped from the panel.",
+        key="log_spill_path_input_sidebar"
+    ).strip()
+    st.session_state.log_store.resize(MAX_LOG_RECORDS)
+    try:
+        st.session_state.log_store.set_spill_path(LOG_SPILL_PATH)
+    except OSError as e_log_file:
+        st.error(f"Cannot write log file: {e_log_file}")
 
     st.markdown("---")
 
@@ -92,16 +201,35 @@ with st.sidebar:
         st.caption("Type above to see processed output.")
 
 API_BASE_URL = f"{CONFLUENCE_URL.rstrip('/')}/rest/api" if CONFLUENCE_URL else None
-HEADERS_CONTENT = {
-    "Accept": "application/json",
-    "Content-Type": "application/json",
-    "Authorization": f"Bearer {CONFLUENCE_PAT}"
-}
-HEADERS_ATTACHMENT = {
-    "Accept": "application/json",
-    "X-Atlassian-Token": "nocheck",
-    "Authorization": f"Bearer {CONFLUENCE_PAT}"
-}
+HEADERS_CONTENT, HEADERS_ATTACHMENT = build_headers(CONFLUENCE_PAT)
+
+
+# --- Shared HTTP Session ---
+# One pooled keep-alive session per pool size, reused across Streamlit reruns so uploads skip the TCP+TLS handshake.
+@st.cache_resource
+def get_http_session(pool_size):
+    return create_http_session(pool_size)
+
+
+@st.cache_resource
+def get_image_optimizer_pool():
+    return ProcessPoolExecutor()
+
+
+@st.cache_resource
+def get_attachment_store():
+    return AttachmentStore()
+
+
+@st.cache_resource
+def get_publish_journal():
+    return PublishJournal()
+
+
+# Shared by all sessions, so publishes keep running when a browser tab reruns or disconnects.
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
 
 
 st.header("1. Page Content & Location")
@@ -115,8 +243,23 @@ with col1:
     )
 with col2:
     initial_parent_id_input = st.text_input(
-        "Parent Page ID (Optional)",
-        help="If provided, the new page will be created under this parent. You can Change it Later"
+        "Parent Page ID or Title (Optional)",
+        help="If provided, the new page will be created under this parent (a page ID, or the title of a page in"
+             " the space). You can Change it Later"
+    )
+
+col3, col4 = st.columns(2)
+with col3:
+    upsert_existing_page = st.checkbox(
+        "Update the page if it already exists",
+        help="Looks the page up by ID or by space and title. An existing page only gets a new version when its"
+             " content, title or parent actually changed."
+    )
+with col4:
+    existing_page_id_input = st.text_input(
+        "Existing Page ID (Optional)",
+        disabled=not upsert_existing_page,
+        help="Update this page instead of looking the page up by title."
     )
 
 storage_content_input = st.text_area(
@@ -126,6 +269,33 @@ storage_content_input = st.text_area(
 )
 storage_content = storage_content_input if storage_content_input.strip() else None
 
+col7, col8, col9 = st.columns(3)
+with col7:
+    split_large_documents = st.checkbox(
+        "Split large documents into child pages",
+        help="A document over either limit is published as an index page with one child page per top-level"
+             " section. Each attachment goes to the page that references it and the children publish in parallel."
+    )
+with col8:
+    split_max_mb = st.number_input(
+        "Max Size per Page (MB, 0 = no limit)",
+        min_value=0.0,
+        value=DEFAULT_SPLIT_MAX_BYTES / (1024 * 1024),
+        step=0.5,
+        disabled=not split_large_documents
+    )
+with col9:
+    split_max_images = int(st.number_input(
+        "Max Images per Page (0 = no limit)",
+        min_value=0,
+        value=DEFAULT_SPLIT_MAX_IMAGES,
+        step=10,
+        disabled=not split_large_documents
+    ))
+split_max_bytes = int(split_max_mb * 1024 * 1024) if split_large_documents else 0
+if not split_large_documents:
+    split_max_images = 0
+
 if not storage_content:
     st.info("Paste your Confluence storage format XML into the text area above to begin.")
 
@@ -135,14 +305,51 @@ uploaded_files_list = st.file_uploader(
     type=['zip', 'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'txt', 'svg'],
     accept_multiple_files=True
 )
+col5, col6 = st.columns(2)
+with col5:
+    optimize_images = st.checkbox(
+        "Optimize images before upload",
+        disabled=not IMAGE_OPTIMIZATION_AVAILABLE,
+        help="Recompresses PNGs losslessly, strips metadata and optionally downscales large images, using all CPU"
+             " cores. Results are cached, so republishing the same images is instant."
+             + ("" if IMAGE_OPTIMIZATION_AVAILABLE else " Requires Pillow (pip install pillow).")
+    )
+with col6:
+    max_image_dimension = int(st.number_input(
+        "Max Image Dimension (px, 0 = keep size)",
+        min_value=0,
+        value=0,
+        step=100,
+        disabled=not optimize_images,
+        help="Images wider or taller than this are scaled down before upload."
+    ))
+skip_unchanged_attachments = st.checkbox(
+    "Skip attachments already on the page",
+    value=True,
+    help="Compares size and SHA-256 with the page's existing attachments: identical files are skipped, changed"
+         " files are uploaded as a new version and only new files are uploaded."
+)
 
 referenced_attachments = []
+storage_analysis = None
 if storage_content:
     try:
-        referenced_attachments = re.findall(r'<ri:attachment[^>]*?ri:filename="([^"]+)"', storage_content)
-        #referenced_attachments = re.findall(r'<ri:attachment\s+ri:filename="([^"]+)"[^>]*?/>', storage_content)
-
-        referenced_attachments = list(set(referenced_attachments))
+        storage_analysis = analyze_storage(storage_content)
+        if storage_analysis["error"]:
+            st.error(f"{storage_analysis['error']}. Fix the XML before creating the page.")
+        referenced_attachments = storage_analysis["attachments"]
+        st.caption(
+            f"Content summary: {len(referenced_attachments)} attachment reference(s), "
+            f"{len(storage_analysis['images'])} image(s), {len(storage_analysis['page_links'])} page link(s), "
+            f"{sum(storage_analysis['macros'].values())} macro(s)"
+            + (f" ({', '.join(sorted(storage_analysis['macros']))})" if storage_analysis['macros'] else "") + "."
+        )
+        if (split_max_bytes or split_max_images) and not storage_analysis["error"]:
+            content_split = split_storage(storage_content, desired_page_title_from_input.strip()
+                                          or FALLBACK_PAGE_TITLE_BASE.strip(), max_bytes=split_max_bytes,
+                                          max_images=split_max_images)
+            st.caption(describe_split(content_split) if content_split else
+                       "The document is within the limits (or has no headings to split at) and stays one page.")
         if referenced_attachments:
             st.write("Attachments referenced in content (by `ri:filename`):", ", ".join(referenced_attachments))
             if uploaded_files_list:
@@ -156,334 +363,454 @@ if storage_content:
         st.error(f"Error parsing storage content for attachments: {e}")
 
 
-def create_confluence_page_storage_api(title, space_key, storage_format_data, parent_id, headers, api_base_url,
-                                       log_func):
-    api_url = f"{api_base_url}/content"
-    page_data = {
-        "type": "page", "title": title, "space": {"key": space_key},
-        "body": {"storage": {"value": storage_format_data, "representation": "storage"}},
-    }
-    if parent_id:
-        page_data["ancestors"] = [{"id": str(parent_id)}]
-        log_func(f"Attempting to create page '{title}' in space '{space_key}' under parent ID '{parent_id}'...")
-    else:
-        log_func(f"Attempting to create page '{title}' in space '{space_key}' (at space root)...")
-
-    try:
-        response = requests.post(api_url, headers=headers, json=page_data, timeout=30)
-        response.raise_for_status()
-        page_info = response.json()
-        page_id = page_info.get('id')
-        version_number = page_info.get('version', {}).get('number')
-        created_title = page_info.get('title')
-        web_ui_suffix = page_info.get('_links', {}).get('webui', '')
-        page_link_relative = web_ui_suffix if web_ui_suffix and web_ui_suffix.startswith(
-            '/') else f"/pages/viewpage.action?pageId={page_id}"
-        page_link_full = f"{CONFLUENCE_URL.rstrip('/')}{page_link_relative}"  # Uses CONFLUENCE_URL from sidebar
-        log_func(f"SUCCESS: Created page '{created_title}' (ID: {page_id}, Version: {version_number})")
-        return {"id": page_id, "link": page_link_full, "version": version_number, "title": created_title}
-    except requests.exceptions.HTTPError as e:
-        log_func(f"ERROR creating page: {e} (Status {e.response.status_code})")
-        try:
-            log_func(f"Response content: {e.response.text[:500]}...")
-        except Exception:
-            log_func("Could not decode error response content.")
-    except Exception as e:
-        log_func(f"Unexpected error in create_confluence_page_storage_api: {e}")
-    return None
-
-
-def upload_attachment_api(page_id, filename_on_confluence, file_bytes, headers, api_base_url, log_func):
-    api_url = f"{api_base_url}/content/{page_id}/child/attachment"
-    try:
-        files_for_requests = {'file': (filename_on_confluence, file_bytes, 'application/octet-stream')}
-        log_func(f"  Uploading as '{filename_on_confluence}' to page ID {page_id}...")
-        resp = requests.post(api_url, headers=headers, files=files_for_requests, timeout=60)
-        resp.raise_for_status()
-        log_func(f"  SUCCESS: Uploaded '{filename_on_confluence}'")
-        return True
-    except requests.exceptions.HTTPError as e:
-        log_func(f"  ERROR uploading '{filename_on_confluence}': {e} (Status {e.response.status_code})")
-        if e.response.status_code == 409:
-            log_func("  >>> Conflict: Attachment with this name might already exist on the page.")
-        elif e.response.status_code == 403:
-            log_func("  >>> Forbidden: Check PAT permissions for adding attachments.")
-        try:
-            log_func(f"  Response content: {e.response.text[:200]}...")
-        except Exception:
-            log_func("Could not decode error response content.")
-    except Exception as e:
-        log_func(f"  Unexpected error uploading '{filename_on_confluence}': {e}")
-    return False
-
-
-def move_confluence_page_api(page_id_to_move, current_page_title, space_key, new_parent_id, current_version, headers,
-                             api_base_url, log_func):
-    api_url = f"{api_base_url}/content/{page_id_to_move}"
-    next_version_number = current_version + 1
-    move_data = {
-        "id": page_id_to_move, "type": "page", "title": current_page_title,
-        "space": {"key": space_key}, "ancestors": [{"id": str(new_parent_id)}],
-        "version": {"number": next_version_number}
-    }
-    log_func(
-        f"Attempting to move page '{current_page_title}' (ID: {page_id_to_move}, Ver: {current_version}) under parent ID '{new_parent_id}'...")
-    try:
-        response = requests.put(api_url, headers=headers, json=move_data, timeout=30)
-        response.raise_for_status()
-        updated_page_info = response.json()
-        updated_version = updated_page_info.get('version', {}).get('number')
-        log_func(f"SUCCESS: Moved page. New Version: {updated_version}")
-        return True, updated_version
-    except requests.exceptions.HTTPError as e:
-        log_func(f"ERROR moving page: {e} (Status {e.response.status_code})")
-        try:
-            log_func(f"Response content: {e.response.text[:500]}...")
-        except Exception:
-            log_func("Could not decode error response content.")
-    except Exception as e:
-        log_func(f"Unexpected error in move_confluence_page_api: {e}")
-    return False, current_version
-
-
-def update_page_title_api(page_id_to_update, new_page_title, space_key, current_version, headers, api_base_url,
-                          log_func):
-    api_url = f"{api_base_url}/content/{page_id_to_update}"
-    next_version_number = current_version + 1
-    update_data = {
-        "id": page_id_to_update, "type": "page", "title": new_page_title,
-        "space": {"key": space_key}, "version": {"number": next_version_number}
-    }
-    log_func(
-        f"Attempting to update title of page ID '{page_id_to_update}' (Ver: {current_version}) to '{new_page_title}'...")
-    try:
-        response = requests.put(api_url, headers=headers, json=update_data, timeout=30)
-        response.raise_for_status()
-        updated_page_info = response.json()
-        confirmed_new_title = updated_page_info.get('title')
-        updated_version = updated_page_info.get('version', {}).get('number')
-        log_func(f"SUCCESS: Updated page title to '{confirmed_new_title}'. New Version: {updated_version}")
-        return True, updated_version, confirmed_new_title
-    except requests.exceptions.HTTPError as e:
-        log_func(f"ERROR updating page title: {e} (Status {e.response.status_code})")
-        if e.response and e.response.text:
-            error_detail = ""
-            try:
-                error_json = e.response.json()
-                error_detail = error_json.get('message', e.response.text[:500])
-            except requests.exceptions.JSONDecodeError:
-                error_detail = e.response.text[:500]
-            log_func(f"Response content: {error_detail}...")
-            if "title already exists" in error_detail.lower():
-                log_func("  >>> This often means the new title is already in use in this space.")
-        else:
-            log_func("Could not decode error response content or response was empty.")
-    except Exception as e:
-        log_func(f"Unexpected error in update_page_title_api: {e}")
-    return False, current_version, None
-
-
 st.header("3. Create Confluence Page")
+storage_is_malformed = bool(storage_analysis and storage_analysis["error"])
 if st.button("🚀 Create Page & Upload Attachments",
-             disabled=not storage_content or not CONFLUENCE_PAT or not API_BASE_URL):
+             disabled=not storage_content or storage_is_malformed or not CONFLUENCE_PAT or not API_BASE_URL):
     if not storage_content:
         st.error("Please provide storage format XML in Step 1.")
+    elif storage_is_malformed:
+        st.error("The storage format XML in Step 1 is malformed.")
     elif not CONFLUENCE_PAT:
         st.error("Please enter your Confluence PAT in the sidebar.")
     elif not API_BASE_URL:
         st.error("Confluence URL in sidebar is not valid or missing.")
     else:
-        st.session_state.logs = []
-        add_log("Initiating page creation process...")
-
-        user_specified_title_base = desired_page_title_from_input.strip()
-        if not user_specified_title_base: user_specified_title_base = FALLBACK_PAGE_TITLE_BASE.strip()
-
-        # current_time_str_suffix = datetime.now().strftime("%Y-%m-%d_%H%M%S")
-        title_for_initial_creation = user_specified_title_base
-
-        add_log(f"Desired final page title: '{user_specified_title_base}'")
-        add_log(f"Desired title for initial creation: '{title_for_initial_creation}'")
-        parent_id_to_use = initial_parent_id_input.strip() if initial_parent_id_input else None
-
-        creation_info = None
-        with st.spinner(f"Creating page '{title_for_initial_creation}' on Confluence..."):
-            creation_info = create_confluence_page_storage_api(
-                title_for_initial_creation, SPACE_KEY, storage_content, parent_id_to_use,
-                HEADERS_CONTENT, API_BASE_URL, log_func=add_log
-            )
-
-        if creation_info:
-            st.session_state.page_id = creation_info["id"]
-            st.session_state.current_page_version = creation_info["version"]
-            st.session_state.current_page_title = creation_info["title"]
-            st.session_state.page_link = creation_info["link"]
-
-            if user_specified_title_base and user_specified_title_base != st.session_state.current_page_title:
-                add_log(f"Attempting to update page title to the desired base: '{user_specified_title_base}'...")
-                with st.spinner(f"Updating title to '{user_specified_title_base}'..."):
-                    title_update_success, new_ver_rename, conf_title = update_page_title_api(
-                        st.session_state.page_id, user_specified_title_base, SPACE_KEY,
-                        st.session_state.current_page_version, HEADERS_CONTENT, API_BASE_URL, log_func=add_log
-                    )
-                if title_update_success:
-                    st.session_state.current_page_version = new_ver_rename
-                    st.session_state.current_page_title = conf_title
-                    add_log(f"SUCCESS: Page title updated to '{st.session_state.current_page_title}'.")
-                else:
-                    add_log(
-                        f"WARNING: Failed to update page title to '{user_specified_title_base}'. The page retains the title '{st.session_state.current_page_title}'. This might be due to the desired title already existing in the space.")
-                    st.warning(
-                        f"Could not update title to '{user_specified_title_base}'. Page remains '{st.session_state.current_page_title}'. (Desired title might already exist).")
-
-            if referenced_attachments and uploaded_files_list:
-                add_log(f"\nProcessing attachments for page ID: {st.session_state.page_id}...")
-                succ_uploads = 0;
-                fail_uploads = 0
-                available_attachments_data = {}
-
-                with st.spinner("Preparing attachments from uploads..."):
-                    for uploaded_file in uploaded_files_list:
-                        original_filename = uploaded_file.name
-                        try:
-                            file_content_bytes = uploaded_file.getvalue()
-                            if original_filename.lower().endswith('.zip'):
-                                add_log(f"  Processing ZIP file: '{original_filename}'")
-                                try:
-                                    with zipfile.ZipFile(io.BytesIO(file_content_bytes), 'r') as zip_ref:
-                                        for name_in_zip in zip_ref.namelist():
-                                            if name_in_zip.endswith('/'): continue
-                                            base_name_in_zip = os.path.basename(name_in_zip)
-                                            try:
-                                                bytes_in_zip = zip_ref.read(name_in_zip)
-                                                if base_name_in_zip in available_attachments_data:
-                                                    add_log(
-                                                        f"    WARNING: Attachment '{base_name_in_zip}' from '{original_filename}' (path: '{name_in_zip}') overrides a previously found file.")
-                                                available_attachments_data[base_name_in_zip] = (
-                                                bytes_in_zip, f"{original_filename}/{name_in_zip}")
-                                                add_log(
-                                                    f"    Found '{base_name_in_zip}' (from '{name_in_zip}') in ZIP.")
-                                            except Exception as e_zip_read:
-                                                add_log(
-                                                    f"    ERROR reading '{name_in_zip}' from ZIP '{original_filename}': {e_zip_read}")
-                                except zipfile.BadZipFile:
-                                    add_log(
-                                        f"  ERROR: Uploaded file '{original_filename}' is not a valid ZIP file or is corrupted.")
-                                except Exception as e_zip_proc:
-                                    add_log(f"  ERROR processing ZIP file '{original_filename}': {e_zip_proc}")
-                            else:
-                                base_uploaded_filename = os.path.basename(original_filename)
-                                if base_uploaded_filename in available_attachments_data:
-                                    add_log(
-                                        f"  WARNING: Directly uploaded file '{base_uploaded_filename}' overrides a previously found file.")
-                                available_attachments_data[base_uploaded_filename] = (
-                                file_content_bytes, original_filename)
-                                add_log(f"  Prepared directly uploaded file: '{base_uploaded_filename}'")
-                        except Exception as e_file_proc:
-                            add_log(f"  ERROR processing uploaded file '{original_filename}': {e_file_proc}")
-
-                if available_attachments_data and referenced_attachments:
-                    add_log("Attempting to upload referenced attachments...")
-                    with st.spinner("Uploading attachments..."):
-                        for ref_fn_in_content in referenced_attachments:
-                            filename_on_confluence = os.path.basename(ref_fn_in_content)
-                            if filename_on_confluence in available_attachments_data:
-                                file_bytes, source_description = available_attachments_data[filename_on_confluence]
-                                add_log(f"  Match found for '{filename_on_confluence}' (from '{source_description}').")
-                                try:
-                                    if upload_attachment_api(st.session_state.page_id, filename_on_confluence,
-                                                             file_bytes, HEADERS_ATTACHMENT, API_BASE_URL,
-                                                             log_func=add_log):
-                                        succ_uploads += 1
-                                    else:
-                                        fail_uploads += 1
-                                except Exception as e_upload_call:
-                                    add_log(
-                                        f"  ERROR during upload_attachment_api call for '{filename_on_confluence}': {e_upload_call}");
-                                    fail_uploads += 1
-                            else:
-                                add_log(
-                                    f"  SKIPPING: Referenced attachment '{filename_on_confluence}' (from content: '{ref_fn_in_content}') not found in uploads.")
-                                fail_uploads += 1
-                elif referenced_attachments:
-                    add_log("No attachable files were processed from uploads, but content references attachments.")
-
-                add_log(f"Attachment upload summary: {succ_uploads} succeeded, {fail_uploads} failed/skipped.")
-                if succ_uploads > 0: st.info(f"{succ_uploads} attachments uploaded successfully.")
-                if fail_uploads > 0: st.warning(
-                    f"{fail_uploads} attachments failed to upload or were skipped. Check logs.")
-
-            elif referenced_attachments:
-                add_log("Content references attachments, but no files were provided for upload in Step 2.")
-                st.warning("Your content references attachments, but you didn't upload any files in Step 2.")
-
-            st.success(
-                f"Page '{st.session_state.current_page_title}' (ID: {st.session_state.page_id}, Ver: {st.session_state.current_page_version}) processed!")
-            st.markdown(f"🔗 **View page:** [{st.session_state.current_page_title}]({st.session_state.page_link})")
-        else:
-            st.error("Page creation failed. Check logs below for details.")
-            st.session_state.page_id = None
+        job_queue = get_job_queue()
+        if not job_queue.active_jobs():
+            reset_request_stats()
+            reset_metrics()
+        user_specified_title_base = desired_page_title_from_input.strip() or FALLBACK_PAGE_TITLE_BASE.strip()
+        attachment_store = None
+        if USE_ATTACHMENT_STORE:
+            attachment_store = get_attachment_store()
+            attachment_store.max_bytes = int(ATTACHMENT_STORE_MAX_MB) * 1024 * 1024
+        # Each job reads the uploads through its own reader over the uploaded data (no copy), so jobs publishing
+        # the same files never interleave reads.
+        publish_files = [(uploaded_file.name, uploaded_file.size, BufferReader(upload_buffer(uploaded_file)))
+                         for uploaded_file in uploaded_files_list or []] if referenced_attachments else []
+        publish_job = job_queue.submit(
+            f"Publish '{user_specified_title_base}'", publish_page, SPACE_KEY, user_specified_title_base,
+            storage_content, HEADERS_CONTENT, HEADERS_ATTACHMENT, API_BASE_URL, CONFLUENCE_PAT,
+            parent_reference=initial_parent_id_input.strip() or None, upsert=upsert_existing_page,
+            existing_page_id=existing_page_id_input.strip() or None, attachment_files=publish_files,
+            upload_workers=UPLOAD_WORKERS, skip_unchanged_attachments=skip_unchanged_attachments,
+            optimize_images=optimize_images, max_image_dimension=max_image_dimension or None,
+            image_pool=get_image_optimizer_pool() if optimize_images else None, use_async_uploads=USE_ASYNC_UPLOADS,
+            async_concurrency=ASYNC_CONCURRENCY, requests_per_second=REQUESTS_PER_SECOND,
+            session=get_http_session(UPLOAD_WORKERS * DEFAULT_SPLIT_PAGE_WORKERS if split_max_bytes or split_max_images
+                                     else UPLOAD_WORKERS),
+            journal=get_publish_journal() if RESUME_INTERRUPTED_PUBLISHES else None, attachment_store=attachment_store,
+            split_max_bytes=split_max_bytes, split_max_images=split_max_images
+        )
+        st.session_state.publish_jobs.append({"job_id": publish_job.job_id, "log_position": 0, "applied": False})
+        add_log(f"Queued publish job {publish_job.job_id} for page '{user_specified_title_base}'.")
+
+
+def sync_publish_jobs():
+    # Copies new log lines of this session's jobs into the log store, tagged with the job's page rather than the
+    # current page, and makes the page of a job that just finished the current page. Returns True if a job
+    # finished since the last call.
+    job_finished = False
+    for tracked_job in st.session_state.publish_jobs:
+        publish_job = get_job_queue().get(tracked_job["job_id"])
+        if not publish_job:
+            continue
+        job_lines, tracked_job["log_position"] = publish_job.logs_since(tracked_job["log_position"])
+        for line in job_lines:
+            st.session_state.log_store.append(line, page_id=publish_job.page_id)
+        if publish_job.finished and not tracked_job["applied"]:
+            tracked_job["applied"] = True
+            job_finished = True
+            published_page = publish_job.result["page"] if publish_job.result else None
+            if published_page:
+                st.session_state.page_id = published_page["id"]
+                st.session_state.current_page_version = published_page["version"]
+                st.session_state.current_page_title = published_page["title"]
+                st.session_state.page_link = published_page["link"]
+    return job_finished
+
+
+def describe_job_progress(job_progress):
+    parts = [f"page {job_progress['pages_done']}/{job_progress['pages_total']}"]
+    if job_progress["attachments_total"]:
+        parts.append(f"attachments {job_progress['attachments_done']}/{job_progress['attachments_total']}")
+    if job_progress["bytes_total"]:
+        parts.append(f"{job_progress['bytes_sent'] / 1e6:.1f} of {job_progress['bytes_total'] / 1e6:.1f} MB")
+    parts.append(f"{job_progress['elapsed']:.0f}s")
+    if job_progress["eta"] is not None:
+        parts.append(f"ETA {job_progress['eta']:.0f}s")
+    return ", ".join(parts)
+
+
+# Redraws itself every second while one of this session's jobs is running; a finished job reruns the whole app
+# so the page it published shows up in section 4.
+@st.fragment(run_every=1.0 if any(not tracked_job["applied"] for tracked_job in st.session_state.publish_jobs)
+             else None)
+def show_publish_jobs():
+    job_finished = sync_publish_jobs()
+    for tracked_job in reversed(st.session_state.publish_jobs[-PUBLISH_JOBS_SHOWN:]):
+        publish_job = get_job_queue().get(tracked_job["job_id"])
+        if not publish_job:
+            continue
+        job_progress = publish_job.progress()
+        st.progress(job_progress["fraction"], text=f"{publish_job.description} ({publish_job.job_id}): "
+                                                   f"{publish_job.status}, {describe_job_progress(job_progress)}")
+        if not publish_job.finished:
+            continue
+        if publish_job.error:
+            st.error(publish_job.error)
+        for notice_level, notice in (publish_job.result or {}).get("notices", []):
+            (st.warning if notice_level == "warning" else st.info)(notice)
+        published_page = publish_job.result["page"] if publish_job.result else None
+        if published_page:
+            st.success(f"Page '{published_page['title']}' (ID: {published_page['id']}, "
+                       f"Ver: {published_page['version']}) processed!")
+            st.markdown(f"🔗 **View page:** [{published_page['title']}]({published_page['link']})")
+        child_pages = (publish_job.result or {}).get("children", [])
+        if child_pages:
+            st.markdown("\n".join(f"- [{child_page['title']}]({child_page['link']})" for child_page in child_pages))
+    if job_finished:
+        st.rerun()
+
+
+show_publish_jobs()
 
 if st.session_state.page_id:
     st.markdown("---")
     st.header(f"4. Manage Page: '{st.session_state.current_page_title}' (ID: {st.session_state.page_id})")
 
-    with st.expander("↪️ Move Page"):
-        new_parent_id_input_move = st.text_input("Enter Target Parent Page ID (for moving)",
-                                                 key="move_parent_id_input_main")
-        if st.button("Move Page", key="move_page_btn_main",
-                     disabled=not new_parent_id_input_move or not CONFLUENCE_PAT or not API_BASE_URL):
-            if not CONFLUENCE_PAT:
-                st.error("PAT missing in sidebar.")
-            elif not API_BASE_URL:
-                st.error("Confluence URL invalid/missing in sidebar.")
-            else:
-                with st.spinner(f"Moving page {st.session_state.page_id} under parent {new_parent_id_input_move}..."):
-                    success, new_version = move_confluence_page_api(
-                        st.session_state.page_id, st.session_state.current_page_title, SPACE_KEY,
-                        new_parent_id_input_move, st.session_state.current_page_version,
-                        HEADERS_CONTENT, API_BASE_URL, log_func=add_log
-                    )
-                if success:
-                    st.session_state.current_page_version = new_version
-                    st.success(f"Page moved successfully! New version: {new_version}.")
-                    add_log(f"SUCCESS: Page moved to be under parent {new_parent_id_input_move}.")
-                else:
-                    st.error("Page move failed. Check logs."); add_log("ERROR: Page move failed.")
-
-    with st.expander("✏️ Update Page Title"):
-        new_title_input_update = st.text_input("Enter New Title for the Page",
-                                               value=st.session_state.current_page_title, key="update_title_input_main")
-        if st.button("Update Title", key="update_title_btn_main",
-                     disabled=not new_title_input_update or new_title_input_update == st.session_state.current_page_title or not CONFLUENCE_PAT or not API_BASE_URL):
+    # Title and parent changes are sent together as one versioned PUT; a stale version is refetched and retried.
+    with st.expander("✏️ Rename / Move Page"):
+        col_edit_title, col_edit_parent = st.columns(2)
+        with col_edit_title:
+            new_title_input_update = st.text_input("New Title for the Page",
+                                                   value=st.session_state.current_page_title,
+                                                   key="update_title_input_main")
+        with col_edit_parent:
+            new_parent_id_input_move = st.text_input("Target Parent Page ID or Title (for moving)",
+                                                     key="move_parent_id_input_main")
+        title_edit_requested = bool(new_title_input_update) and \
+            new_title_input_update != st.session_state.current_page_title
+        if st.button("Apply Changes", key="apply_page_changes_btn_main",
+                     disabled=not (title_edit_requested or new_parent_id_input_move) or not CONFLUENCE_PAT
+                     or not API_BASE_URL):
             if not CONFLUENCE_PAT:
                 st.error("PAT missing in sidebar.")
             elif not API_BASE_URL:
                 st.error("Confluence URL invalid/missing in sidebar.")
             else:
-                with st.spinner(f"Updating title for page {st.session_state.page_id}..."):
-                    success, new_version, confirmed_title = update_page_title_api(
-                        st.session_state.page_id, new_title_input_update, SPACE_KEY,
-                        st.session_state.current_page_version, HEADERS_CONTENT, API_BASE_URL, log_func=add_log
-                    )
-                if success:
-                    st.session_state.current_page_version = new_version
-                    st.session_state.current_page_title = confirmed_title
-                    st.success(f"Page title updated to '{confirmed_title}'! New version: {new_version}.")
-                    add_log(f"SUCCESS: Page title updated to '{confirmed_title}'.")
-                    st.experimental_rerun()
+                resolved_parent_id_move = resolve_page_reference_api(
+                    new_parent_id_input_move, SPACE_KEY, HEADERS_CONTENT, API_BASE_URL, log_func=add_log
+                ) if new_parent_id_input_move else None
+                if new_parent_id_input_move and not resolved_parent_id_move:
+                    st.error(f"Could not find the parent page '{new_parent_id_input_move}' in space '{SPACE_KEY}'.")
+                elif title_edit_requested and check_title_available_api(
+                        SPACE_KEY, new_title_input_update, HEADERS_CONTENT, API_BASE_URL, log_func=add_log,
+                        page_id=st.session_state.page_id) is False:
+                    st.error(f"The title '{new_title_input_update}' is already used by another page in this space.")
                 else:
-                    st.error("Page title update failed. Check logs."); add_log("ERROR: Page title update failed.")
+                    with st.spinner(f"Updating page {st.session_state.page_id}..."):
+                        updated_page = apply_page_changes_api(
+                            st.session_state.page_id, SPACE_KEY, HEADERS_CONTENT, API_BASE_URL, log_func=add_log,
+                            title=new_title_input_update if title_edit_requested else None,
+                            parent_id=resolved_parent_id_move,
+                            current_page={"id": st.session_state.page_id,
+                                          "title": st.session_state.current_page_title,
+                                          "version": st.session_state.current_page_version, "parent_id": None}
+                        )
+                    if updated_page:
+                        st.session_state.current_page_version = updated_page["version"]
+                        st.session_state.current_page_title = updated_page["title"]
+                        st.success(f"Page updated! New version: {updated_page['version']}.")
+                        st.rerun()
+                    else:
+                        st.error("Page update failed. Check logs."); add_log("ERROR: Page update failed.")
 
     st.markdown(
         f"**Current Page Status:** Title: `{st.session_state.current_page_title}`, ID: `{st.session_state.page_id}`, Version: `{st.session_state.current_page_version}`")
     if st.session_state.page_link:
         st.markdown(f"🔗 **Link:** [{st.session_state.current_page_title}]({st.session_state.page_link})")
 
+st.markdown("---")
+st.header("🏷️ Apply Labels")
+# Labels from the Tags Collector (or typed here) go to the current page, a list of pages or a whole subtree;
+# pages are labelled in parallel and each gets only its missing labels in a single request.
+with st.expander("Add labels to one or many pages"):
+    # Unkeyed, so the field picks up a new Tags Collector output.
+    labels_input = st.text_input("Labels (spaces or commas between them)", value=st.session_state.tag_collector_output)
+    label_target_options = (["Current page"] if st.session_state.page_id else []) + \
+        ["Page IDs or titles", "Subtree of a page"]
+    label_target = st.radio("Apply to", label_target_options, horizontal=True, key="label_target_radio")
+    label_pages_input = ""
+    if label_target == "Page IDs or titles":
+        label_pages_input = st.text_area("Page IDs or titles (one per line, or comma-separated IDs)",
+                                         key="label_pages_input_main")
+    elif label_target == "Subtree of a page":
+        label_pages_input = st.text_input("Root page ID or title (the root is labelled too)",
+                                          key="label_subtree_root_input_main")
+    labels_to_apply = parse_label_list(labels_input)
+    if st.button("Apply Labels", key="apply_labels_btn_main",
+                 disabled=not labels_to_apply or not CONFLUENCE_PAT or not API_BASE_URL
+                 or (label_target != "Current page" and not label_pages_input.strip())):
+        if not get_job_queue().active_jobs():
+            reset_request_stats()
+        label_session = get_http_session(DEFAULT_LABEL_WORKERS)
+        label_page_ids = []
+        if label_target == "Current page":
+            label_page_ids = [st.session_state.page_id]
+        elif label_target == "Page IDs or titles":
+            references = []
+            for line in label_pages_input.splitlines():
+                parts = [part.strip() for part in line.split(",")]
+                # Titles may contain commas, so only a line of IDs is split on them.
+                references += parts if all(part.isdigit() for part in parts) else [line.strip()]
+            references = [reference for reference in references if reference]
+            resolved_ids = [resolve_page_reference_api(reference, SPACE_KEY, HEADERS_CONTENT, API_BASE_URL,
+                                                       log_func=add_log, session=label_session)
+                            for reference in references]
+            if not all(resolved_ids):
+                st.error("Some pages could not be found. Check logs.")
+            else:
+                label_page_ids = resolved_ids
+        else:
+            subtree_root_id = resolve_page_reference_api(label_pages_input, SPACE_KEY, HEADERS_CONTENT,
+                                                         API_BASE_URL, log_func=add_log, session=label_session)
+            with st.spinner("Collecting the pages of the subtree..."):
+                subtree_page_ids = collect_subtree_page_ids(
+                    subtree_root_id, HEADERS_CONTENT, API_BASE_URL, log_func=add_log, session=label_session
+                ) if subtree_root_id else None
+            if subtree_page_ids is None:
+                st.error(f"Could not list the subtree of '{label_pages_input}'. Check logs.")
+            else:
+                add_log(f"Found {len(subtree_page_ids)} page(s) in the subtree of '{label_pages_input}'.")
+                label_page_ids = subtree_page_ids
+        if label_page_ids:
+            with st.spinner(f"Labelling {len(label_page_ids)} page(s)..."):
+                label_summary = apply_labels_parallel(label_page_ids, labels_to_apply, HEADERS_CONTENT,
+                                                      API_BASE_URL, log_func=add_log, session=label_session)
+            add_log(describe_request_stats())
+            if label_summary["failed"]:
+                st.warning(f"{label_summary['failed']} page(s) could not be labelled. Check logs.")
+            st.success(f"{label_summary['labelled']} page(s) labelled, {label_summary['unchanged']} already had "
+                       f"the labels.")
+
+st.markdown("---")
+st.header("🗂️ Bulk Move Pages")
+# Versions are prefetched in batches and the moves run in parallel, each as one PUT retried on version conflicts.
+with st.expander("Move many pages to new parents"):
+    bulk_move_mode = st.radio("Move", ["Pages listed in a mapping", "All children of a page"], horizontal=True,
+                              key="bulk_move_mode_radio")
+    bulk_move_ready = False
+    if bulk_move_mode == "Pages listed in a mapping":
+        bulk_move_mapping_input = st.text_area(
+            "One 'page,new parent' per line (page IDs or titles; quote titles containing commas)",
+            key="bulk_move_mapping_input_main"
+        )
+        bulk_move_ready = bool(bulk_move_mapping_input.strip())
+    else:
+        col_move_source, col_move_target = st.columns(2)
+        with col_move_source:
+            bulk_move_source_input = st.text_input("Move the children of (page ID or title)",
+                                                   key="bulk_move_source_input_main")
+        with col_move_target:
+            bulk_move_target_input = st.text_input("Under the new parent (page ID or title)",
+                                                   key="bulk_move_target_input_main")
+        bulk_move_ready = bool(bulk_move_source_input.strip() and bulk_move_target_input.strip())
+    if st.button("Move Pages", key="bulk_move_btn_main",
+                 disabled=not bulk_move_ready or not CONFLUENCE_PAT or not API_BASE_URL):
+        if not get_job_queue().active_jobs():
+            reset_request_stats()
+        move_session = get_http_session(DEFAULT_MOVE_WORKERS)
+        planned_moves = None
+        with st.spinner("Resolving pages..."):
+            if bulk_move_mode == "Pages listed in a mapping":
+                move_mapping = parse_move_mapping(bulk_move_mapping_input, add_log)
+                planned_moves = resolve_moves(move_mapping, SPACE_KEY, HEADERS_CONTENT, API_BASE_URL,
+                                              log_func=add_log, session=move_session) \
+                    if move_mapping is not None else None
+            else:
+                move_source_id = resolve_page_reference_api(bulk_move_source_input, SPACE_KEY, HEADERS_CONTENT,
+                                                            API_BASE_URL, log_func=add_log, session=move_session)
+                move_target_id = resolve_page_reference_api(bulk_move_target_input, SPACE_KEY, HEADERS_CONTENT,
+                                                            API_BASE_URL, log_func=add_log, session=move_session)
+                planned_moves = plan_children_move(move_source_id, move_target_id, HEADERS_CONTENT, API_BASE_URL,
+                                                   log_func=add_log, session=move_session) \
+                    if move_source_id and move_target_id else None
+        if planned_moves is None:
+            st.error("Could not work out which pages to move. Check logs.")
+        elif not planned_moves:
+            st.info("There are no pages to move.")
+        else:
+            with st.spinner(f"Moving {len(planned_moves)} page(s)..."):
+                move_results = move_pages_parallel(planned_moves, SPACE_KEY, HEADERS_CONTENT, API_BASE_URL,
+                                                   log_func=add_log, session=move_session)
+            add_log(describe_request_stats())
+            failed_moves = sum(result["status"] == "failed" for result in move_results)
+            if failed_moves:
+                st.warning(f"{failed_moves} page(s) could not be moved. Check the results and logs.")
+            else:
+                st.success(f"All {len(move_results)} page(s) are under their new parents.")
+            st.dataframe(move_results)
+            for result in move_results:
+                if result["page_id"] == str(st.session_state.page_id) and result["status"] == "moved":
+                    st.session_state.current_page_version = result["version"]
+
+st.markdown("---")
+st.header("🧩 Bulk Pages from a Template")
+# One page per row of a CSV/JSON dataset. Rows are streamed and only a few pages are rendered at a time, so large
+# datasets publish without holding every page in memory.
+with st.expander("Generate pages from a template and a dataset"):
+    template_body_input = st.text_area(
+        "Storage Format XML template ($field or ${field} placeholders)",
+        height=200,
+        placeholder="<h1>${name}</h1><p>${description}</p><p><ri:attachment ri:filename=\"${sku}.png\" /></p>",
+        key="template_body_input_main"
+    )
+    col_template_title, col_template_attachments = st.columns(2)
+    with col_template_title:
+        template_title_input = st.text_input("Title template", placeholder="${name} Datasheet",
+                                             key="template_title_input_main")
+    with col_template_attachments:
+        template_attachments_input = st.text_input(
+            "Extra attachments template (Optional)",
+            placeholder="${sku}.pdf; ${sku}-drawing.png",
+            help="File names separated by ';' or ','. Files referenced by ri:filename in the body are attached"
+                 " anyway.",
+            key="template_attachments_input_main"
+        )
+    col_template_raw, col_template_upsert = st.columns(2)
+    with col_template_raw:
+        template_raw_fields_input = st.text_input(
+            "Raw fields (Optional)",
+            help="Fields inserted into the body as they are, e.g. ones holding storage XML. All other values are"
+                 " XML-escaped.",
+            key="template_raw_fields_input_main"
+        )
+    with col_template_upsert:
+        template_upsert = st.checkbox("Update pages that already exist", key="template_upsert_checkbox_main",
+                                      help="Pages are matched by space and title; unchanged pages are left alone.")
+    template_dataset_file = st.file_uploader("Dataset (.csv, .json or .jsonl)", type=list(DATASET_FORMATS),
+                                             key="template_dataset_uploader_main")
+    template_asset_files = st.file_uploader("Attachment files or ZIP(s) (Optional)", accept_multiple_files=True,
+                                            key="template_assets_uploader_main")
+    template_parent_input = st.text_input("Parent Page ID or Title for the generated pages (Optional)",
+                                          key="template_parent_input_main")
+
+    page_template = None
+    if template_body_input.strip() and template_title_input.strip():
+        page_template = compile_page_template(
+            template_body_input, template_title_input, template_attachments_input,
+            raw_fields=[field.strip() for field in template_raw_fields_input.split(",") if field.strip()]
+        )
+    if page_template and template_dataset_file:
+        try:
+            with open_uploaded_dataset(template_dataset_file) as dataset_text:
+                first_row = next(iter_dataset_rows(dataset_text, dataset_format(template_dataset_file.name)), None)
+            if first_row is None:
+                st.warning("The dataset has no rows.")
+            elif isinstance(first_row, InvalidDatasetRow):
+                st.error(f"The first row {first_row.message}")
+            else:
+                preview_page = render_page(page_template, first_row)
+                preview_analysis = analyze_storage(preview_page["body"])
+                st.write(f"Preview of the first row: **{preview_page['title']}**")
+                st.code(preview_page["body"], language="xml")
+                if preview_analysis["error"]:
+                    st.error(f"The first row renders malformed XML: {preview_analysis['error']}.")
+        except KeyError as e:
+            st.error(f"The first row has no field {e} used by the template.")
+        except ValueError as e:
+            st.error(f"Could not read the dataset or template: {e}")
+
+    if st.button("Publish Pages from Dataset", key="template_publish_btn_main",
+                 disabled=not page_template or not template_dataset_file or not CONFLUENCE_PAT or not API_BASE_URL):
+        if not get_job_queue().active_jobs():
+            reset_request_stats()
+        template_session = get_http_session(TEMPLATE_PAGE_WORKERS * UPLOAD_WORKERS)
+        template_parent_id = resolve_page_reference_api(template_parent_input, SPACE_KEY, HEADERS_CONTENT,
+                                                        API_BASE_URL, log_func=add_log, session=template_session)
+        if template_parent_input.strip() and not template_parent_id:
+            st.error(f"Parent page '{template_parent_input}' not found. Check logs.")
+        else:
+            template_store = None
+            if USE_ATTACHMENT_STORE:
+                template_store = get_attachment_store()
+                template_store.max_bytes = int(ATTACHMENT_STORE_MAX_MB) * 1024 * 1024
+            template_attachment_sources = {}
+            for asset_file in template_asset_files or []:
+                try:
+                    if asset_file.name.lower().endswith('.zip'):
+                        index_zip_attachments(asset_file, asset_file.name, template_attachment_sources, add_log,
+                                              store=template_store)
+                    else:
+                        # Rows sharing an asset upload it concurrently, so each open gets its own reader.
+                        open_func = functools.partial(BufferReader, upload_buffer(asset_file))
+                        if template_store:
+                            open_func = template_store.source(open_func)
+                        template_attachment_sources[os.path.basename(asset_file.name)] = (
+                            open_func, asset_file.name, asset_file.size)
+                except Exception as e_asset:
+                    add_log(f"  ERROR processing uploaded file '{asset_file.name}': {e_asset}")
+            template_results = []
+            template_progress = st.empty()
+
+            def _record_template_result(result):
+                template_results.append(result)
+                template_progress.text(f"{len(template_results)} row(s) published...")
+
+            with open_uploaded_dataset(template_dataset_file) as dataset_text:
+                template_summary = publish_template_rows(
+                    iter_dataset_rows(dataset_text, dataset_format(template_dataset_file.name)), page_template,
+                    SPACE_KEY, template_parent_id, HEADERS_CONTENT, HEADERS_ATTACHMENT, API_BASE_URL,
+                    log_func=add_log, page_workers=TEMPLATE_PAGE_WORKERS, upload_workers=UPLOAD_WORKERS,
+                    upsert=template_upsert, attachment_sources=template_attachment_sources, session=template_session,
+                    result_callback=_record_template_result
+                )
+            if template_store:
+                template_store.save_zip_index()
+            add_log(describe_request_stats())
+            if template_summary["dataset_error"]:
+                st.error(template_summary["dataset_error"])
+            if template_summary["pages_failed"] or template_summary["attachments_failed"]:
+                st.warning(f"{template_summary['pages_failed']} page(s) and {template_summary['attachments_failed']}"
+                           f" attachment(s) failed. Check the results and logs.")
+            else:
+                st.success(f"All {template_summary['rows']} row(s) published.")
+            st.dataframe(template_results)
+
 st.markdown("---")
 st.header("📜 Operation Logs")
+log_store = st.session_state.log_store
 with st.expander("View Logs", expanded=True):
-    if st.session_state.logs:
+    if len(log_store):
+        col_log_levels, col_log_page, col_log_clear = st.columns([3, 2, 1])
+        with col_log_levels:
+            level_counts = log_store.level_counts()
+            selected_levels = st.multiselect(
+                "Levels", LOG_LEVELS, default=list(LOG_LEVELS), key="log_level_filter",
+                format_func=lambda level: f"{level} ({level_counts[level]})"
+            )
+        with col_log_page:
+            selected_log_page_id = st.selectbox(
+                "Page", [None] + log_store.page_ids(), key="log_page_filter",
+                format_func=lambda page_id: "All pages" if page_id is None else f"Page ID {page_id}"
+            )
+        with col_log_clear:
+            st.write("")
+            if st.button("Clear Logs", key="clear_logs_btn"):
+                log_store.clear()
+                st.rerun()
+
+        _, matching_log_count = log_store.query(selected_levels, selected_log_page_id, limit=0)
+        log_page_count = max(1, -(-matching_log_count // LOG_LINES_PER_PAGE))
+        log_page_number = int(st.number_input(
+            f"Log page (1-{log_page_count}, newest first)", min_value=1, max_value=log_page_count, value=1,
+            key="log_page_number"
+        )) if log_page_count > 1 else 1
+        log_records, _ = log_store.query(selected_levels, selected_log_page_id,
+                                         offset=(log_page_number - 1) * LOG_LINES_PER_PAGE, limit=LOG_LINES_PER_PAGE)
+
         st.markdown("""
             <style>
             .log-container {
@@ -499,12 +826,32 @@ with st.expander("View Logs", expanded=True):
             </style>
         """, unsafe_allow_html=True)
 
-        logs_html_content = "<div class='log-container'>"
-        for log_entry in reversed(st.session_state.logs):
-            safe_log_entry = log_entry.replace("&", "&").replace("<", "<").replace(">", ">")
-            logs_html_content += f"{safe_log_entry}<br>"
-        logs_html_content += "</div>"
-
+        logs_html_content = "<div class='log-container'>" + "".join(
+            f"{html.escape(format_log_record(record))}<br>" for record in log_records) + "</div>"
         st.markdown(logs_html_content, unsafe_allow_html=True)
+        st.caption(f"Showing {len(log_records)} of {matching_log_count} matching line(s); {len(log_store)} kept"
+                   + (f", {log_store.dropped} older line(s) dropped" if log_store.dropped else "") + ".")
+        st.download_button("Download Kept Logs", "\n".join(log_store.messages()), file_name="publish_logs.txt",
+                           mime="text/plain")
     else:
         st.caption("No operations performed yet in this session.")
+
+if metrics_summary()["calls"]:
+    with st.expander("📊 API Metrics"):
+        run_metrics = metrics_summary()
+        st.caption(f"{run_metrics['calls']} API call(s) in {run_metrics['wall_seconds']:.1f}s, "
+                   f"{run_metrics['errors']} error(s), {run_metrics['retries']} retried, "
+                   f"{run_metrics['mb_sent_per_second']:.2f} MB/s sent.")
+        st.table([
+            {"Operation": operation, "Calls": stats["calls"], "Errors": stats["errors"],
+             "Retries": stats["retries"], "p50 (ms)": round(stats["p50_seconds"] * 1000),
+             "p95 (ms)": round(stats["p95_seconds"] * 1000), "MB Sent": round(stats["bytes_sent"] / 1e6, 2)}
+            for operation, stats in run_metrics["operations"].items()
+        ])
+        col_metrics_json, col_metrics_prometheus = st.columns(2)
+        with col_metrics_json:
+            st.download_button("Download Metrics (JSON)", export_metrics_json(), file_name="publish_metrics.json",
+                               mime="application/json")
+        with col_metrics_prometheus:
+            st.download_button("Download Metrics (Prometheus)", export_metrics_prometheus(),
+                               file_name="publish_metrics.prom", mime="text/plain")
@@ -0,0 +1,137 @@
+import io
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it images are uploaded as-is.
+    Image = None
+
+# Optional stage between attachment preparation and upload: PNGs are recompressed losslessly, images larger
+# than max_dimension are downscaled, and metadata (EXIF, text chunks) is dropped. The work
+# runs in a process pool, and results are cached on disk by content hash + options, so republishing the
+# same screenshots costs one hash per file and no re-encoding.
+
+IMAGE_OPTIMIZATION_AVAILABLE = Image is not None
+OPTIMIZABLE_EXTENSIONS = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG"}
+OPTIMIZED_IMAGE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".confluence_publisher", "optimized_images")
+KEEP_ORIGINAL_SUFFIX = ".original"
+EXIF_ORIENTATION_TAG = 0x0112
+# Bumped when the output for the same input changes, so stale cached results are not reused.
+CACHE_FORMAT_VERSION = 2
+
+
+def is_optimizable_image(filename):
+    return os.path.splitext(filename)[1].lower() in OPTIMIZABLE_EXTENSIONS
+
+
+def _cache_paths(content_hash, filename, max_dimension, cache_dir):
+    options_key = f"max{max_dimension}" if max_dimension else "full"
+    base_path = os.path.join(cache_dir, content_hash[:2], f"{content_hash}-v{CACHE_FORMAT_VERSION}-{options_key}")
+    return base_path + os.path.splitext(filename)[1].lower(), base_path + KEEP_ORIGINAL_SUFFIX
+
+
+def optimize_image_bytes(image_bytes, image_format, max_dimension, output_path, keep_original_path):
+    # Runs in a worker process. Writes the optimized image to output_path, or a marker at keep_original_path
+    # when re-encoding would not make the file smaller. Returns the size of the file to upload.
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.load()
+        # Metadata is dropped below, so the EXIF orientation is applied to the pixels first.
+        rotated = image.getexif().get(EXIF_ORIENTATION_TAG, 1) != 1
+        if rotated:
+            image = ImageOps.exif_transpose(image)
+        resized = False
+        if max_dimension and max(image.size) > max_dimension:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            resized = True
+        output = io.BytesIO()
+        # The colour profile is the only metadata kept, since dropping it changes how colours render.
+        save_options = {"optimize": True}
+        if image.info.get("icc_profile"):
+            save_options["icc_profile"] = image.info["icc_profile"]
+        if image_format == "PNG":
+            image.save(output, format="PNG", **save_options)
+        elif resized or rotated:
+            image.save(output, format="JPEG", quality=90, progressive=True, **save_options)
+        else:
+            # quality="keep" reuses the source quantization tables: strips metadata without recompression loss.
+            image.save(output, format="JPEG", quality="keep", progressive=True, **save_options)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if output.tell() >= len(image_bytes):
+        open(keep_original_path, 'wb').close()
+        return len(image_bytes)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(output.getbuffer())
+    os.replace(tmp_path, output_path)
+    return output.tell()
+
+
+def optimize_upload_jobs(upload_jobs, log_func, max_dimension=None, executor=None, max_workers=None,
+                         cache_dir=OPTIMIZED_IMAGE_CACHE_DIR):
+    # Takes and returns upload jobs as used by confluence_api.upload_attachments_parallel:
+    # (filename_on_confluence, file_source, file_size). Image jobs are replaced by the optimized file from the
+    # cache when that is smaller; everything else is passed through unchanged.
+    if not IMAGE_OPTIMIZATION_AVAILABLE:
+        log_func("  WARNING: Pillow is not installed, skipping image optimization.")
+        return upload_jobs
+    from confluence_api import open_file_source, file_path_source
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    # Image bytes travel to the workers with each submitted call, so bound how many are queued at once.
+    max_in_flight = 2 * (max_workers or os.cpu_count() or 1)
+    in_flight = set()
+    cached_results = {}
+    cache_hits = 0
+    try:
+        for index, (filename_on_confluence, file_source, file_size) in enumerate(upload_jobs):
+            if not is_optimizable_image(filename_on_confluence):
+                continue
+            with open_file_source(file_source) as file_obj:
+                image_bytes = file_obj.read()
+            content_hash = hashlib.sha256(image_bytes).hexdigest()
+            output_path, keep_original_path = _cache_paths(content_hash, filename_on_confluence, max_dimension,
+                                                           cache_dir)
+            future = None
+            if os.path.exists(output_path) or os.path.exists(keep_original_path):
+                cache_hits += 1
+            else:
+                if len(in_flight) >= max_in_flight:
+                    _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                image_format = OPTIMIZABLE_EXTENSIONS[os.path.splitext(filename_on_confluence)[1].lower()]
+                future = executor.submit(optimize_image_bytes, image_bytes, image_format, max_dimension,
+                                         output_path, keep_original_path)
+                in_flight.add(future)
+            cached_results[index] = (output_path, len(image_bytes), future)
+            del image_bytes
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+
+    optimized_jobs = list(upload_jobs)
+    original_bytes_total = 0
+    optimized_bytes_total = 0
+    for index, (output_path, original_size, future) in cached_results.items():
+        filename_on_confluence = upload_jobs[index][0]
+        original_bytes_total += original_size
+        if future is not None:
+            try:
+                future.result()
+            except Exception as e_optimize:
+                log_func(f"  WARNING: Could not optimize '{filename_on_confluence}', uploading original: "
+                         f"{e_optimize}")
+                optimized_bytes_total += original_size
+                continue
+        if os.path.exists(output_path):
+            optimized_size = os.path.getsize(output_path)
+            optimized_jobs[index] = (filename_on_confluence, file_path_source(output_path), optimized_size)
+            optimized_bytes_total += optimized_size
+        else:
+            optimized_bytes_total += original_size
+    if cached_results:
+        log_func(f"  Optimized {len(cached_results)} image(s) ({cache_hits} from cache): "
+                 f"{original_bytes_total / 1e6:.1f} MB -> {optimized_bytes_total / 1e6:.1f} MB.")
+    return optimized_jobs
@@ -0,0 +1,136 @@
+import time
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Background jobs for the UI: long publishes run on a small thread pool instead of inside the Streamlit script,
+# so the page stays responsive, a refresh or widget change does not abort them and several can run side by side.
+# A job collects its own log lines and progress counters (pages, attachments, bytes) under a lock; the script
+# polls them on each rerun and copies new log lines into the session's log store.
+
+DEFAULT_JOB_WORKERS = 4
+DEFAULT_MAX_FINISHED_JOBS = 200
+MAX_JOB_LOG_LINES = 5000
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class Job:
+    def __init__(self, description):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.description = description
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        # The ID of the page the job publishes, once known; the UI tags the job's log lines with it.
+        self.page_id = None
+        self._lock = threading.Lock()
+        self._logs = deque(maxlen=MAX_JOB_LOG_LINES)
+        self._logged_lines = 0
+        self._counts = {"pages_total": 0, "pages_done": 0, "attachments_total": 0, "attachments_done": 0,
+                        "bytes_total": 0, "bytes_sent": 0}
+        self._bytes_per_file = {}
+
+    # --- Called from the job ---
+    def log(self, message):
+        # Usable as log_func; safe to call from the job's worker threads.
+        with self._lock:
+            self._logs.append(message)
+            self._logged_lines += 1
+
+    def fail(self, message):
+        self.error = message
+        self.log(f"ERROR: {message}")
+
+    def set_totals(self, **totals):
+        with self._lock:
+            self._counts.update(totals)
+
+    def advance(self, **increments):
+        with self._lock:
+            for count_name, increment in increments.items():
+                self._counts[count_name] += increment
+
+    def record_bytes(self, filename, bytes_sent, total_bytes=None):
+        # A progress_callback for upload_attachments_parallel / upload_attachments_async.
+        with self._lock:
+            self._counts["bytes_sent"] += bytes_sent - self._bytes_per_file.get(filename, 0)
+            self._bytes_per_file[filename] = bytes_sent
+
+    # --- Called from the UI ---
+    def logs_since(self, position):
+        # Returns (lines logged after position, new position). Lines beyond MAX_JOB_LOG_LINES are dropped.
+        with self._lock:
+            first_kept = self._logged_lines - len(self._logs)
+            lines = list(self._logs)[max(position, first_kept) - first_kept:]
+            return lines, self._logged_lines
+
+    def progress(self):
+        with self._lock:
+            progress = dict(self._counts)
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        progress.update(status=self.status, elapsed=elapsed, eta=None, fraction=0.0)
+        if progress["bytes_total"]:
+            done, total = progress["bytes_sent"], progress["bytes_total"]
+        else:
+            done = progress["pages_done"] + progress["attachments_done"]
+            total = progress["pages_total"] + progress["attachments_total"]
+        if total:
+            progress["fraction"] = min(1.0, done / total)
+            if self.status == JOB_RUNNING and 0 < done < total:
+                progress["eta"] = elapsed * (total - done) / done
+        if self.status in (JOB_SUCCEEDED, JOB_FAILED):
+            progress["fraction"] = 1.0
+        return progress
+
+    @property
+    def finished(self):
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+
+class JobQueue:
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS, max_finished_jobs=DEFAULT_MAX_FINISHED_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="publish-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self.max_finished_jobs = max_finished_jobs
+
+    def submit(self, description, func, *args, **kwargs):
+        # Runs func(job, *args, **kwargs) in the background and returns the job at once. The return value becomes
+        # job.result; the job fails if func raises or calls job.fail().
+        job = Job(description)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._forget_finished_jobs()
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        job.started_at = time.time()
+        job.status = JOB_RUNNING
+        try:
+            job.result = func(job, *args, **kwargs)
+        except Exception as e:
+            job.fail(f"Unexpected error in job '{job.description}': {e}")
+        job.finished_at = time.time()
+        job.status = JOB_FAILED if job.error else JOB_SUCCEEDED
+
+    def _forget_finished_jobs(self):
+        finished_jobs = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.finished_at)
+        for job in finished_jobs[:max(0, len(finished_jobs) - self.max_finished_jobs)]:
+            del self._jobs[job.job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_jobs(self):
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.finished]
@@ -0,0 +1,119 @@
+import json
+import threading
+import itertools
+from collections import deque, Counter
+from datetime import datetime
+
+# Bounded store for operation logs. Records are kept in a ring buffer of at most max_records entries, so
+# memory and the cost of rendering a rerun stay constant however much a publish logs; older records can
+# optionally be kept in full in a JSON-lines spill file. Queries filter by level and page and return one
+# page of results, newest first.
+
+DEFAULT_MAX_LOG_RECORDS = 2000
+LOG_LEVELS = ("INFO", "SUCCESS", "WARNING", "ERROR")
+_LEVEL_PREFIXES = (("ERROR", "ERROR"), ("CONNECTION ERROR", "ERROR"), ("FAILED", "ERROR"),
+                   ("UNEXPECTED ERROR", "ERROR"), ("WARNING", "WARNING"), ("SUCCESS", "SUCCESS"))
+
+
+def infer_log_level(message):
+    # The publisher's messages start with "SUCCESS:", "WARNING:", "ERROR ..." etc.; everything else is INFO.
+    upper_message = message.lstrip().upper()
+    for prefix, level in _LEVEL_PREFIXES:
+        if upper_message.startswith(prefix):
+            return level
+    return "INFO"
+
+
+def format_log_record(record):
+    return f"[{record['timestamp']}] {record['message']}"
+
+
+class LogStore:
+    def __init__(self, max_records=DEFAULT_MAX_LOG_RECORDS, spill_path=None):
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=max(1, int(max_records)))
+        self._sequence = itertools.count(1)
+        self._level_counts = Counter()
+        self._spill_path = None
+        self._spill_file = None
+        self.dropped = 0
+        self.set_spill_path(spill_path)
+
+    @property
+    def max_records(self):
+        return self._records.maxlen
+
+    def resize(self, max_records):
+        with self._lock:
+            max_records = max(1, int(max_records))
+            if max_records != self._records.maxlen:
+                kept = list(self._records)[-max_records:]
+                self._count_dropped(self._records, kept)
+                self._records = deque(kept, maxlen=max_records)
+
+    def set_spill_path(self, spill_path):
+        with self._lock:
+            if spill_path == self._spill_path:
+                return
+            if self._spill_file:
+                self._spill_file.close()
+            self._spill_path = spill_path or None
+            # Line buffered, so the spill file is complete even if the app is stopped mid-run.
+            self._spill_file = open(spill_path, 'a', encoding='utf-8', buffering=1) if spill_path else None
+
+    def _count_dropped(self, old_records, kept_records):
+        kept_sequences = {record["seq"] for record in kept_records}
+        for record in old_records:
+            if record["seq"] not in kept_sequences:
+                self.dropped += 1
+                self._level_counts[record["level"]] -= 1
+
+    def append(self, message, level=None, page_id=None):
+        record = {
+            "seq": 0, "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "level": level or infer_log_level(message), "page_id": page_id, "message": message,
+        }
+        with self._lock:
+            record["seq"] = next(self._sequence)
+            if len(self._records) == self._records.maxlen:
+                evicted = self._records[0]
+                self._level_counts[evicted["level"]] -= 1
+                self.dropped += 1
+            self._records.append(record)
+            self._level_counts[record["level"]] += 1
+            if self._spill_file:
+                self._spill_file.write(json.dumps(record) + "\n")
+        return record
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._level_counts.clear()
+            self.dropped = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def level_counts(self):
+        with self._lock:
+            return {level: self._level_counts[level] for level in LOG_LEVELS}
+
+    def page_ids(self):
+        with self._lock:
+            return list(dict.fromkeys(record["page_id"] for record in self._records if record["page_id"]))
+
+    def messages(self):
+        with self._lock:
+            return [format_log_record(record) for record in self._records]
+
+    def query(self, levels=None, page_id=None, offset=0, limit=100):
+        # Returns (records, total_matching): at most limit matching records, newest first, after skipping offset.
+        # levels=None matches every level; an empty collection matches none.
+        with self._lock:
+            records = list(self._records)
+        matching = [record for record in reversed(records)
+                    if (levels is None or record["level"] in levels) and (not page_id or record["page_id"] == page_id)]
+        return matching[offset:offset + limit], len(matching)
+
+    def close(self):
+        self.set_spill_path(None)
@@ -0,0 +1,169 @@
+import json
+import time
+import random
+import threading
+from collections import deque
+
+# Structured timing for Confluence API calls. request_layer.send_request records one span per logical call
+# (retries included): operation, page ID, bytes sent, final HTTP status, duration and retry count. The
+# spans of a run are summarized per operation (p50/p95 latency, throughput) and can be exported as JSON or
+# in the Prometheus text exposition format. Latency quantiles come from a fixed-size uniform sample of each
+# operation's durations (reservoir sampling), so memory stays bounded however many calls a process makes.
+
+MAX_KEPT_SPANS = 10000
+MAX_DURATION_SAMPLES = 4096
+SUMMARY_QUANTILES = (("0.5", "p50_seconds"), ("0.95", "p95_seconds"))
+PROMETHEUS_PREFIX = "confluence_publisher_api"
+
+
+def quantile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+class ApiMetrics:
+    def __init__(self, max_kept_spans=MAX_KEPT_SPANS, max_duration_samples=MAX_DURATION_SAMPLES):
+        self._lock = threading.Lock()
+        self._max_kept_spans = max_kept_spans
+        self._max_duration_samples = max_duration_samples
+        self._random = random.Random()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # Individual spans are only kept up to max_kept_spans; per-operation aggregates cover every call.
+            self._spans = deque(maxlen=self._max_kept_spans)
+            self._operations = {}
+            self._first_started = None
+            self._last_finished = None
+
+    def record(self, operation, method, page_id, status, duration_seconds, retries, bytes_sent, error=None):
+        finished = time.time()
+        span = {"operation": operation, "method": method, "page_id": page_id, "status": status,
+                "duration_seconds": round(duration_seconds, 6), "retries": retries, "bytes_sent": bytes_sent,
+                "started_at": round(finished - duration_seconds, 6), "error": error}
+        with self._lock:
+            self._spans.append(span)
+            stats = self._operations.setdefault(operation, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+                                                            "duration_samples": [], "statuses": {}, "retries": 0,
+                                                            "bytes_sent": 0, "errors": 0})
+            stats["calls"] += 1
+            stats["total_seconds"] += duration_seconds
+            stats["max_seconds"] = max(stats["max_seconds"], duration_seconds)
+            if len(stats["duration_samples"]) < self._max_duration_samples:
+                stats["duration_samples"].append(duration_seconds)
+            else:
+                sample_index = self._random.randrange(stats["calls"])
+                if sample_index < self._max_duration_samples:
+                    stats["duration_samples"][sample_index] = duration_seconds
+            status_key = str(status) if status is not None else "error"
+            stats["statuses"][status_key] = stats["statuses"].get(status_key, 0) + 1
+            stats["retries"] += retries
+            stats["bytes_sent"] += bytes_sent
+            if error or status is None or status >= 400:
+                stats["errors"] += 1
+            started = finished - duration_seconds
+            self._first_started = started if self._first_started is None else min(self._first_started, started)
+            self._last_finished = finished if self._last_finished is None else max(self._last_finished, finished)
+
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def summary(self):
+        with self._lock:
+            operations = {}
+            for operation, stats in sorted(self._operations.items()):
+                durations = sorted(stats["duration_samples"])
+                operations[operation] = {
+                    "calls": stats["calls"], "errors": stats["errors"], "retries": stats["retries"],
+                    "bytes_sent": stats["bytes_sent"], "statuses": dict(stats["statuses"]),
+                    "total_seconds": round(stats["total_seconds"], 6),
+                    "p50_seconds": round(quantile(durations, 0.5), 6),
+                    "p95_seconds": round(quantile(durations, 0.95), 6),
+                    "max_seconds": round(stats["max_seconds"], 6),
+                }
+            wall_seconds = (self._last_finished - self._first_started) if self._operations else 0.0
+        calls = sum(stats["calls"] for stats in operations.values())
+        bytes_sent = sum(stats["bytes_sent"] for stats in operations.values())
+        return {
+            "calls": calls,
+            "errors": sum(stats["errors"] for stats in operations.values()),
+            "retries": sum(stats["retries"] for stats in operations.values()),
+            "bytes_sent": bytes_sent,
+            "wall_seconds": round(wall_seconds, 6),
+            "calls_per_second": round(calls / wall_seconds, 3) if wall_seconds else 0.0,
+            "mb_sent_per_second": round(bytes_sent / 1e6 / wall_seconds, 3) if wall_seconds else 0.0,
+            "operations": operations,
+        }
+
+    def to_json(self, include_spans=True):
+        report = {"summary": self.summary()}
+        if include_spans:
+            report["spans"] = self.spans()
+        return json.dumps(report, indent=2)
+
+    def to_prometheus(self):
+        summary = self.summary()
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_requests_total Confluence API calls by operation and final HTTP status.",
+            f"# TYPE {PROMETHEUS_PREFIX}_requests_total counter",
+        ]
+        for operation, stats in summary["operations"].items():
+            for status, count in sorted(stats["statuses"].items()):
+                lines.append(f'{PROMETHEUS_PREFIX}_requests_total{{operation="{operation}",status="{status}"}} '
+                             f'{count}')
+        lines += [
+            f"# HELP {PROMETHEUS_PREFIX}_request_duration_seconds Duration of Confluence API calls, retries included.",
+            f"# TYPE {PROMETHEUS_PREFIX}_request_duration_seconds summary",
+        ]
+        for operation, stats in summary["operations"].items():
+            for fraction, key in SUMMARY_QUANTILES:
+                lines.append(f'{PROMETHEUS_PREFIX}_request_duration_seconds{{operation="{operation}",'
+                             f'quantile="{fraction}"}} {stats[key]}')
+            lines.append(f'{PROMETHEUS_PREFIX}_request_duration_seconds_sum{{operation="{operation}"}} '
+                         f'{stats["total_seconds"]}')
+            lines.append(f'{PROMETHEUS_PREFIX}_request_duration_seconds_count{{operation="{operation}"}} '
+                         f'{stats["calls"]}')
+        for name, key, help_text in (("retries_total", "retries", "Retries of Confluence API calls."),
+                                     ("bytes_sent_total", "bytes_sent", "Request body bytes sent to Confluence.")):
+            lines += [f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}", f"# TYPE {PROMETHEUS_PREFIX}_{name} counter"]
+            for operation, stats in summary["operations"].items():
+                lines.append(f'{PROMETHEUS_PREFIX}_{name}{{operation="{operation}"}} {stats[key]}')
+        return "\n".join(lines) + "\n"
+
+
+API_METRICS = ApiMetrics()
+
+
+def record_span(operation, method, page_id, status, duration_seconds, retries, bytes_sent, error=None):
+    API_METRICS.record(operation, method, page_id, status, duration_seconds, retries, bytes_sent, error)
+
+
+def reset_metrics():
+    API_METRICS.reset()
+
+
+def metrics_summary():
+    return API_METRICS.summary()
+
+
+def export_metrics_json(include_spans=True):
+    return API_METRICS.to_json(include_spans)
+
+
+def export_metrics_prometheus():
+    return API_METRICS.to_prometheus()
+
+
+def describe_metrics_summary():
+    summary = metrics_summary()
+    lines = [f"API timing: {summary['calls']} call(s) in {summary['wall_seconds']:.1f}s "
+             f"({summary['calls_per_second']:.1f} calls/s, {summary['mb_sent_per_second']:.2f} MB/s sent), "
+             f"{summary['errors']} error(s), {summary['retries']} retried."]
+    for operation, stats in summary["operations"].items():
+        lines.append(f"  {operation}: {stats['calls']} call(s), p50 {stats['p50_seconds'] * 1000:.0f} ms, "
+                     f"p95 {stats['p95_seconds'] * 1000:.0f} ms, max {stats['max_seconds'] * 1000:.0f} ms, "
+                     f"{stats['bytes_sent'] / 1e6:.2f} MB sent, {stats['errors']} error(s).")
+    return "\n".join(lines)
@@ -0,0 +1,504 @@
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, quote, unquote
+
+# In-memory stand-in for the Confluence REST endpoints this tool uses, for local development and benchmarks.
+# Latency, throttling (429 + Retry-After once a request rate is exceeded) and random failures can be injected.
+#
+#   python mock_confluence.py --port 8090 --latency-ms 50 --throttle-rps 20 --failure-rate 0.01
+#
+# Supported: GET /rest/api/user/current, POST/GET /rest/api/content, GET /rest/api/content/search (CQL with
+# id, ancestor, parent, space, type and title clauses joined by AND), GET/PUT /rest/api/content/{id},
+# GET /rest/api/content/{id}/child/page, GET/POST /rest/api/content/{id}/child/attachment,
+# POST .../child/attachment/{attachment id}/data, GET/POST /rest/api/content/{id}/label and
+# GET /download/attachments/{page id}/{filename}.
+
+DEFAULT_PAGE_LIMIT = 25
+
+
+class MockConfluenceState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(100000)
+        self.pages = {}
+        self.attachments = {}
+        self.request_log = []
+
+    def next_id(self):
+        return str(next(self.ids))
+
+
+def _page_json(page, expand, base_url):
+    page_json = {
+        "id": page["id"], "type": "page", "status": "current", "title": page["title"],
+        "space": {"key": page["space"]},
+        "version": {"number": page["version"], "when": page["when"]},
+        "_links": {"webui": f"/pages/viewpage.action?pageId={page['id']}",
+                   "self": f"{base_url}/rest/api/content/{page['id']}"},
+    }
+    if "body.storage" in expand:
+        page_json["body"] = {"storage": {"value": page["body"], "representation": "storage"}}
+    if "ancestors" in expand:
+        page_json["ancestors"] = [{"id": ancestor_id} for ancestor_id in page["ancestors"]]
+    return page_json
+
+
+def _cql_matcher(cql):
+    # Returns a predicate over mock pages for the small CQL subset the tools send, or None if unsupported.
+    clauses = []
+    for clause in re.split(r"\s+and\s+", cql.strip(), flags=re.IGNORECASE):
+        match = re.fullmatch(r"(\w+)\s*(=|in)\s*(.+)", clause.strip(), re.IGNORECASE)
+        if not match or match.group(1).lower() not in ("id", "ancestor", "parent", "space", "type", "title"):
+            return None
+        values = {value.strip().strip('"') for value in match.group(3).strip().strip("()").split(",")}
+        clauses.append((match.group(1).lower(), values))
+
+    def _matches(page):
+        fields = {"id": [page["id"]], "ancestor": page["ancestors"], "parent": page["ancestors"][-1:],
+                  "space": [page["space"]], "type": ["page"], "title": [page["title"]]}
+        return all(values.intersection(fields[field]) for field, values in clauses)
+    return _matches
+
+
+def _attachment_json(page_id, attachment):
+    return {
+        "id": attachment["id"], "type": "attachment", "title": attachment["title"],
+        "version": {"number": attachment["version"]},
+        "extensions": {"fileSize": len(attachment["data"]), "mediaType": attachment["media_type"]},
+        "_links": {"download": f"/download/attachments/{page_id}/{quote(attachment['title'])}"
+                               f"?version={attachment['version']}&api=v2"},
+    }
+
+
+def _parse_multipart_file(content_type, body):
+    # Returns (filename, data, media type) of the "file" part. A direct split on the boundary keeps the mock
+    # from being the bottleneck when benchmarking large uploads.
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type or '')
+    if not boundary:
+        return None, None, None
+    for part in body.split(b"--" + boundary.group(1).encode('utf-8')):
+        head, separator, data = part.partition(b"\r\n\r\n")
+        if not separator:
+            continue
+        head = head.decode('utf-8', 'replace')
+        if not re.search(r'name="file"', head):
+            continue
+        filename = re.search(r'filename="([^"]*)"', head)
+        media_type = re.search(r'Content-Type:\s*([^\r\n;]+)', head, re.IGNORECASE)
+        return (unquote(filename.group(1)) if filename else "file", data[:-2] if data.endswith(b"\r\n") else data,
+                media_type.group(1).strip() if media_type else "application/octet-stream")
+    return None, None, None
+
+
+class MockConfluenceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockConfluence/1.0"
+    # Headers and body go out in one write (handle_one_request flushes), without Nagle delays on keep-alive.
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # --- Plumbing ---
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                chunk_size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if chunk_size == 0:
+                    self.rfile.readline()
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(chunk_size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _send_json(self, status, payload, extra_headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, extra_headers=None):
+        self._send_json(status, {"statusCode": status, "message": message}, extra_headers)
+
+    def _dispatch(self, method):
+        started = time.monotonic()
+        body = self._read_body()
+        parsed_url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(parsed_url.query).items()}
+        status = self._inject_faults()
+        if status is None:
+            try:
+                status = self._route(method, unquote(parsed_url.path), query, body)
+            except Exception as e:
+                self._send_error(500, f"Mock server error: {e}")
+                status = 500
+        with self.server.state.lock:
+            self.server.state.request_log.append(
+                {"method": method, "path": parsed_url.path, "status": status, "bytes_received": len(body),
+                 "seconds": time.monotonic() - started})
+
+    def _inject_faults(self):
+        config = self.server.config
+        if config["latency_ms"] or config["latency_jitter_ms"]:
+            time.sleep((config["latency_ms"] + random.uniform(0, config["latency_jitter_ms"])) / 1000.0)
+        if self.headers.get('Authorization') != f"Bearer {config['token']}" and config['token']:
+            self._send_error(401, "Authentication required")
+            return 401
+        if not self.server.take_throttle_token():
+            self._send_error(429, "Rate limit exceeded", {"Retry-After": str(config["retry_after_seconds"])})
+            return 429
+        if config["failure_rate"] and random.random() < config["failure_rate"]:
+            self._send_error(config["failure_status"], "Injected failure")
+            return config["failure_status"]
+        return None
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    # --- Routes ---
+    def _route(self, method, path, query, body):
+        routes = (
+            ("GET", r"/rest/api/user/current", self._current_user),
+            ("POST", r"/rest/api/content", self._create_page),
+            ("GET", r"/rest/api/content", self._find_pages),
+            ("GET", r"/rest/api/content/search", self._search_pages),
+            ("GET", r"/rest/api/content/(\w+)", self._get_page),
+            ("PUT", r"/rest/api/content/(\w+)", self._update_page),
+            ("GET", r"/rest/api/content/(\w+)/child/page", self._list_child_pages),
+            ("GET", r"/rest/api/content/(\w+)/child/attachment", self._list_attachments),
+            ("POST", r"/rest/api/content/(\w+)/child/attachment", self._create_attachment),
+            ("POST", r"/rest/api/content/(\w+)/child/attachment/(\w+)/data", self._update_attachment),
+            ("GET", r"/rest/api/content/(\w+)/label", self._list_labels),
+            ("POST", r"/rest/api/content/(\w+)/label", self._add_labels),
+            ("GET", r"/download/attachments/(\w+)/(.+)", self._download_attachment),
+        )
+        for route_method, pattern, handler in routes:
+            match = re.fullmatch(pattern, path.rstrip('/'))
+            if route_method == method and match:
+                return handler(*match.groups(), query=query, body=body)
+        self._send_error(404, f"No mock route for {method} {path}")
+        return 404
+
+    def _current_user(self, query, body):
+        self._send_json(200, {"type": "known", "username": "mock-user", "displayName": "Mock User",
+                              "email": "mock-user@example.com"})
+        return 200
+
+    def _create_page(self, query, body):
+        state = self.server.state
+        data = json.loads(body)
+        space_key = data.get("space", {}).get("key", "")
+        with state.lock:
+            if any(page["space"] == space_key and page["title"] == data["title"] for page in state.pages.values()):
+                self._send_error(400, "A page with this title already exists: A page already exists with the "
+                                      f"title {data['title']} in the space with key {space_key}")
+                return 400
+            parent_ids = [ancestor["id"] for ancestor in data.get("ancestors") or []]
+            if parent_ids and parent_ids[-1] not in state.pages:
+                self._send_error(404, f"No parent page with id {parent_ids[-1]}")
+                return 404
+            page_id = state.next_id()
+            page = state.pages[page_id] = {
+                "id": page_id, "title": data["title"], "space": space_key, "version": 1,
+                "body": data.get("body", {}).get("storage", {}).get("value", ""),
+                "ancestors": (state.pages[parent_ids[-1]]["ancestors"] + parent_ids[-1:]) if parent_ids else [],
+                "when": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            }
+            state.attachments[page_id] = {}
+            page_json = _page_json(page, "body.storage,ancestors", self.server.base_url)
+        self._send_json(200, page_json)
+        return 200
+
+    def _page_limit(self, query, default_limit):
+        # Like Confluence, a server-side maximum may lower the requested limit (e.g. on expanded searches).
+        limit = int(query.get("limit", default_limit))
+        max_page_limit = self.server.config["max_page_limit"]
+        return min(limit, max_page_limit) if max_page_limit else limit
+
+    def _find_pages(self, query, body):
+        state = self.server.state
+        start = int(query.get("start", 0))
+        limit = self._page_limit(query, DEFAULT_PAGE_LIMIT)
+        with state.lock:
+            matches = [page for page in state.pages.values()
+                       if ("spaceKey" not in query or page["space"] == query["spaceKey"])
+                       and ("title" not in query or page["title"] == query["title"])]
+            results = [_page_json(page, query.get("expand", ""), self.server.base_url)
+                       for page in matches[start:start + limit]]
+        links = {"next": f"/rest/api/content?start={start + limit}&limit={limit}"} if start + limit < len(matches) \
+            else {}
+        self._send_json(200, {"results": results, "start": start, "limit": limit, "size": len(results),
+                              "_links": links})
+        return 200
+
+    def _search_pages(self, query, body):
+        state = self.server.state
+        start = int(query.get("start", 0))
+        limit = self._page_limit(query, DEFAULT_PAGE_LIMIT)
+        matcher = _cql_matcher(query.get("cql", ""))
+        if not matcher:
+            self._send_error(400, f"Could not parse cql: {query.get('cql', '')}")
+            return 400
+        with state.lock:
+            matches = [page for page in state.pages.values() if matcher(page)]
+            results = [_page_json(page, query.get("expand", ""), self.server.base_url)
+                       for page in matches[start:start + limit]]
+        links = {"next": f"/rest/api/content/search?start={start + limit}&limit={limit}"} \
+            if start + limit < len(matches) else {}
+        self._send_json(200, {"results": results, "start": start, "limit": limit, "size": len(results),
+                              "_links": links})
+        return 200
+
+    def _get_page(self, page_id, query, body):
+        state = self.server.state
+        with state.lock:
+            page = state.pages.get(page_id)
+            page_json = _page_json(page, query.get("expand", ""), self.server.base_url) if page else None
+        if not page_json:
+            self._send_error(404, f"No content found with id: {page_id}")
+            return 404
+        self._send_json(200, page_json)
+        return 200
+
+    def _update_page(self, page_id, query, body):
+        state = self.server.state
+        data = json.loads(body)
+        with state.lock:
+            page = state.pages.get(page_id)
+            if not page:
+                self._send_error(404, f"No content found with id: {page_id}")
+                return 404
+            if data.get("version", {}).get("number") != page["version"] + 1:
+                self._send_error(409, f"Version must be incremented on update. Current version is: {page['version']}")
+                return 409
+            if data["title"] != page["title"] and any(
+                    other["space"] == page["space"] and other["title"] == data["title"]
+                    for other in state.pages.values()):
+                self._send_error(400, "A page with this title already exists")
+                return 400
+            page["title"] = data["title"]
+            page["version"] += 1
+            page["when"] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+            if "body" in data:
+                page["body"] = data["body"]["storage"]["value"]
+            if data.get("ancestors"):
+                parent_id = data["ancestors"][-1]["id"]
+                page["ancestors"] = state.pages[parent_id]["ancestors"] + [parent_id] \
+                    if parent_id in state.pages else [parent_id]
+            page_json = _page_json(page, "body.storage,ancestors", self.server.base_url)
+        self._send_json(200, page_json)
+        return 200
+
+    def _list_child_pages(self, page_id, query, body):
+        state = self.server.state
+        start = int(query.get("start", 0))
+        limit = self._page_limit(query, DEFAULT_PAGE_LIMIT)
+        with state.lock:
+            if page_id not in state.pages:
+                self._send_error(404, f"No content found with id: {page_id}")
+                return 404
+            children = [page for page in state.pages.values() if page["ancestors"][-1:] == [page_id]]
+            results = [_page_json(page, query.get("expand", ""), self.server.base_url)
+                       for page in children[start:start + limit]]
+        links = {"next": f"/rest/api/content/{page_id}/child/page?start={start + limit}&limit={limit}"} \
+            if start + limit < len(children) else {}
+        self._send_json(200, {"results": results, "start": start, "limit": limit, "size": len(results),
+                              "_links": links})
+        return 200
+
+    def _list_attachments(self, page_id, query, body):
+        state = self.server.state
+        start = int(query.get("start", 0))
+        limit = self._page_limit(query, DEFAULT_PAGE_LIMIT)
+        with state.lock:
+            if page_id not in state.pages:
+                self._send_error(404, f"No content found with id: {page_id}")
+                return 404
+            attachments = [attachment for attachment in state.attachments[page_id].values()
+                           if "filename" not in query or attachment["title"] == query["filename"]]
+            results = [_attachment_json(page_id, attachment) for attachment in attachments[start:start + limit]]
+        links = {"next": f"/rest/api/content/{page_id}/child/attachment?start={start + limit}&limit={limit}"} \
+            if start + limit < len(attachments) else {}
+        self._send_json(200, {"results": results, "start": start, "limit": limit, "size": len(results),
+                              "_links": links})
+        return 200
+
+    def _list_labels(self, page_id, query, body):
+        state = self.server.state
+        start = int(query.get("start", 0))
+        limit = self._page_limit(query, 200)
+        with state.lock:
+            if page_id not in state.pages:
+                self._send_error(404, f"No content found with id: {page_id}")
+                return 404
+            labels = state.pages[page_id].get("labels", [])
+            results = [{"prefix": "global", "name": name, "id": name} for name in labels[start:start + limit]]
+        links = {"next": f"/rest/api/content/{page_id}/label?start={start + limit}&limit={limit}"} \
+            if start + limit < len(labels) else {}
+        self._send_json(200, {"results": results, "start": start, "limit": limit, "size": len(results),
+                              "_links": links})
+        return 200
+
+    def _add_labels(self, page_id, query, body):
+        # Like Confluence: labels are lower-cased and adding a label the page already has is a no-op.
+        state = self.server.state
+        with state.lock:
+            if page_id not in state.pages:
+                self._send_error(404, f"No content found with id: {page_id}")
+                return 404
+            names = [label["name"].strip().lower() for label in json.loads(body)]
+            invalid = [name for name in names if not name or any(character.isspace() for character in name)]
+            if invalid:
+                self._send_error(400, f"Invalid label name: '{invalid[0]}'")
+                return 400
+            labels = state.pages[page_id].setdefault("labels", [])
+            labels += [name for name in dict.fromkeys(names) if name not in labels]
+            results = [{"prefix": "global", "name": name, "id": name} for name in labels]
+        self._send_json(200, {"results": results, "start": 0, "limit": len(results), "size": len(results)})
+        return 200
+
+    def _create_attachment(self, page_id, query, body):
+        state = self.server.state
+        filename, data, media_type = _parse_multipart_file(self.headers.get('Content-Type', ''), body)
+        if filename is None:
+            self._send_error(400, "No file part in request")
+            return 400
+        with state.lock:
+            if page_id not in state.pages:
+                self._send_error(404, f"No content found with id: {page_id}")
+                return 404
+            if filename in state.attachments[page_id]:
+                self._send_error(400, "Cannot add a new attachment with same file name as an existing attachment: "
+                                      f"{filename}")
+                return 400
+            attachment = state.attachments[page_id][filename] = {
+                "id": f"att{state.next_id()}", "title": filename, "version": 1, "data": data,
+                "media_type": media_type}
+            attachment_json = _attachment_json(page_id, attachment)
+        self._send_json(200, {"results": [attachment_json], "size": 1})
+        return 200
+
+    def _update_attachment(self, page_id, attachment_id, query, body):
+        state = self.server.state
+        filename, data, media_type = _parse_multipart_file(self.headers.get('Content-Type', ''), body)
+        with state.lock:
+            attachment = next((attachment for attachment in state.attachments.get(page_id, {}).values()
+                               if attachment["id"] == attachment_id), None)
+            if not attachment or data is None:
+                self._send_error(404, f"No attachment {attachment_id} on page {page_id}")
+                return 404
+            attachment.update(data=data, version=attachment["version"] + 1, media_type=media_type)
+            attachment_json = _attachment_json(page_id, attachment)
+        self._send_json(200, attachment_json)
+        return 200
+
+    def _download_attachment(self, page_id, filename, query, body):
+        state = self.server.state
+        with state.lock:
+            attachment = state.attachments.get(page_id, {}).get(filename)
+        if not attachment:
+            self._send_error(404, f"No attachment {filename} on page {page_id}")
+            return 404
+        self.send_response(200)
+        self.send_header('Content-Type', attachment["media_type"])
+        self.send_header('Content-Length', str(len(attachment["data"])))
+        self.end_headers()
+        self.wfile.write(attachment["data"])
+        return 200
+
+
+class MockConfluenceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open hundreds of connections at once; the default backlog of 5 would stall them on SYN retries.
+    request_queue_size = 512
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, latency_jitter_ms=0.0, throttle_rps=0.0,
+                 retry_after_seconds=1, failure_rate=0.0, failure_status=503, token=None, verbose=False,
+                 max_page_limit=0):
+        super().__init__((host, port), MockConfluenceHandler)
+        self.config = {"latency_ms": latency_ms, "latency_jitter_ms": latency_jitter_ms,
+                       "throttle_rps": throttle_rps, "retry_after_seconds": retry_after_seconds,
+                       "failure_rate": failure_rate, "failure_status": failure_status, "token": token,
+                       "max_page_limit": max_page_limit}
+        self.verbose = verbose
+        self.state = MockConfluenceState()
+        self.base_url = f"http://{host}:{self.server_address[1]}"
+        self._throttle_lock = threading.Lock()
+        self._throttle_tokens = throttle_rps
+        self._throttle_refilled = time.monotonic()
+        self._thread = None
+
+    def take_throttle_token(self):
+        rate = self.config["throttle_rps"]
+        if not rate:
+            return True
+        with self._throttle_lock:
+            now = time.monotonic()
+            self._throttle_tokens = min(rate, self._throttle_tokens + (now - self._throttle_refilled) * rate)
+            self._throttle_refilled = now
+            if self._throttle_tokens < 1:
+                return False
+            self._throttle_tokens -= 1
+            return True
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-confluence", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local mock of the Confluence REST API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fixed delay added to every request.")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0, help="Extra random delay per request.")
+    parser.add_argument("--throttle-rps", type=float, default=0.0,
+                        help="Answer 429 with Retry-After once this request rate is exceeded (0 = off).")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429 responses.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests that fail.")
+    parser.add_argument("--failure-status", type=int, default=503, help="Status code for injected failures.")
+    parser.add_argument("--token", default=None, help="Only accept this bearer token (default: accept any).")
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    parser.add_argument("--max-page-limit", type=int, default=0,
+                        help="Return at most this many results per listing page, whatever limit is requested.")
+    args = parser.parse_args(argv)
+    server = MockConfluenceServer(args.host, args.port, args.latency_ms, args.latency_jitter_ms, args.throttle_rps,
+                                  args.retry_after, args.failure_rate, args.failure_status, args.token, args.verbose,
+                                  args.max_page_limit)
+    print(f"Mock Confluence listening on {server.base_url}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
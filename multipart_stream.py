@@ -0,0 +1,75 @@
+import os
+import uuid
+
+# A multipart/form-data body for a single file that is produced while it is being sent. The file is read
+# in chunks of at most STREAM_CHUNK_SIZE bytes, so memory use does not depend on the file size, and the
+# total length is known up front so requests sends a Content-Length instead of chunked encoding.
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def file_object_size(file_obj):
+    try:
+        return os.fstat(file_obj.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        pass
+    position = file_obj.tell()
+    size = file_obj.seek(0, os.SEEK_END)
+    file_obj.seek(position)
+    return size
+
+
+class MultipartFileStream:
+    def __init__(self, field_name, filename, file_obj, file_size=None, content_type='application/octet-stream',
+                 progress_callback=None):
+        # progress_callback(filename, bytes_sent, total_bytes) is called from the thread sending the request.
+        boundary = uuid.uuid4().hex
+        quoted_filename = filename.replace('"', '%22').replace('\r', '').replace('\n', '')
+        self._preamble = (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{quoted_filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode('utf-8')
+        self._epilogue = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+        self._file_obj = file_obj
+        self._file_size = file_size if file_size is not None else file_object_size(file_obj)
+        self._filename = filename
+        self._progress_callback = progress_callback
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        self.len = len(self._preamble) + self._file_size + len(self._epilogue)
+        self._position = 0
+
+    def __len__(self):
+        return self.len
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        # Only rewinding is supported (the request layer rewinds bodies before a retry).
+        if offset != 0 or whence != 0:
+            raise OSError("MultipartFileStream can only be rewound to the start")
+        self._file_obj.seek(0)
+        self._position = 0
+        return 0
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > STREAM_CHUNK_SIZE:
+            size = STREAM_CHUNK_SIZE
+        preamble_end = len(self._preamble)
+        file_end = preamble_end + self._file_size
+        if self._position < preamble_end:
+            chunk = self._preamble[self._position:self._position + size]
+        elif self._position < file_end:
+            chunk = self._file_obj.read(min(size, file_end - self._position))
+            if not chunk:
+                raise OSError(f"'{self._filename}' ended after {self._position - preamble_end} of "
+                              f"{self._file_size} bytes")
+        else:
+            epilogue_offset = self._position - file_end
+            chunk = self._epilogue[epilogue_offset:epilogue_offset + size]
+        self._position += len(chunk)
+        if self._progress_callback and chunk:
+            sent = min(max(0, self._position - preamble_end), self._file_size)
+            self._progress_callback(self._filename, sent, self._file_size)
+        return chunk
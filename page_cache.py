@@ -0,0 +1,137 @@
+import time
+import threading
+from collections import OrderedDict
+
+# Short-lived cache for page metadata (page by ID, page by space + title, children of a parent), shared by
+# all threads. Entries expire after a TTL and the least recently used ones are evicted beyond max_entries.
+# "No page with this title" is cached too, so repeated conflict checks and parent lookups in bulk runs cost
+# one request per distinct key. Pages are stored without their body; writes in confluence_api.py refresh
+# or drop the affected entries.
+
+DEFAULT_CACHE_TTL_SECONDS = 300.0
+DEFAULT_CACHE_MAX_ENTRIES = 4096
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, ttl_seconds=DEFAULT_CACHE_TTL_SECONDS, max_entries=DEFAULT_CACHE_MAX_ENTRIES):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=_MISSING):
+        # Returns the cached value, or `default` (the module's _MISSING marker if not given) when absent or expired.
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl_seconds=None):
+        with self._lock:
+            expires = time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key, (_, value) in self._entries.items() if predicate(key, value)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions}
+
+
+PAGE_METADATA_CACHE = TTLCache()
+
+
+def is_cache_miss(value):
+    return value is _MISSING
+
+
+def _page_key(page_id):
+    return ("page", str(page_id))
+
+
+def _title_key(space_key, title):
+    return ("title", space_key, title)
+
+
+def _children_key(page_id):
+    return ("children", str(page_id))
+
+
+def cached_page(page_id, cache=None):
+    return (cache or PAGE_METADATA_CACHE).get(_page_key(page_id))
+
+
+def cached_page_by_title(space_key, title, cache=None):
+    return (cache or PAGE_METADATA_CACHE).get(_title_key(space_key, title))
+
+
+def cached_children(page_id, cache=None):
+    return (cache or PAGE_METADATA_CACHE).get(_children_key(page_id))
+
+
+def remember_page(page, space_key, cache=None):
+    # page is a confluence_api page summary; the body is not cached.
+    cache = cache or PAGE_METADATA_CACHE
+    page = dict(page, body=None)
+    cache.set(_page_key(page["id"]), page)
+    if space_key and page.get("title"):
+        cache.set(_title_key(space_key, page["title"]), page)
+
+
+def remember_missing_title(space_key, title, cache=None):
+    (cache or PAGE_METADATA_CACHE).set(_title_key(space_key, title), None)
+
+
+def remember_children(page_id, children, cache=None):
+    (cache or PAGE_METADATA_CACHE).set(_children_key(page_id), [dict(child, body=None) for child in children])
+
+
+def forget_page(page_id, parent_ids=(), titles=(), cache=None):
+    # Drops everything that may describe page_id (its entry, title entries pointing at it, child lists that
+    # contain it) plus the child lists of parent_ids, e.g. the old and new parent of a moved page, and the
+    # entries of titles ((space key, title) pairs) the page now uses, which may be cached as missing.
+    cache = cache or PAGE_METADATA_CACHE
+    page_id = str(page_id)
+    stale_keys = {_children_key(parent_id) for parent_id in parent_ids if parent_id}
+    stale_keys.update(_title_key(space_key, title) for space_key, title in titles)
+
+    def _is_stale(key, value):
+        if key == _page_key(page_id) or key in stale_keys:
+            return True
+        if key[0] == "title":
+            return value is not None and str(value["id"]) == page_id
+        if key[0] == "children":
+            return any(str(child["id"]) == page_id for child in value)
+        return False
+
+    cache.discard_where(_is_stale)
+
+
+def clear_page_cache(cache=None):
+    (cache or PAGE_METADATA_CACHE).clear()
@@ -0,0 +1,177 @@
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from confluence_api import (
+    build_headers, create_http_session, list_child_pages_api, list_page_labels_api, add_page_labels_api,
+    resolve_page_reference_api
+)
+from request_layer import DEFAULT_REQUESTS_PER_SECOND, configure_request_throttle, describe_request_stats
+from publish_journal import DEFAULT_JOURNAL_FILE, PublishJournal
+from cli_log import print_log
+
+# Applies a list of labels (e.g. the Tags Collector output) to many pages at once: an explicit list of page IDs,
+# every page of a subtree, or the pages of a journaled bulk publish run. Each page costs one GET of its labels
+# and, only if some are missing, one POST carrying all of them; pages are labelled in parallel.
+#
+#   python page_labels.py --url https://confluence.example.com/ --space DOCS --labels "api howto" --subtree 12345
+
+DEFAULT_LABEL_WORKERS = 16
+
+
+def parse_label_list(raw_labels):
+    # Accepts the Tags Collector input or output ("a Delete Label b Delete Label", "a b", "a, b") and returns
+    # the distinct label names, lower-cased like Confluence stores them, in their original order.
+    labels = raw_labels.replace("Delete Label", " ").replace(",", " ").lower().split()
+    return list(dict.fromkeys(labels))
+
+
+def collect_subtree_page_ids(root_page_id, headers, api_base_url, log_func, session=None, include_root=True,
+                             max_workers=DEFAULT_LABEL_WORKERS):
+    # Walks the subtree one level at a time, listing the children of all pages of a level in parallel.
+    # Returns the page IDs (root first, parents before children) or None if a listing failed.
+    page_ids = [str(root_page_id)] if include_root else []
+    level = [str(root_page_id)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while level:
+            child_lists = list(executor.map(
+                lambda page_id: list_child_pages_api(page_id, headers, api_base_url, log_func, session=session),
+                level))
+            if any(children is None for children in child_lists):
+                return None
+            level = [str(child["id"]) for children in child_lists for child in children]
+            page_ids += level
+    return page_ids
+
+
+def label_page(page_id, labels, headers, api_base_url, log_func, session=None):
+    # Returns the number of labels added (0 if the page already had them all) or None on error.
+    existing_labels = list_page_labels_api(page_id, headers, api_base_url, log_func, session=session)
+    if existing_labels is None:
+        return None
+    existing_labels = {label.lower() for label in existing_labels}
+    missing_labels = [label for label in labels if label not in existing_labels]
+    if not missing_labels:
+        log_func(f"UNCHANGED: Page ID {page_id} already has all {len(labels)} label(s).")
+        return 0
+    if add_page_labels_api(page_id, missing_labels, headers, api_base_url, log_func, session=session) is None:
+        return None
+    return len(missing_labels)
+
+
+def apply_labels_parallel(page_ids, labels, headers, api_base_url, log_func, max_workers=DEFAULT_LABEL_WORKERS,
+                          session=None, poll_callback=None, poll_interval=0.5):
+    # Labels the pages concurrently. Like upload_attachments_parallel, workers buffer their log lines, which are
+    # flushed through log_func from this thread, and poll_callback() is called every poll_interval seconds.
+    # Returns {"labelled", "unchanged", "failed", "labels_added"}.
+    summary = {"labelled": 0, "unchanged": 0, "failed": 0, "labels_added": 0}
+    page_ids = list(dict.fromkeys(str(page_id) for page_id in page_ids))
+    if not page_ids or not labels:
+        return summary
+    session = session or create_http_session(max_workers)
+
+    def _label_one(page_id):
+        page_logs = []
+        try:
+            return label_page(page_id, labels, headers, api_base_url, page_logs.append, session=session), page_logs
+        except Exception as e:
+            page_logs.append(f"ERROR labelling page ID {page_id}: {e}")
+            return None, page_logs
+
+    worker_count = max(1, min(max_workers, len(page_ids)))
+    log_func(f"Applying {len(labels)} label(s) to {len(page_ids)} page(s) with {worker_count} parallel worker(s)...")
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        pending = {executor.submit(_label_one, page_id) for page_id in page_ids}
+        while pending:
+            done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                labels_added, page_logs = future.result()
+                for line in page_logs:
+                    log_func(line)
+                if labels_added is None:
+                    summary["failed"] += 1
+                elif labels_added:
+                    summary["labelled"] += 1
+                    summary["labels_added"] += labels_added
+                else:
+                    summary["unchanged"] += 1
+            if poll_callback:
+                poll_callback()
+    log_func(f"Label summary: {summary['labelled']} page(s) labelled ({summary['labels_added']} label(s) added), "
+             f"{summary['unchanged']} already labelled, {summary['failed']} failed.")
+    return summary
+
+
+# --- Command Line ---
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Add labels to many Confluence pages at once.")
+    parser.add_argument("--url", required=True, help="Confluence base URL, e.g. https://confluence.example.com/")
+    parser.add_argument("--space", required=True, help="Space key, used to resolve page titles.")
+    parser.add_argument("--labels", required=True,
+                        help="Labels separated by spaces or commas (the Tags Collector output works as is).")
+    parser.add_argument("--page-id", action="append", default=[],
+                        help="Page ID or title to label (repeatable; comma-separated IDs are accepted).")
+    parser.add_argument("--subtree", action="append", default=[],
+                        help="Page ID or title whose whole subtree, itself included, is labelled (repeatable).")
+    parser.add_argument("--journal-run", default=None, metavar="RUN_ID",
+                        help="Label every page published by this journaled bulk_publisher.py run.")
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL_FILE, help="Journal file for --journal-run.")
+    parser.add_argument("--pat", default=os.environ.get("CONFLUENCE_PAT"),
+                        help="Confluence Personal Access Token (default: $CONFLUENCE_PAT).")
+    parser.add_argument("--workers", type=int, default=DEFAULT_LABEL_WORKERS,
+                        help="How many pages are labelled at the same time.")
+    parser.add_argument("--rate-limit", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help="Maximum Confluence API requests per second across all workers.")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if not args.pat:
+        print_log("ERROR: No PAT given. Use --pat or set CONFLUENCE_PAT.")
+        return 2
+    labels = parse_label_list(args.labels)
+    if not labels:
+        print_log("ERROR: No labels given.")
+        return 2
+    api_base_url = f"{args.url.rstrip('/')}/rest/api"
+    headers_content, _ = build_headers(args.pat)
+    workers = max(1, args.workers)
+    configure_request_throttle(args.rate_limit, workers)
+    session = create_http_session(workers)
+
+    page_ids = []
+    for page_reference in [part for value in args.page_id for part in value.split(",") if part.strip()]:
+        page_id = resolve_page_reference_api(page_reference, args.space, headers_content, api_base_url, print_log,
+                                             session=session)
+        if not page_id:
+            return 2
+        page_ids.append(page_id)
+    for page_reference in args.subtree:
+        root_page_id = resolve_page_reference_api(page_reference, args.space, headers_content, api_base_url,
+                                                  print_log, session=session)
+        subtree_page_ids = collect_subtree_page_ids(root_page_id, headers_content, api_base_url, print_log,
+                                                    session=session, max_workers=workers) if root_page_id else None
+        if subtree_page_ids is None:
+            return 2
+        print_log(f"Found {len(subtree_page_ids)} page(s) in the subtree of '{page_reference}'.")
+        page_ids += subtree_page_ids
+    if args.journal_run:
+        journal = PublishJournal(args.journal)
+        if not journal.get_run(args.journal_run):
+            print_log(f"ERROR: No run '{args.journal_run}' in the journal '{args.journal}'.")
+            return 2
+        page_ids += journal.run_page_ids(args.journal_run)
+    if not page_ids:
+        print_log("ERROR: No pages given. Use --page-id, --subtree or --journal-run.")
+        return 2
+
+    summary = apply_labels_parallel(page_ids, labels, headers_content, api_base_url, print_log,
+                                    max_workers=workers, session=session)
+    print_log(describe_request_stats())
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
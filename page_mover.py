@@ -0,0 +1,243 @@
+import io
+import os
+import csv
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from confluence_api import (
+    build_headers, create_http_session, list_child_pages_api, get_pages_by_ids_api, apply_page_changes_api,
+    resolve_page_reference_api
+)
+from request_layer import DEFAULT_REQUESTS_PER_SECOND, configure_request_throttle, describe_request_stats
+from metrics import describe_metrics_summary
+from cli_log import print_log
+
+# Bulk re-parenting: moves many pages to new parents concurrently, from a mapping (CSV lines "page,new parent",
+# IDs or titles) or by moving all children of one page, with their subtrees, under another page.
+# Versions and current parents are prefetched with one CQL search per batch of IDs, so each move is a single
+# PUT; a version conflict (someone edited the page meanwhile) refetches the page and retries the move.
+#
+#   python page_mover.py --url https://confluence.example.com/ --space DOCS --mapping moves.csv --report moved.csv
+
+DEFAULT_MOVE_WORKERS = 8
+DEFAULT_PREFETCH_BATCH_SIZE = 100
+MOVE_REPORT_FIELDS = ("page_id", "title", "old_parent_id", "new_parent_id", "status", "version", "seconds",
+                      "message")
+
+
+def parse_move_mapping(mapping_text, log_func):
+    # CSV with two columns, page and new parent (IDs or titles; quote titles containing commas). Blank lines and
+    # lines starting with # are skipped. Returns [(page reference, parent reference)] or None if a line is invalid.
+    moves = []
+    for line_number, row in enumerate(csv.reader(io.StringIO(mapping_text)), start=1):
+        cells = [cell.strip() for cell in row]
+        if not any(cells) or cells[0].startswith("#"):
+            continue
+        if len(cells) != 2 or not all(cells):
+            log_func(f"ERROR: Line {line_number} of the move mapping must be 'page,new parent': {','.join(row)}")
+            return None
+        moves.append((cells[0], cells[1]))
+    return moves
+
+
+def resolve_moves(moves, space_key, headers, api_base_url, log_func, session=None):
+    # Turns (page reference, parent reference) pairs into (page ID, parent ID). A page listed twice keeps its
+    # last target. Returns None if a reference could not be resolved.
+    resolved_moves = {}
+    for page_reference, parent_reference in moves:
+        page_id = resolve_page_reference_api(page_reference, space_key, headers, api_base_url, log_func,
+                                             session=session)
+        parent_id = resolve_page_reference_api(parent_reference, space_key, headers, api_base_url, log_func,
+                                               session=session)
+        if not page_id or not parent_id:
+            return None
+        if page_id in resolved_moves:
+            log_func(f"WARNING: Page {page_reference} is listed more than once; moving it under {parent_reference}.")
+        resolved_moves[page_id] = parent_id
+    return list(resolved_moves.items())
+
+
+def plan_children_move(source_page_id, target_parent_id, headers, api_base_url, log_func, session=None):
+    # Moving the direct children of source_page_id carries their whole subtrees along.
+    # Returns [(child ID, target_parent_id)] or None if the children could not be listed.
+    children = list_child_pages_api(source_page_id, headers, api_base_url, log_func, session=session)
+    if children is None:
+        return None
+    return [(str(child["id"]), str(target_parent_id)) for child in children]
+
+
+def _lands_in_own_subtree(page_id, parent_id, new_parents, pages):
+    # True if, after every move in new_parents ({page ID: new parent ID}) is done, parent_id would be page_id or
+    # one of its descendants. Walks up from parent_id, following the new parent of every moved page on the way.
+    node_id = parent_id
+    visited = set()
+    while node_id not in visited:
+        if node_id == page_id:
+            return True
+        visited.add(node_id)
+        if node_id in new_parents:
+            node_id = new_parents[node_id]
+            continue
+        node = pages.get(node_id)
+        if not node:
+            return False
+        for ancestor_id in reversed(node["ancestor_ids"]):
+            if ancestor_id == page_id:
+                return True
+            if ancestor_id in new_parents:
+                node_id = new_parents[ancestor_id]
+                break
+        else:
+            return False
+    return False
+
+
+def move_pages_parallel(moves, space_key, headers, api_base_url, log_func, max_workers=DEFAULT_MOVE_WORKERS,
+                        session=None, batch_size=DEFAULT_PREFETCH_BATCH_SIZE, poll_callback=None, poll_interval=0.5):
+    # moves: [(page ID, new parent ID)]. Returns one result per move, in the order given, with the fields of
+    # MOVE_REPORT_FIELDS; status is "moved", "unchanged" or "failed". Workers buffer their log lines, which are
+    # flushed through log_func from this thread; poll_callback() is called every poll_interval seconds.
+    session = session or create_http_session(max_workers)
+    results = {page_id: {"page_id": page_id, "title": None, "old_parent_id": None, "new_parent_id": parent_id,
+                         "status": "failed", "version": None, "seconds": 0.0, "message": ""}
+               for page_id, parent_id in moves}
+    if not results:
+        return []
+    log_func(f"Prefetching versions of {len(results)} page(s) in batches of {batch_size}...")
+    pages = get_pages_by_ids_api(list(results) + [parent_id for _, parent_id in moves], headers, api_base_url,
+                                 log_func, session=session, batch_size=batch_size)
+    if pages is None:
+        for result in results.values():
+            result["message"] = "Could not prefetch page versions."
+        return list(results.values())
+
+    # Moves are checked against each other too: with A -> B and B -> A in one batch, each passes on its own.
+    new_parents = {page_id: result["new_parent_id"] for page_id, result in results.items()}
+    cyclic_page_ids = {page_id for page_id, parent_id in new_parents.items()
+                       if _lands_in_own_subtree(page_id, parent_id, new_parents, pages)}
+
+    def _move_one(page_id, parent_id):
+        page_logs = []
+        started = time.monotonic()
+        result = results[page_id]
+        page = pages.get(page_id)
+        parent = pages.get(parent_id)
+        problem = None
+        if not page:
+            problem = "the page was not found."
+        elif not parent:
+            problem = f"the target parent {parent_id} was not found."
+        elif parent_id == page_id or page_id in parent["ancestor_ids"]:
+            problem = f"the target parent {parent_id} is the page itself or one of its descendants."
+        elif page_id in cyclic_page_ids:
+            problem = f"the target parent {parent_id} would end up under the page after the other moves of this batch."
+        if page:
+            result.update(title=page["title"], old_parent_id=page["parent_id"], version=page["version"])
+        if problem:
+            page_logs.append(f"ERROR: Cannot move page ID {page_id}: {problem}")
+        else:
+            try:
+                updated_page = apply_page_changes_api(page_id, space_key, headers, api_base_url, page_logs.append,
+                                                      session=session, parent_id=parent_id, current_page=page)
+                if updated_page:
+                    result.update(status="moved" if updated_page["action"] == "updated" else "unchanged",
+                                  version=updated_page["version"])
+            except Exception as e:
+                page_logs.append(f"ERROR moving page ID {page_id}: {e}")
+        result["message"] = page_logs[-1] if page_logs else ""
+        result["seconds"] = round(time.monotonic() - started, 3)
+        return page_logs
+
+    worker_count = max(1, min(max_workers, len(results)))
+    log_func(f"Moving {len(results)} page(s) with {worker_count} parallel worker(s)...")
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        pending = {executor.submit(_move_one, page_id, result["new_parent_id"]) for page_id, result in results.items()}
+        while pending:
+            done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                for line in future.result():
+                    log_func(line)
+            if poll_callback:
+                poll_callback()
+    statuses = [result["status"] for result in results.values()]
+    log_func(f"Move summary: {statuses.count('moved')} moved, {statuses.count('unchanged')} already in place, "
+             f"{statuses.count('failed')} failed in {time.monotonic() - started:.1f}s.")
+    return list(results.values())
+
+
+def write_move_report(results, report_path):
+    with open(report_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=MOVE_REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+# --- Command Line ---
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Move many Confluence pages to new parents at once.")
+    parser.add_argument("--url", required=True, help="Confluence base URL, e.g. https://confluence.example.com/")
+    parser.add_argument("--space", required=True, help="Space key of the pages (also used to resolve titles).")
+    parser.add_argument("--mapping", default=None,
+                        help="CSV file with lines 'page,new parent' (page IDs or titles).")
+    parser.add_argument("--subtree", default=None,
+                        help="Page ID or title whose children (with their subtrees) are moved under --to.")
+    parser.add_argument("--to", default=None, help="New parent (ID or title) for --subtree.")
+    parser.add_argument("--report", default=None, help="Write the per-page results to this CSV file.")
+    parser.add_argument("--pat", default=os.environ.get("CONFLUENCE_PAT"),
+                        help="Confluence Personal Access Token (default: $CONFLUENCE_PAT).")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MOVE_WORKERS,
+                        help="How many pages are moved at the same time.")
+    parser.add_argument("--rate-limit", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help="Maximum Confluence API requests per second across all workers.")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if not args.pat:
+        print_log("ERROR: No PAT given. Use --pat or set CONFLUENCE_PAT.")
+        return 2
+    if not args.mapping and not (args.subtree and args.to):
+        print_log("ERROR: Give --mapping, or --subtree together with --to.")
+        return 2
+    api_base_url = f"{args.url.rstrip('/')}/rest/api"
+    headers_content, _ = build_headers(args.pat)
+    workers = max(1, args.workers)
+    configure_request_throttle(args.rate_limit, workers)
+    session = create_http_session(workers)
+
+    moves = []
+    if args.mapping:
+        with open(args.mapping, encoding='utf-8') as f:
+            mapping = parse_move_mapping(f.read(), print_log)
+        resolved_moves = resolve_moves(mapping, args.space, headers_content, api_base_url, print_log,
+                                       session=session) if mapping is not None else None
+        if resolved_moves is None:
+            return 2
+        moves += resolved_moves
+    if args.subtree and args.to:
+        source_page_id = resolve_page_reference_api(args.subtree, args.space, headers_content, api_base_url,
+                                                    print_log, session=session)
+        target_parent_id = resolve_page_reference_api(args.to, args.space, headers_content, api_base_url,
+                                                      print_log, session=session)
+        children_moves = plan_children_move(source_page_id, target_parent_id, headers_content, api_base_url,
+                                            print_log, session=session) \
+            if source_page_id and target_parent_id else None
+        if children_moves is None:
+            return 2
+        moves += children_moves
+
+    results = move_pages_parallel(moves, args.space, headers_content, api_base_url, print_log,
+                                  max_workers=workers, session=session)
+    if args.report:
+        write_move_report(results, args.report)
+    print_log(describe_request_stats())
+    print_log(describe_metrics_summary())
+    return 1 if any(result["status"] == "failed" for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+import os
+import time
+import hashlib
+import zipfile
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from confluence_api import (
+    create_confluence_page_storage_api, list_page_attachments_api, BufferReader, upload_buffer, index_zip_attachments,
+    load_attachment_hash_cache, save_attachment_hash_cache, upload_attachments_parallel, upsert_page_api,
+    apply_page_changes_api, check_title_available_api, resolve_page_reference_api
+)
+from storage_analyzer import analyze_storage
+from storage_splitter import split_storage, describe_split
+from image_optimizer import optimize_upload_jobs
+from request_layer import DEFAULT_REQUESTS_PER_SECOND, describe_request_stats
+from async_client import DEFAULT_ASYNC_CONCURRENCY, upload_attachments_async
+from metrics import describe_metrics_summary
+from publish_journal import RUN_COMPLETED, RUN_FAILED, skip_journaled_uploads
+
+# The UI's "Create Page & Upload Attachments" flow as a function, so it can run as a job_queue.JobQueue job:
+# create (or upsert, or resume) the page, rename it to the desired title, then upload the referenced attachments
+# from the uploaded files and ZIPs. It never touches Streamlit; it logs and reports progress through the job,
+# and messages meant for the user are returned as notices.
+# With split limits, an oversized document is published as a parent page with an index plus one child page per
+# section (see storage_splitter.py); the children are published concurrently, each with its own attachments.
+
+DEFAULT_SPLIT_PAGE_WORKERS = 4
+
+
+def prepare_attachment_sources(attachment_files, log_func, store=None):
+    # attachment_files: [(filename, size, binary file object)], each object owned by this publish. ZIPs are indexed
+    # from their central directory. Returns ({basename: (file_source, description, size)}, open ZipFiles).
+    # Direct uploads are in-memory files (io.BytesIO, confluence_api.BufferReader); every open gets its own reader
+    # over the same data (confluence_api.upload_buffer), so several pages can upload one file at the same time.
+    attachment_sources = {}
+    open_zip_files = []
+    for original_filename, file_size, file_obj in attachment_files:
+        try:
+            if original_filename.lower().endswith('.zip'):
+                log_func(f"  Indexing ZIP file: '{original_filename}'")
+                try:
+                    open_zip_files.append(index_zip_attachments(file_obj, original_filename, attachment_sources,
+                                                                log_func, store=store))
+                except zipfile.BadZipFile:
+                    log_func(f"  ERROR: Uploaded file '{original_filename}' is not a valid ZIP file or is corrupted.")
+                except Exception as e_zip_proc:
+                    log_func(f"  ERROR processing ZIP file '{original_filename}': {e_zip_proc}")
+            else:
+                base_uploaded_filename = os.path.basename(original_filename)
+                if base_uploaded_filename in attachment_sources:
+                    log_func(f"  WARNING: Directly uploaded file '{base_uploaded_filename}' overrides a previously "
+                             f"found file.")
+                file_source = functools.partial(BufferReader, upload_buffer(file_obj))
+                if store:
+                    file_source = store.source(file_source)
+                attachment_sources[base_uploaded_filename] = (file_source, original_filename, file_size)
+                log_func(f"  Prepared directly uploaded file: '{base_uploaded_filename}'")
+        except Exception as e_file_proc:
+            log_func(f"  ERROR processing uploaded file '{original_filename}': {e_file_proc}")
+    return attachment_sources, open_zip_files
+
+
+def _create_or_update_page(title, space_key, storage_content, parent_id, headers_content, api_base_url, log_func,
+                           session, upsert, page_id=None):
+    if upsert:
+        return upsert_page_api(title, space_key, storage_content, parent_id, headers_content, api_base_url,
+                               log_func=log_func, session=session, page_id=page_id)
+    page_info = create_confluence_page_storage_api(title, space_key, storage_content, parent_id, headers_content,
+                                                   api_base_url, log_func=log_func, session=session)
+    if page_info:
+        page_info["action"] = "created"
+    return page_info
+
+
+def publish_page(job, space_key, title, storage_content, headers_content, headers_attachment, api_base_url,
+                 confluence_pat, parent_reference=None, upsert=False, existing_page_id=None, attachment_files=(),
+                 upload_workers=8, skip_unchanged_attachments=True, optimize_images=False, max_image_dimension=None,
+                 image_pool=None, use_async_uploads=False, async_concurrency=DEFAULT_ASYNC_CONCURRENCY,
+                 requests_per_second=None, session=None, journal=None, attachment_store=None, split_max_bytes=None,
+                 split_max_images=None, page_workers=DEFAULT_SPLIT_PAGE_WORKERS):
+    # Returns {"page", "children", "attachments_succeeded", "attachments_failed", "attachments_unchanged",
+    # "notices"}; "page" is the final page summary (None if it could not be published), "children" the summaries
+    # of the child pages of a split document, and notices are (level, message) pairs for the user.
+    # Progress (pages, attachments, bytes) is reported through job.set_totals / advance / record_bytes.
+    log_func = job.log
+    result = {"page": None, "children": [], "attachments_succeeded": 0, "attachments_failed": 0,
+              "attachments_unchanged": 0, "notices": []}
+    log_func("Initiating page creation process...")
+    log_func(f"Desired final page title: '{title}'")
+    split = split_storage(storage_content, title, max_bytes=split_max_bytes, max_images=split_max_images) \
+        if split_max_bytes or split_max_images else None
+    if split:
+        log_func(describe_split(split))
+        result["notices"].append(("info", f"The document was split into {len(split['children'])} child pages "
+                                          f"under an index page."))
+        page_body = split["parent"]["body"]
+        page_attachments = split["parent"]["attachments"]
+        child_parts = split["children"]
+    else:
+        page_body = storage_content
+        page_attachments = analyze_storage(storage_content)["attachments"]
+        child_parts = []
+    referenced_anywhere = page_attachments or any(child["attachments"] for child in child_parts)
+    job.set_totals(pages_total=1 + len(child_parts))
+    parent_id_to_use = resolve_page_reference_api(parent_reference, space_key, headers_content, api_base_url,
+                                                  log_func=log_func, session=session)
+    if parent_reference and not parent_id_to_use:
+        job.fail(f"Could not find the parent page '{parent_reference}' in space '{space_key}'.")
+        return result
+
+    # A publish is resumable while the same content goes to the same title, space and parent (and is split the
+    # same way).
+    journal_run_id = None
+    journaled_page = None
+    if journal:
+        journal_source_key = hashlib.sha256("\n".join(
+            (space_key, parent_id_to_use or "", title, storage_content)
+            + ((f"split:{split_max_bytes}:{split_max_images}",) if split else ())
+        ).encode('utf-8')).hexdigest()
+        resumable_run = journal.find_resumable_run("page", journal_source_key, space_key,
+                                                   parent_id_to_use)
+        if resumable_run:
+            journal_run_id = resumable_run["run_id"]
+            journal.resume_run(journal_run_id)
+            journaled_page = journal.journaled_page(journal_run_id, "page")
+            log_func(f"Resuming interrupted publish {journal_run_id} (started {resumable_run['created_at']}).")
+        else:
+            journal_run_id = journal.start_run("page", journal_source_key, space_key, parent_id=parent_id_to_use,
+                                               options={"upsert": upsert})
+
+    if journaled_page:
+        creation_info = dict(journaled_page, action="resumed")
+        log_func(f"RESUMED: Page '{creation_info['title']}' was already published (ID: {creation_info['id']}).")
+    else:
+        creation_info = _create_or_update_page(title, space_key, page_body, parent_id_to_use, headers_content,
+                                               api_base_url, log_func, session, upsert, page_id=existing_page_id)
+        if creation_info and creation_info["action"] == "unchanged":
+            result["notices"].append(("info", "The page content is unchanged; no new version was created."))
+    if not creation_info:
+        job.fail("Page creation failed. Check logs for details.")
+        if journal_run_id:
+            journal.finish_run(journal_run_id, RUN_FAILED)
+        return result
+    if journal and not journaled_page:
+        journal.record_page(journal_run_id, "page", creation_info)
+    page = dict(creation_info)
+    result["page"] = page
+    job.page_id = page["id"]
+    job.advance(pages_done=1)
+
+    if title != page["title"]:
+        log_func(f"Attempting to update page title to the desired base: '{title}'...")
+        renamed_page = None
+        # Checked up front so a taken title costs a (cached) lookup instead of a failing versioned PUT.
+        if check_title_available_api(space_key, title, headers_content, api_base_url, log_func=log_func,
+                                     page_id=page["id"], session=session) is not False:
+            renamed_page = apply_page_changes_api(page["id"], space_key, headers_content, api_base_url,
+                                                  log_func=log_func, session=session, title=title,
+                                                  current_page=creation_info)
+        if renamed_page:
+            page.update(title=renamed_page["title"], version=renamed_page["version"])
+            if journal:
+                journal.record_page(journal_run_id, "page", page)
+            log_func(f"SUCCESS: Page title updated to '{page['title']}'.")
+        else:
+            log_func(f"WARNING: Failed to update page title to '{title}'. The page retains the title "
+                     f"'{page['title']}'. This might be due to the desired title already existing in the space.")
+            result["notices"].append(("warning", f"Could not update title to '{title}'. Page remains "
+                                                 f"'{page['title']}'. (Desired title might already exist)."))
+
+    attachment_sources = {}
+    open_zip_files = []
+    hash_cache = None
+    if referenced_anywhere and attachment_files:
+        log_func(f"\nProcessing attachments for page ID: {page['id']}...")
+        attachment_sources, open_zip_files = prepare_attachment_sources(attachment_files, log_func,
+                                                                        store=attachment_store)
+        if not attachment_sources:
+            log_func("No attachable files were processed from uploads, but content references attachments.")
+        elif skip_unchanged_attachments:
+            hash_cache = load_attachment_hash_cache()
+    elif referenced_anywhere:
+        log_func("Content references attachments, but no files were provided for upload in Step 2.")
+        result["notices"].append(("warning", "Your content references attachments, but you didn't upload any files "
+                                             "in Step 2."))
+
+    def _upload_page_attachments(page_id, page_key, referenced_attachments, page_log):
+        # Returns (succeeded, failed or skipped, unchanged) for one page.
+        if not attachment_sources or not referenced_attachments:
+            return 0, 0, 0
+        page_log(f"Attempting to upload the attachments referenced by page ID {page_id}...")
+        upload_jobs = []
+        skipped = 0
+        for ref_fn_in_content in referenced_attachments:
+            filename_on_confluence = os.path.basename(ref_fn_in_content)
+            if filename_on_confluence in attachment_sources:
+                file_source, source_description, file_size = attachment_sources[filename_on_confluence]
+                page_log(f"  Match found for '{filename_on_confluence}' (from '{source_description}').")
+                upload_jobs.append((filename_on_confluence, file_source, file_size))
+            else:
+                page_log(f"  SKIPPING: Referenced attachment '{filename_on_confluence}' (from content: "
+                         f"'{ref_fn_in_content}') not found in uploads.")
+                skipped += 1
+        if optimize_images and upload_jobs:
+            upload_jobs = optimize_upload_jobs(upload_jobs, page_log, max_dimension=max_image_dimension or None,
+                                               executor=image_pool)
+        journal_recorder = None
+        if journal and upload_jobs:
+            upload_jobs, _ = skip_journaled_uploads(journal, journal_run_id, page_key, upload_jobs, page_log)
+            journal_recorder = journal.attachment_recorder(journal_run_id, page_key)
+
+        def _record_upload(filename, outcome, attachment_info, sha256):
+            job.advance(attachments_done=1)
+            if journal_recorder:
+                journal_recorder(filename, outcome, attachment_info, sha256)
+
+        def _record_bytes(filename, bytes_sent, total_bytes):
+            job.record_bytes(f"{page_id}/{filename}", bytes_sent, total_bytes)
+
+        existing_attachments = None
+        if skip_unchanged_attachments and upload_jobs:
+            existing_attachments = list_page_attachments_api(page_id, headers_attachment, api_base_url,
+                                                             log_func=page_log, session=session)
+        job.advance(attachments_total=len(upload_jobs), bytes_total=sum(size or 0 for _, _, size in upload_jobs))
+        if use_async_uploads:
+            succeeded, failed, unchanged = upload_attachments_async(
+                page_id, upload_jobs, api_base_url, confluence_pat, log_func=page_log,
+                max_concurrency=async_concurrency,
+                requests_per_second=requests_per_second or DEFAULT_REQUESTS_PER_SECOND,
+                existing_attachments=existing_attachments, hash_cache=hash_cache,
+                progress_callback=_record_bytes, result_callback=_record_upload
+            )
+        else:
+            succeeded, failed, unchanged = upload_attachments_parallel(
+                page_id, upload_jobs, headers_attachment, api_base_url, log_func=page_log,
+                max_workers=upload_workers, session=session, existing_attachments=existing_attachments,
+                hash_cache=hash_cache, progress_callback=_record_bytes, result_callback=_record_upload
+            )
+        return succeeded, failed + skipped, unchanged
+
+    def _add_upload_counts(counts):
+        result["attachments_succeeded"] += counts[0]
+        result["attachments_failed"] += counts[1]
+        result["attachments_unchanged"] += counts[2]
+
+    def _publish_child(child_part):
+        # Runs on a worker thread; its log lines are buffered and flushed by the caller.
+        child_logs = []
+        child_key = f"part:{child_part['title']}"
+        journaled_child = journal.journaled_page(journal_run_id, child_key) if journal else None
+        if journaled_child:
+            child_page = dict(journaled_child, action="resumed")
+            child_logs.append(f"RESUMED: Child page '{child_page['title']}' was already published "
+                              f"(ID: {child_page['id']}).")
+        else:
+            child_page = _create_or_update_page(child_part["title"], space_key, child_part["body"], page["id"],
+                                                headers_content, api_base_url, child_logs.append, session, upsert)
+        if not child_page:
+            return None, (0, len(child_part["attachments"]), 0), child_logs
+        if journal and not journaled_child:
+            journal.record_page(journal_run_id, child_key, child_page)
+        job.advance(pages_done=1)
+        counts = _upload_page_attachments(child_page["id"], child_key, child_part["attachments"], child_logs.append)
+        return child_page, counts, child_logs
+
+    upload_started = time.monotonic()
+    try:
+        _add_upload_counts(_upload_page_attachments(page["id"], "page", page_attachments, log_func))
+        if child_parts:
+            log_func(f"Publishing {len(child_parts)} child page(s) with {page_workers} parallel worker(s)...")
+            failed_children = 0
+            with ThreadPoolExecutor(max_workers=page_workers) as executor:
+                futures = [executor.submit(_publish_child, child_part) for child_part in child_parts]
+                for future in as_completed(futures):
+                    child_page, counts, child_logs = future.result()
+                    for line in child_logs:
+                        log_func(line)
+                    _add_upload_counts(counts)
+                    if not child_page:
+                        failed_children += 1
+            # In document order, for the caller's list of links.
+            result["children"] = [future.result()[0] for future in futures if future.result()[0]]
+            if failed_children:
+                job.fail(f"{failed_children} of {len(child_parts)} child page(s) could not be published. "
+                         f"Publish again to retry them.")
+    finally:
+        for zip_ref in open_zip_files:
+            zip_ref.close()
+        if attachment_store:
+            attachment_store.save_zip_index()
+    if attachment_sources:
+        upload_seconds = time.monotonic() - upload_started
+        bytes_sent = job.progress()["bytes_sent"]
+        log_func(f"  Sent {bytes_sent / 1e6:.1f} MB in {upload_seconds:.1f}s "
+                 f"({bytes_sent / 1e6 / max(upload_seconds, 1e-6):.1f} MB/s).")
+        if hash_cache is not None:
+            try:
+                save_attachment_hash_cache(hash_cache)
+            except OSError as e_cache:
+                log_func(f"  WARNING: Could not save attachment hash cache: {e_cache}")
+        log_func(f"Attachment upload summary: {result['attachments_succeeded']} succeeded, "
+                 f"{result['attachments_failed']} failed/skipped, {result['attachments_unchanged']} unchanged.")
+        if attachment_store:
+            store_stats = attachment_store.stats()
+            log_func(f"Attachment store: {store_stats['bytes'] / 1e6:.1f} of {store_stats['max_bytes'] / 1e6:.0f} "
+                     f"MB used, {store_stats['spooled']} file(s) spooled, {store_stats['hits']} reused, "
+                     f"{store_stats['evictions']} evicted.")
+    if result["attachments_succeeded"]:
+        result["notices"].append(("info", f"{result['attachments_succeeded']} attachments uploaded successfully."))
+    if result["attachments_unchanged"]:
+        result["notices"].append(("info", f"{result['attachments_unchanged']} attachments were already up to date."))
+    if result["attachments_failed"]:
+        result["notices"].append(("warning", f"{result['attachments_failed']} attachments failed to upload or were "
+                                             f"skipped. Check logs."))
+
+    if journal_run_id:
+        journal.finish_run(journal_run_id, RUN_FAILED if job.error or result["attachments_failed"] else RUN_COMPLETED)
+    log_func(f"SUCCESS: Page '{page['title']}' (ID: {page['id']}, Ver: {page['version']}) processed!")
+    log_func(describe_request_stats())
+    log_func(describe_metrics_summary())
+    return result
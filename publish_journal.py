@@ -0,0 +1,186 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+
+from confluence_api import sha256_of_file_source
+
+# Local SQLite journal of publish runs, so an interrupted publish (crash, network outage, browser refresh)
+# can be resumed without creating duplicate pages or re-uploading attachments. Each finished step is
+# committed as soon as it completes: a page with its ID and version, an attachment with its SHA-256.
+# A resumed run reuses the journaled pages and skips attachments whose local content still has the
+# journaled hash. Runs are identified by kind ("tree", "page", ...) plus a source key (the root
+# directory of a bulk publish, or a hash of the page content in the UI), the space and the parent page.
+
+DEFAULT_JOURNAL_FILE = os.path.join(os.path.expanduser("~"), ".confluence_publisher", "publish_journal.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    source_key TEXT NOT NULL,
+    space_key TEXT NOT NULL,
+    parent_id TEXT,
+    options TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_source ON runs (kind, source_key, space_key, status);
+CREATE TABLE IF NOT EXISTS pages (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    page_key TEXT NOT NULL,
+    page_id TEXT NOT NULL,
+    title TEXT,
+    version INTEGER,
+    link TEXT,
+    action TEXT,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (run_id, page_key)
+);
+CREATE TABLE IF NOT EXISTS attachments (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    page_key TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    attachment_id TEXT,
+    version INTEGER,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (run_id, page_key, filename)
+);
+"""
+
+RUN_RUNNING = "running"
+RUN_COMPLETED = "completed"
+RUN_FAILED = "failed"
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class PublishJournal:
+    def __init__(self, path=DEFAULT_JOURNAL_FILE):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        # One connection shared by the publish threads; the lock serializes statements and commits.
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(_SCHEMA)
+            self._connection.commit()
+
+    def _execute(self, statement, parameters=()):
+        with self._lock:
+            cursor = self._connection.execute(statement, parameters)
+            self._connection.commit()
+            return cursor
+
+    def _query(self, statement, parameters=()):
+        with self._lock:
+            return [dict(row) for row in self._connection.execute(statement, parameters).fetchall()]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    # --- Runs ---
+    def start_run(self, kind, source_key, space_key, parent_id=None, options=None, run_id=None):
+        run_id = run_id or uuid.uuid4().hex
+        now = _now()
+        self._execute(
+            "INSERT INTO runs (run_id, kind, source_key, space_key, parent_id, options, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (run_id, kind, source_key, space_key, parent_id, json.dumps(options or {}), RUN_RUNNING, now, now)
+        )
+        return run_id
+
+    def get_run(self, run_id):
+        runs = self._query("SELECT * FROM runs WHERE run_id = ?", (run_id,))
+        return runs[0] if runs else None
+
+    def find_resumable_run(self, kind, source_key, space_key, parent_id):
+        # The most recent run for the same source, space and parent page that did not complete.
+        runs = self._query(
+            "SELECT * FROM runs WHERE kind = ? AND source_key = ? AND space_key = ? AND parent_id IS ? "
+            "AND status != ? ORDER BY updated_at DESC, created_at DESC LIMIT 1",
+            (kind, source_key, space_key, parent_id, RUN_COMPLETED)
+        )
+        return runs[0] if runs else None
+
+    def resume_run(self, run_id):
+        self._execute("UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?", (RUN_RUNNING, _now(), run_id))
+
+    def finish_run(self, run_id, status=RUN_COMPLETED):
+        self._execute("UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?", (status, _now(), run_id))
+
+    def list_runs(self, limit=20):
+        return self._query(
+            "SELECT runs.*, (SELECT COUNT(*) FROM pages WHERE pages.run_id = runs.run_id) AS pages, "
+            "(SELECT COUNT(*) FROM attachments WHERE attachments.run_id = runs.run_id) AS attachments "
+            "FROM runs ORDER BY updated_at DESC LIMIT ?", (limit,)
+        )
+
+    # --- Steps ---
+    def record_page(self, run_id, page_key, page):
+        now = _now()
+        self._execute(
+            "INSERT OR REPLACE INTO pages (run_id, page_key, page_id, title, version, link, action, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (run_id, page_key, str(page["id"]), page.get("title"), page.get("version"), page.get("link"),
+             page.get("action"), now)
+        )
+        self._execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (now, run_id))
+
+    def journaled_page(self, run_id, page_key):
+        # Returns the page as recorded ({"id", "title", "version", "link", "action"}) or None.
+        pages = self._query("SELECT page_id AS id, title, version, link, action FROM pages "
+                            "WHERE run_id = ? AND page_key = ?", (run_id, page_key))
+        return pages[0] if pages else None
+
+    def run_page_ids(self, run_id):
+        return [row["page_id"] for row in self._query("SELECT page_id FROM pages WHERE run_id = ? ORDER BY page_key",
+                                                      (run_id,))]
+
+    def record_attachment(self, run_id, page_key, filename, sha256, attachment_info=None):
+        attachment_info = attachment_info or {}
+        self._execute(
+            "INSERT OR REPLACE INTO attachments (run_id, page_key, filename, sha256, attachment_id, version, "
+            "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (run_id, page_key, filename, sha256, attachment_info.get("id"), attachment_info.get("version"), _now())
+        )
+
+    def journaled_attachments(self, run_id, page_key):
+        # Returns {filename: sha256} of the attachments already uploaded for the page in this run.
+        rows = self._query("SELECT filename, sha256 FROM attachments WHERE run_id = ? AND page_key = ?",
+                           (run_id, page_key))
+        return {row["filename"]: row["sha256"] for row in rows}
+
+    def attachment_recorder(self, run_id, page_key):
+        # A result_callback for upload_attachments_parallel / upload_attachments_async.
+        def _record(filename, outcome, attachment_info, sha256):
+            self.record_attachment(run_id, page_key, filename, sha256, attachment_info)
+        return _record
+
+
+def skip_journaled_uploads(journal, run_id, page_key, upload_jobs, log_func):
+    # Drops upload jobs that this run already uploaded with the same content. Returns (remaining_jobs, skipped).
+    journaled = journal.journaled_attachments(run_id, page_key)
+    if not journaled:
+        return upload_jobs, 0
+    remaining_jobs = []
+    for filename_on_confluence, file_source, file_size in upload_jobs:
+        if filename_on_confluence in journaled \
+                and sha256_of_file_source(file_source) == journaled[filename_on_confluence]:
+            continue
+        remaining_jobs.append((filename_on_confluence, file_source, file_size))
+    skipped = len(upload_jobs) - len(remaining_jobs)
+    if skipped:
+        log_func(f"  RESUMED: {skipped} attachment(s) were already uploaded by this run, skipping them.")
+    return remaining_jobs, skipped
@@ -0,0 +1,228 @@
+import json
+import time
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from metrics import record_span
+
+# Single entry point for every Confluence HTTP call (see confluence_api.py). All calls share one
+# RequestThrottle, which combines:
+#   - a token bucket limiting the request rate,
+#   - an adaptive concurrency limit that halves when the server throttles (429/503) and grows back
+#     by one slot per window of successful responses,
+#   - a global pause honoring the server's Retry-After,
+# and send_request retries transient failures with jittered exponential backoff. Every call is recorded as
+# one timing span (see metrics.py), retries included.
+
+DEFAULT_REQUESTS_PER_SECOND = 50.0
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 60.0
+DECREASE_COOLDOWN_SECONDS = 1.0
+THROTTLE_STATUS_CODES = (429, 503)
+RETRYABLE_STATUS_CODES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+
+class RequestThrottle:
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._concurrency_limit = max(1, int(max_concurrency))
+        self._successes_since_change = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self.configure(requests_per_second, max_concurrency)
+        self._tokens = self._burst
+        self._last_refill = time.monotonic()
+        self.reset_stats()
+
+    def configure(self, requests_per_second, max_concurrency):
+        with self._condition:
+            self._rate = max(0.1, float(requests_per_second))
+            self._burst = max(1.0, self._rate)
+            self._max_concurrency = max(1, int(max_concurrency))
+            self._concurrency_limit = min(self._concurrency_limit, self._max_concurrency)
+            self._condition.notify_all()
+
+    def reset_stats(self):
+        with self._condition:
+            self._stats = {"requests": 0, "retries": 0, "throttle_events": 0, "throttled_seconds": 0.0,
+                           "limiter_wait_seconds": 0.0}
+
+    def stats(self):
+        with self._condition:
+            return dict(self._stats, concurrency_limit=self._concurrency_limit)
+
+    def _refill(self, now):
+        self._tokens = min(self._burst, self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+    def acquire(self):
+        started = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait_seconds = self._paused_until - now
+                elif self._in_flight >= self._concurrency_limit:
+                    wait_seconds = None
+                elif self._tokens < 1:
+                    wait_seconds = (1 - self._tokens) / self._rate
+                else:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    self._stats["requests"] += 1
+                    self._stats["limiter_wait_seconds"] += time.monotonic() - started
+                    return
+                self._condition.wait(wait_seconds)
+
+    def release(self, throttled):
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self._stats["throttle_events"] += 1
+                # Responses to requests that were already in flight report the same overload; halve once per window.
+                now = time.monotonic()
+                if now - self._last_decrease >= DECREASE_COOLDOWN_SECONDS:
+                    self._concurrency_limit = max(1, self._concurrency_limit // 2)
+                    self._last_decrease = now
+                self._successes_since_change = 0
+            else:
+                self._successes_since_change += 1
+                if (self._concurrency_limit < self._max_concurrency
+                        and self._successes_since_change >= self._concurrency_limit):
+                    self._concurrency_limit += 1
+                    self._successes_since_change = 0
+            self._condition.notify_all()
+
+    def pause(self, seconds):
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def record_retry(self, delay_seconds, throttled):
+        with self._condition:
+            self._stats["retries"] += 1
+            if throttled:
+                self._stats["throttled_seconds"] += delay_seconds
+
+
+REQUEST_THROTTLE = RequestThrottle()
+
+
+def configure_request_throttle(requests_per_second, max_concurrency):
+    REQUEST_THROTTLE.configure(requests_per_second, max_concurrency)
+
+
+def request_stats():
+    return REQUEST_THROTTLE.stats()
+
+
+def reset_request_stats():
+    REQUEST_THROTTLE.reset_stats()
+
+
+def describe_request_stats():
+    stats = request_stats()
+    return (f"Request stats: {stats['requests']} request(s), {stats['retries']} retried, "
+            f"{stats['throttle_events']} throttled response(s), {stats['throttled_seconds']:.1f}s backing off "
+            f"after throttling, {stats['limiter_wait_seconds']:.1f}s waiting on the rate limiter, "
+            f"concurrency limit now {stats['concurrency_limit']}.")
+
+
+def backoff_delay(attempt):
+    # Full jitter: uniform in [0, base * 2^attempt], capped.
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+def retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return min(BACKOFF_MAX_SECONDS, max(0.0, float(value)))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return min(BACKOFF_MAX_SECONDS, max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds()))
+
+
+def _rewind_request_body(request_kwargs):
+    # File bodies have been consumed by the failed attempt; rewind them, or give up retrying if we can't.
+    file_objects = []
+    for file_tuple in (request_kwargs.get('files') or {}).values():
+        if isinstance(file_tuple, (tuple, list)) and len(file_tuple) > 1:
+            file_objects.append(file_tuple[1])
+    file_objects.append(request_kwargs.get('data'))
+    for file_obj in file_objects:
+        if file_obj is None or isinstance(file_obj, (bytes, str, dict)):
+            continue
+        try:
+            file_obj.seek(0)
+        except Exception:
+            return False
+    return True
+
+
+def _request_body_size(request_kwargs):
+    body = request_kwargs.get('data')
+    if request_kwargs.get('json') is not None:
+        return len(json.dumps(request_kwargs['json']).encode('utf-8'))
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    try:
+        return len(body) if body is not None else 0
+    except TypeError:
+        return 0
+
+
+def send_request(method, url, session=None, max_retries=DEFAULT_MAX_RETRIES, throttle=None, operation=None,
+                 page_id=None, **request_kwargs):
+    # Returns the final response (which may still be an error status) or raises the last connection error.
+    http = session or requests
+    throttle = throttle or REQUEST_THROTTLE
+    method = method.upper()
+    operation = operation or method.lower()
+    bytes_per_attempt = _request_body_size(request_kwargs)
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        throttle.acquire()
+        throttled = False
+        try:
+            response = http.request(method, url, **request_kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            throttle.release(False)
+            if attempt >= max_retries or method not in IDEMPOTENT_METHODS \
+                    or not _rewind_request_body(request_kwargs):
+                record_span(operation, method, page_id, None, time.monotonic() - started, attempt,
+                            bytes_per_attempt * (attempt + 1), error=type(e).__name__)
+                raise
+            delay = backoff_delay(attempt)
+        else:
+            throttled = response.status_code in THROTTLE_STATUS_CODES
+            throttle.release(throttled)
+            retryable = throttled or (response.status_code in RETRYABLE_STATUS_CODES and method in IDEMPOTENT_METHODS)
+            if not retryable or attempt >= max_retries or not _rewind_request_body(request_kwargs):
+                record_span(operation, method, page_id, response.status_code, time.monotonic() - started, attempt,
+                            bytes_per_attempt * (attempt + 1))
+                return response
+            server_delay = retry_after_seconds(response)
+            delay = server_delay if server_delay is not None else backoff_delay(attempt)
+            if server_delay is not None:
+                throttle.pause(server_delay)
+            response.close()
+        throttle.record_retry(delay, throttled)
+        time.sleep(delay)
+        attempt += 1
@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from confluence_api import (
+    build_headers, create_http_session, search_pages_cql_api, get_pages_by_ids_api, list_page_attachments_api,
+    download_attachment_api, resolve_page_reference_api
+)
+from request_layer import DEFAULT_REQUESTS_PER_SECOND, configure_request_throttle, describe_request_stats
+from metrics import describe_metrics_summary
+from cli_log import print_log
+
+# Mirrors a space, or the subtree of one page, to local disk so published content can be read back, verified and
+# diffed. Every page is written to <output>/<page id>/page.xml with its attachments in <output>/<page id>/
+# attachments/, and manifest.json records title, parent, version and last-modified time of each page and the
+# version of each attachment. A repeat run lists versions only (one CQL search per 100 pages) and downloads just
+# the pages whose version or last-modified time changed, so refreshing a large, mostly unchanged mirror is cheap.
+#
+#   python space_exporter.py --url https://confluence.example.com/ --space DOCS --output docs_mirror/
+#
+# Adding an attachment does not create a new page version, so attachments are only re-listed for changed pages;
+# use --check-attachments to re-list them for every page.
+
+DEFAULT_EXPORT_WORKERS = 8
+DEFAULT_BODY_BATCH_SIZE = 25
+MANIFEST_FILE_NAME = "manifest.json"
+PAGE_FILE_NAME = "page.xml"
+ATTACHMENTS_DIR_NAME = "attachments"
+
+
+# --- Manifest ---
+def load_export_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"pages": {}}
+
+
+def save_export_manifest(output_dir, manifest):
+    manifest_file = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    tmp_file = f"{manifest_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+
+
+def page_export_dir(output_dir, page_id):
+    return os.path.join(output_dir, str(page_id))
+
+
+def _safe_filename(title):
+    return title.replace("/", "_").replace("\\", "_") or "_"
+
+
+def page_needs_export(page, entry, output_dir):
+    if not entry or entry.get("attachments") is None:
+        return True
+    if entry.get("version") != page["version"] or entry.get("last_modified") != page["last_modified"]:
+        return True
+    return not os.path.isfile(os.path.join(page_export_dir(output_dir, page["id"]), PAGE_FILE_NAME))
+
+
+# --- Export ---
+def list_export_pages(space_key, headers, api_base_url, log_func, session=None, root_page_id=None):
+    # Version, last-modified time and ancestors of every page to mirror, without bodies. Returns {page ID: summary}
+    # or None on error.
+    if root_page_id:
+        pages = get_pages_by_ids_api([root_page_id], headers, api_base_url, log_func, session=session)
+        descendants = search_pages_cql_api(f"ancestor = {root_page_id} and type = page", headers, api_base_url,
+                                           log_func, session=session)
+        if pages is None or descendants is None:
+            return None
+        if str(root_page_id) not in pages:
+            log_func(f"ERROR: Page ID {root_page_id} not found.")
+            return None
+    else:
+        pages = {}
+        descendants = search_pages_cql_api(f'space = "{space_key}" and type = page', headers, api_base_url, log_func,
+                                           session=session)
+        if descendants is None:
+            return None
+    pages.update((str(page["id"]), page) for page in descendants)
+    return pages
+
+
+def export_pages(space_key, output_dir, headers, api_base_url, log_func, root_page_id=None,
+                 max_workers=DEFAULT_EXPORT_WORKERS, session=None, batch_size=DEFAULT_BODY_BATCH_SIZE,
+                 include_attachments=True, check_all_attachments=False, poll_callback=None, poll_interval=0.5):
+    # Brings output_dir up to date with the space (or the subtree of root_page_id). Changed pages are fetched with
+    # their bodies batch_size at a time, and attachments are listed and streamed to disk per page, all in parallel.
+    # Pages that disappeared are removed from the mirror. Workers buffer their log lines, which are flushed
+    # through log_func from this thread. Returns a summary of counts, or None if the pages could not be listed or
+    # output_dir mirrors another scope.
+    os.makedirs(output_dir, exist_ok=True)
+    session = session or create_http_session(max_workers)
+    manifest = load_export_manifest(output_dir)
+    entries = manifest["pages"]
+    if entries and (manifest.get("space_key"), manifest.get("root_page_id")) != (space_key, root_page_id):
+        # Refreshing would delete every page outside the new scope.
+        log_func(f"ERROR: '{output_dir}' mirrors a different space or subtree; export into a new directory.")
+        return None
+    summary = {"pages": 0, "pages_exported": 0, "pages_unchanged": 0, "pages_removed": 0, "pages_failed": 0,
+               "attachments_downloaded": 0, "attachments_unchanged": 0, "attachments_removed": 0,
+               "attachments_failed": 0, "bytes_downloaded": 0}
+
+    log_func(f"Listing the pages of {f'the subtree of page ID {root_page_id}' if root_page_id else space_key}...")
+    pages = list_export_pages(space_key, headers, api_base_url, log_func, session=session, root_page_id=root_page_id)
+    if pages is None:
+        return None
+    summary["pages"] = len(pages)
+    changed_ids = [page_id for page_id, page in pages.items()
+                   if page_needs_export(page, entries.get(page_id), output_dir)]
+    attachment_ids = list(pages) if check_all_attachments else changed_ids
+    summary["pages_unchanged"] = len(pages) - len(changed_ids)
+    log_func(f"{len(pages)} page(s) found, {len(changed_ids)} new or changed since the last export.")
+
+    def _export_bodies(batch):
+        batch_logs = []
+        exported = {}
+        results = search_pages_cql_api(f"id in ({','.join(batch)})", headers, api_base_url, batch_logs.append,
+                                       session=session, expand="body.storage,version,ancestors",
+                                       page_size=len(batch))
+        for page in results or []:
+            page_dir = page_export_dir(output_dir, page["id"])
+            os.makedirs(page_dir, exist_ok=True)
+            page_file = os.path.join(page_dir, PAGE_FILE_NAME)
+            with open(f"{page_file}.tmp", 'w', encoding='utf-8') as f:
+                f.write(page["body"] or "")
+            os.replace(f"{page_file}.tmp", page_file)
+            exported[str(page["id"])] = page
+        return "bodies", batch, exported, batch_logs
+
+    def _export_attachments(page_id):
+        page_logs = []
+        counts = {"attachments_downloaded": 0, "attachments_unchanged": 0, "attachments_removed": 0,
+                  "attachments_failed": 0, "bytes_downloaded": 0}
+        remote_attachments = list_page_attachments_api(page_id, headers, api_base_url, page_logs.append,
+                                                       session=session)
+        if remote_attachments is None:
+            counts["attachments_failed"] += 1
+            return "attachments", page_id, (None, counts), page_logs
+        known_attachments = (entries.get(page_id) or {}).get("attachments") or {}
+        attachments_dir = os.path.join(page_export_dir(output_dir, page_id), ATTACHMENTS_DIR_NAME)
+        mirrored = {}
+        for filename, attachment in remote_attachments.items():
+            target_path = os.path.join(attachments_dir, _safe_filename(filename))
+            known = known_attachments.get(filename)
+            if known and known["id"] == attachment["id"] and known["version"] == attachment["version"] \
+                    and os.path.isfile(target_path):
+                mirrored[filename] = known
+                counts["attachments_unchanged"] += 1
+                continue
+            os.makedirs(attachments_dir, exist_ok=True)
+            size = download_attachment_api(attachment, target_path, headers, api_base_url, page_logs.append,
+                                           session=session)
+            if size is None:
+                counts["attachments_failed"] += 1
+                continue
+            mirrored[filename] = {"id": attachment["id"], "version": attachment["version"], "size": size}
+            counts["attachments_downloaded"] += 1
+            counts["bytes_downloaded"] += size
+        for filename in set(known_attachments) - set(remote_attachments):
+            stale_path = os.path.join(attachments_dir, _safe_filename(filename))
+            if os.path.isfile(stale_path):
+                os.remove(stale_path)
+            counts["attachments_removed"] += 1
+        # A failed download leaves the listing incomplete, so the page is checked again on the next run.
+        return "attachments", page_id, (None if counts["attachments_failed"] else mirrored, counts), page_logs
+
+    exported_pages = {}
+    mirrored_attachments = {}
+    log_func(f"Exporting with {max_workers} parallel worker(s)...")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(_export_bodies, changed_ids[batch_start:batch_start + batch_size])
+                   for batch_start in range(0, len(changed_ids), batch_size)}
+        if include_attachments:
+            pending |= {executor.submit(_export_attachments, page_id) for page_id in attachment_ids}
+        while pending:
+            done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                task_kind, task_key, task_result, task_logs = future.result()
+                for line in task_logs:
+                    log_func(line)
+                if task_kind == "bodies":
+                    exported_pages.update(task_result)
+                else:
+                    attachments, counts = task_result
+                    mirrored_attachments[task_key] = attachments
+                    for count_name, count in counts.items():
+                        summary[count_name] += count
+            if poll_callback:
+                poll_callback()
+
+    # Merged from this thread only, so the manifest never reflects a half-written page.
+    for page_id in changed_ids:
+        page = exported_pages.get(page_id)
+        if not page:
+            log_func(f"ERROR: Could not export page '{pages[page_id]['title']}' (ID: {page_id}).")
+            summary["pages_failed"] += 1
+            continue
+        previous_attachments = (entries.get(page_id) or {}).get("attachments")
+        entries[page_id] = {"title": page["title"], "version": page["version"],
+                            "last_modified": page["last_modified"], "parent_id": page["parent_id"],
+                            "attachments": previous_attachments if include_attachments else {}}
+        summary["pages_exported"] += 1
+    for page_id, attachments in mirrored_attachments.items():
+        if page_id in entries:
+            entries[page_id]["attachments"] = attachments
+    for page_id in set(entries) - set(pages):
+        shutil.rmtree(page_export_dir(output_dir, page_id), ignore_errors=True)
+        del entries[page_id]
+        summary["pages_removed"] += 1
+    manifest.update(space_key=space_key, root_page_id=root_page_id,
+                    exported_at=datetime.now().isoformat(timespec="seconds"))
+    save_export_manifest(output_dir, manifest)
+
+    log_func(f"Export summary: {summary['pages']} page(s), {summary['pages_exported']} exported, "
+             f"{summary['pages_unchanged']} unchanged, {summary['pages_removed']} removed, "
+             f"{summary['pages_failed']} failed. Attachments: {summary['attachments_downloaded']} downloaded "
+             f"({summary['bytes_downloaded'] / (1024 * 1024):.1f} MB), {summary['attachments_unchanged']} unchanged, "
+             f"{summary['attachments_removed']} removed, {summary['attachments_failed']} failed.")
+    return summary
+
+
+# --- Command Line ---
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Mirror a Confluence space or subtree to local disk.")
+    parser.add_argument("--url", required=True, help="Confluence base URL, e.g. https://confluence.example.com/")
+    parser.add_argument("--space", required=True, help="Space key to export.")
+    parser.add_argument("--root", default=None, help="Only export this page (ID or title) and its subtree.")
+    parser.add_argument("--output", required=True, help="Mirror directory; an existing mirror is refreshed.")
+    parser.add_argument("--pat", default=os.environ.get("CONFLUENCE_PAT"),
+                        help="Confluence Personal Access Token (default: $CONFLUENCE_PAT).")
+    parser.add_argument("--workers", type=int, default=DEFAULT_EXPORT_WORKERS,
+                        help="How many requests run at the same time.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BODY_BATCH_SIZE,
+                        help="How many page bodies are fetched per request.")
+    parser.add_argument("--no-attachments", action="store_true", help="Export page bodies only.")
+    parser.add_argument("--check-attachments", action="store_true",
+                        help="Re-list the attachments of every page, not only of pages with a new version.")
+    parser.add_argument("--rate-limit", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help="Maximum Confluence API requests per second across all workers.")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if not args.pat:
+        print_log("ERROR: No PAT given. Use --pat or set CONFLUENCE_PAT.")
+        return 2
+    api_base_url = f"{args.url.rstrip('/')}/rest/api"
+    headers_content, _ = build_headers(args.pat)
+    workers = max(1, args.workers)
+    configure_request_throttle(args.rate_limit, workers)
+    session = create_http_session(workers)
+    root_page_id = resolve_page_reference_api(args.root, args.space, headers_content, api_base_url, print_log,
+                                              session=session)
+    if args.root and not root_page_id:
+        return 2
+    summary = export_pages(args.space, args.output, headers_content, api_base_url, print_log,
+                           root_page_id=root_page_id, max_workers=workers, session=session,
+                           batch_size=max(1, args.batch_size), include_attachments=not args.no_attachments,
+                           check_all_attachments=args.check_attachments)
+    print_log(describe_request_stats())
+    print_log(describe_metrics_summary())
+    if summary is None:
+        return 2
+    return 1 if summary["pages_failed"] or summary["attachments_failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from html.entities import name2codepoint
+import xml.etree.ElementTree as ET
+from xml.parsers.expat import ErrorString
+
+# One streaming pass over a Confluence storage-format document that collects everything the publisher
+# needs (attachment references, page links, macros, images) and validates the XML locally, so a broken
+# document fails here instead of in a remote create. Results are memoized on the SHA-256 of the content,
+# which keeps Streamlit reruns cheap when the pasted document has not changed.
+
+STORAGE_NAMESPACES = {
+    "ac": "http://atlassian.com/content",
+    "ri": "http://atlassian.com/resource/identifier",
+    "at": "http://atlassian.com/template",
+}
+FEED_CHUNK_SIZE = 64 * 1024
+ANALYSIS_CACHE_SIZE = 32
+
+_XML_PREDEFINED_ENTITIES = {"amp", "lt", "gt", "quot", "apos"}
+# Storage format uses HTML named entities (&nbsp; etc.) and undeclared ac:/ri: prefixes; declare both in a
+# single-line prolog so parse error line numbers still match the user's document.
+_DOCUMENT_PROLOG = (
+    "<!DOCTYPE storage ["
+    + "".join(f'<!ENTITY {name} "&#{codepoint};">' for name, codepoint in sorted(name2codepoint.items())
+              if name not in _XML_PREDEFINED_ENTITIES)
+    + "]><storage " + " ".join(f'xmlns:{prefix}="{uri}"' for prefix, uri in STORAGE_NAMESPACES.items()) + ">"
+)
+_DOCUMENT_EPILOG = "</storage>"
+
+_analysis_cache = OrderedDict()
+_analysis_cache_lock = threading.Lock()
+
+
+def _qualified(prefix, name):
+    return f"{{{STORAGE_NAMESPACES[prefix]}}}{name}"
+
+
+AC_STRUCTURED_MACRO = _qualified("ac", "structured-macro")
+AC_MACRO = _qualified("ac", "macro")
+AC_NAME = _qualified("ac", "name")
+AC_IMAGE = _qualified("ac", "image")
+RI_ATTACHMENT = _qualified("ri", "attachment")
+RI_FILENAME = _qualified("ri", "filename")
+RI_PAGE = _qualified("ri", "page")
+RI_CONTENT_TITLE = _qualified("ri", "content-title")
+RI_SPACE_KEY = _qualified("ri", "space-key")
+RI_URL = _qualified("ri", "url")
+RI_VALUE = _qualified("ri", "value")
+
+
+def _empty_analysis(digest):
+    return {"digest": digest, "attachments": [], "page_links": [], "macros": {}, "images": [], "error": None}
+
+
+def _analyze(storage_content, digest):
+    analysis = _empty_analysis(digest)
+    attachments = {}
+    page_links = {}
+    parser = ET.XMLPullParser(events=("start", "end"))
+    stack = []
+    try:
+        parser.feed(_DOCUMENT_PROLOG)
+        for offset in range(0, len(storage_content), FEED_CHUNK_SIZE):
+            parser.feed(storage_content[offset:offset + FEED_CHUNK_SIZE])
+            for event, element in parser.read_events():
+                if event == "end":
+                    stack.pop()
+                    if len(stack) == 1:
+                        stack[0].clear()
+                    continue
+                parent = stack[-1] if stack else None
+                stack.append(element)
+                if element.tag in (AC_STRUCTURED_MACRO, AC_MACRO):
+                    macro_name = element.get(AC_NAME, "")
+                    analysis["macros"][macro_name] = analysis["macros"].get(macro_name, 0) + 1
+                elif element.tag == RI_ATTACHMENT and element.get(RI_FILENAME):
+                    attachments[element.get(RI_FILENAME)] = True
+                    if parent is not None and parent.tag == AC_IMAGE:
+                        analysis["images"].append({"attachment": element.get(RI_FILENAME)})
+                elif element.tag == RI_URL and parent is not None and parent.tag == AC_IMAGE:
+                    analysis["images"].append({"url": element.get(RI_VALUE)})
+                elif element.tag == RI_PAGE:
+                    page_links[(element.get(RI_SPACE_KEY), element.get(RI_CONTENT_TITLE))] = True
+        parser.feed(_DOCUMENT_EPILOG)
+        parser.close()
+    except ET.ParseError as e:
+        line, column = e.position
+        if line == 1:
+            column = max(0, column - len(_DOCUMENT_PROLOG))
+        analysis["error"] = f"Malformed storage XML at line {line}, column {column + 1}: {ErrorString(e.code)}"
+    analysis["attachments"] = list(attachments)
+    analysis["page_links"] = [{"space_key": space_key, "title": title} for space_key, title in page_links]
+    return analysis
+
+
+def analyze_storage(storage_content):
+    # Returns {"digest", "attachments", "page_links", "macros", "images", "error"}; "error" is None for a
+    # well-formed document. The returned dict is shared with the cache and must not be modified.
+    digest = hashlib.sha256(storage_content.encode('utf-8')).hexdigest()
+    with _analysis_cache_lock:
+        if digest in _analysis_cache:
+            _analysis_cache.move_to_end(digest)
+            return _analysis_cache[digest]
+    analysis = _analyze(storage_content, digest)
+    with _analysis_cache_lock:
+        _analysis_cache[digest] = analysis
+        while len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+    return analysis
@@ -0,0 +1,149 @@
+import html
+import re
+from xml.parsers import expat
+
+from storage_analyzer import _DOCUMENT_PROLOG, _DOCUMENT_EPILOG
+
+# Splits an oversized storage-format document into a parent page and child pages at top-level heading boundaries,
+# so huge pastes (megabytes, hundreds of images) become pages Confluence saves and renders quickly. The parts are
+# sliced from the original text by byte offset, never re-serialized, so entities, CDATA and macro markup come
+# through untouched. The parent keeps the content before the first split heading plus an index linking the
+# children, and every part lists the attachments it references, so each file is uploaded to the page using it.
+
+DEFAULT_SPLIT_MAX_BYTES = 1024 * 1024
+DEFAULT_SPLIT_MAX_IMAGES = 50
+MAX_TITLE_LENGTH = 255
+_HEADING_TAG = re.compile(r"h([1-6])")
+
+
+def _top_level_blocks(storage_content):
+    # One block per top-level heading (plus one for the content before the first heading) with its byte offset,
+    # heading level and text, and the images and attachments inside it. Returns (blocks, content bytes), or
+    # (None, None) if the document is malformed.
+    content_bytes = storage_content.encode('utf-8')
+    prolog_bytes = _DOCUMENT_PROLOG.encode('utf-8')
+    blocks = [{"start": 0, "level": None, "heading": "", "images": 0, "attachments": {}}]
+    state = {"depth": 0, "in_heading": False}
+    parser = expat.ParserCreate()
+
+    def _start(name, attributes):
+        state["depth"] += 1
+        if state["depth"] == 2:
+            heading_match = _HEADING_TAG.fullmatch(name)
+            if heading_match:
+                blocks.append({"start": parser.CurrentByteIndex - len(prolog_bytes),
+                               "level": int(heading_match.group(1)), "heading": "", "images": 0, "attachments": {}})
+                state["in_heading"] = True
+        if name == "ac:image":
+            blocks[-1]["images"] += 1
+        elif name == "ri:attachment" and attributes.get("ri:filename"):
+            blocks[-1]["attachments"][attributes["ri:filename"]] = True
+
+    def _end(name):
+        state["depth"] -= 1
+        if state["depth"] == 1:
+            state["in_heading"] = False
+
+    def _characters(text):
+        if state["in_heading"]:
+            blocks[-1]["heading"] += text
+
+    parser.StartElementHandler = _start
+    parser.EndElementHandler = _end
+    parser.CharacterDataHandler = _characters
+    try:
+        parser.Parse(prolog_bytes, False)
+        parser.Parse(content_bytes, False)
+        parser.Parse(_DOCUMENT_EPILOG.encode('utf-8'), True)
+    except expat.ExpatError:
+        return None, None
+    for block, next_block in zip(blocks, blocks[1:] + [{"start": len(content_bytes)}]):
+        block["bytes"] = next_block["start"] - block["start"]
+        block["heading"] = " ".join(block["heading"].split())
+    return blocks, content_bytes
+
+
+def _exceeds(part, max_bytes, max_images):
+    return bool((max_bytes and part["bytes"] > max_bytes) or (max_images and part["images"] > max_images))
+
+
+def _group_blocks(blocks, split_level):
+    # Starts a new section at every heading of split_level or above; blocks before the first one form the intro.
+    intro = []
+    sections = []
+    for block in blocks:
+        if block["level"] is not None and block["level"] <= split_level:
+            sections.append([block])
+        elif sections:
+            sections[-1].append(block)
+        else:
+            intro.append(block)
+    return intro, sections
+
+
+def _merge_blocks(blocks, content_bytes):
+    if not blocks:
+        return {"body": "", "bytes": 0, "images": 0, "attachments": []}
+    attachments = {}
+    for block in blocks:
+        attachments.update(block["attachments"])
+    start = blocks[0]["start"]
+    end = blocks[-1]["start"] + blocks[-1]["bytes"]
+    return {"body": content_bytes[start:end].decode('utf-8'), "bytes": end - start,
+            "images": sum(block["images"] for block in blocks), "attachments": list(attachments)}
+
+
+def _child_titles(title, headings):
+    titles = []
+    used_titles = set()
+    for number, heading in enumerate(headings, start=1):
+        child_title = f"{title} - {heading or f'Part {number}'}"[:MAX_TITLE_LENGTH].strip()
+        if child_title in used_titles:
+            suffix = f" ({number})"
+            child_title = child_title[:MAX_TITLE_LENGTH - len(suffix)] + suffix
+        used_titles.add(child_title)
+        titles.append(child_title)
+    return titles
+
+
+def build_index(child_titles):
+    links = "".join(f'<li><ac:link><ri:page ri:content-title="{html.escape(child_title)}" /></ac:link></li>'
+                    for child_title in child_titles)
+    return f"<h2>Contents</h2><ol>{links}</ol>"
+
+
+def split_storage(storage_content, title, max_bytes=DEFAULT_SPLIT_MAX_BYTES, max_images=DEFAULT_SPLIT_MAX_IMAGES):
+    # Returns None when the document is within both limits (0 or None disables a limit), is malformed or has no
+    # top-level headings to split at. Otherwise returns {"level", "parent", "children"}: the parent and each
+    # child are {"title", "body", "attachments"} (children also have "heading"). The split level starts at the
+    # highest heading level in the document and goes one level deeper while a section is still over a limit.
+    blocks, content_bytes = _top_level_blocks(storage_content)
+    if blocks is None:
+        return None
+    whole_document = {"bytes": len(content_bytes), "images": sum(block["images"] for block in blocks)}
+    if not _exceeds(whole_document, max_bytes, max_images):
+        return None
+    heading_levels = sorted({block["level"] for block in blocks if block["level"] is not None})
+    intro, sections = [], []
+    for split_level in heading_levels:
+        intro, sections = _group_blocks(blocks, split_level)
+        section_sizes = [{"bytes": sum(block["bytes"] for block in section),
+                          "images": sum(block["images"] for block in section)} for section in sections]
+        if not any(_exceeds(section_size, max_bytes, max_images) for section_size in section_sizes):
+            break
+    if len(sections) < 2:
+        return None
+
+    child_titles = _child_titles(title, [section[0]["heading"] for section in sections])
+    children = [dict(_merge_blocks(section, content_bytes), title=child_title, heading=section[0]["heading"])
+                for section, child_title in zip(sections, child_titles)]
+    parent = _merge_blocks(intro, content_bytes)
+    parent.update(title=title, body=parent["body"] + build_index(child_titles))
+    return {"level": split_level, "parent": parent, "children": children}
+
+
+def describe_split(split):
+    child_sizes = [child["bytes"] for child in split["children"]]
+    return (f"Split at h{split['level']} headings into {len(split['children'])} child page(s) of "
+            f"{min(child_sizes) / 1024:.0f}-{max(child_sizes) / 1024:.0f} KB with up to "
+            f"{max(child['images'] for child in split['children'])} image(s) each.")
@@ -0,0 +1,321 @@
+import io
+import os
+import re
+import csv
+import sys
+import html
+import json
+import string
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from confluence_api import (
+    build_headers, create_http_session, create_confluence_page_storage_api, upsert_page_api,
+    upload_attachments_parallel, list_page_attachments_api, resolve_page_reference_api, file_path_source
+)
+from storage_analyzer import analyze_storage
+from request_layer import DEFAULT_REQUESTS_PER_SECOND, configure_request_throttle, describe_request_stats
+from metrics import describe_metrics_summary
+from bulk_publisher import DEFAULT_PAGE_WORKERS, DEFAULT_UPLOAD_WORKERS
+from cli_log import print_log
+
+# Generates many similar pages (datasheets, per-product pages, ...) from one storage-format template and a
+# CSV, JSON or JSON-lines dataset. Templates use string.Template placeholders ($name or ${name}) for the row's
+# fields; values are XML-escaped in the body unless the field is listed as raw. Rows are read lazily and only
+# a bounded window of pages is rendered and in flight at any time, so the dataset can have any number of rows.
+#
+#   python template_publisher.py --url https://confluence.example.com/ --space DOCS --parent-id 12345 \
+#       --template datasheet.xml --title '${name} Datasheet' --data products.csv \
+#       --attachments '${sku}.png' --attachments-dir assets/ --results results.csv
+
+DATASET_FORMATS = ("csv", "json", "jsonl")
+RESULT_FIELDS = ("row", "title", "page_id", "action", "attachments_succeeded", "attachments_failed",
+                 "attachments_unchanged", "error")
+
+
+class InvalidDatasetRow:
+    # Yielded in place of a row that cannot be read (a malformed JSON line, a value that is not an object), so
+    # that row fails on its own instead of stopping the run.
+    def __init__(self, message):
+        self.message = message
+
+
+def compile_page_template(body_template, title_template, attachments_template="", raw_fields=()):
+    # Parsed once and shared by all rows. attachments_template renders to file names separated by ";", "," or
+    # new lines; files referenced by ri:filename in the rendered body are attached as well.
+    return {"body": string.Template(body_template), "title": string.Template(title_template),
+            "attachments": string.Template(attachments_template or ""), "raw_fields": frozenset(raw_fields)}
+
+
+def render_page(page_template, row):
+    # Returns {"title", "body", "attachments"}; raises KeyError for a placeholder the row does not have and
+    # ValueError for a malformed placeholder.
+    plain_values = {str(key): "" if value is None else str(value) for key, value in row.items()}
+    body_values = {key: value if key in page_template["raw_fields"] else html.escape(value)
+                   for key, value in plain_values.items()}
+    body = page_template["body"].substitute(body_values)
+    attachments = [name.strip() for name in re.split(r"[;,\n]", page_template["attachments"].substitute(plain_values))
+                   if name.strip()]
+    return {"title": " ".join(page_template["title"].substitute(plain_values).split()), "body": body,
+            "attachments": attachments}
+
+
+def dataset_format(filename):
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    return "jsonl" if extension == "ndjson" else extension
+
+
+def _json_row(value):
+    if isinstance(value, dict):
+        return value
+    return InvalidDatasetRow(f"is a JSON {type(value).__name__}, not an object.")
+
+
+def iter_dataset_rows(text_file, data_format):
+    # Yields the rows as dicts, or InvalidDatasetRow for a row that cannot be used. CSV and JSON lines are
+    # streamed; a JSON document (a list of objects, or an object with a "rows" list) has to be parsed whole, so
+    # prefer JSON lines for very large datasets. Raises ValueError if the file as a whole cannot be read.
+    if data_format == "csv":
+        yield from csv.DictReader(text_file)
+    elif data_format == "jsonl":
+        for line in text_file:
+            if not line.strip():
+                continue
+            try:
+                yield _json_row(json.loads(line))
+            except json.JSONDecodeError as e:
+                yield InvalidDatasetRow(f"is not valid JSON: {e}.")
+    elif data_format == "json":
+        data = json.load(text_file)
+        for value in (data.get("rows", []) if isinstance(data, dict) else data):
+            yield _json_row(value)
+    else:
+        raise ValueError(f"Unsupported dataset format '{data_format}' (use one of {', '.join(DATASET_FORMATS)}).")
+
+
+@contextlib.contextmanager
+def open_uploaded_dataset(uploaded_file):
+    # Text view over a Streamlit upload (or any binary file object) for iter_dataset_rows. The wrapper is
+    # detached afterwards so the upload itself stays open for the next rerun.
+    uploaded_file.seek(0)
+    text_file = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline='')
+    try:
+        yield text_file
+    finally:
+        text_file.detach()
+
+
+def publish_template_rows(rows, page_template, space_key, parent_id, headers_content, headers_attachment,
+                          api_base_url, log_func, page_workers=DEFAULT_PAGE_WORKERS,
+                          upload_workers=DEFAULT_UPLOAD_WORKERS, upsert=False, attachment_sources=None,
+                          attachments_dir=None, session=None, result_callback=None, poll_callback=None,
+                          poll_interval=0.5):
+    # Renders and publishes one page per row. At most 2 * page_workers rows are rendered and in flight, so memory
+    # stays flat however many rows there are. Attachments are looked up by name in attachment_sources
+    # ({filename: (file_source, description, size)}; rows upload in parallel, so opening a source must give each
+    # caller its own file object) or in attachments_dir. result_callback(result) gets one dict
+    # per row (RESULT_FIELDS) from this thread as rows finish; poll_callback() is called every poll_interval.
+    summary = {"rows": 0, "pages_created": 0, "pages_updated": 0, "pages_unchanged": 0, "pages_failed": 0,
+               "attachments_succeeded": 0, "attachments_failed": 0, "attachments_unchanged": 0, "dataset_error": None}
+    session = session or create_http_session(page_workers * upload_workers)
+    hash_cache = {}
+
+    def _attachment_job(filename):
+        if attachment_sources and filename in attachment_sources:
+            file_source, _, file_size = attachment_sources[filename]
+            return filename, file_source, file_size
+        file_path = os.path.join(attachments_dir, filename) if attachments_dir else None
+        if file_path and os.path.isfile(file_path):
+            return filename, file_path_source(file_path), os.path.getsize(file_path)
+        return None
+
+    def _publish_row(row_number, row):
+        row_logs = []
+        result = {"row": row_number, "title": None, "page_id": None, "action": None, "attachments_succeeded": 0,
+                  "attachments_failed": 0, "attachments_unchanged": 0, "error": None}
+        if isinstance(row, InvalidDatasetRow):
+            result["error"] = f"Row {row_number} {row.message}"
+        elif not isinstance(row, dict):
+            result["error"] = f"Row {row_number} is a {type(row).__name__}, not a mapping of fields."
+        else:
+            _render_and_publish_row(row_number, row, result, row_logs)
+        if result["error"]:
+            row_logs.append(f"ERROR: {result['error']}")
+        return result, row_logs
+
+    def _render_and_publish_row(row_number, row, result, row_logs):
+        try:
+            page = render_page(page_template, row)
+        except KeyError as e:
+            result["error"] = f"Row {row_number} has no field {e} used by the template."
+        except ValueError as e:
+            result["error"] = f"Template error: {e}"
+        else:
+            result["title"] = page["title"]
+            storage_analysis = analyze_storage(page["body"])
+            if not page["title"]:
+                result["error"] = f"Row {row_number} renders an empty title."
+            elif storage_analysis["error"]:
+                result["error"] = f"Row {row_number} renders malformed storage XML: {storage_analysis['error']}"
+            else:
+                _publish_rendered_page(page, storage_analysis, result, row_logs)
+
+    def _publish_rendered_page(page, storage_analysis, result, row_logs):
+        if upsert:
+            page_info = upsert_page_api(page["title"], space_key, page["body"], parent_id, headers_content,
+                                        api_base_url, row_logs.append, session=session)
+        else:
+            page_info = create_confluence_page_storage_api(page["title"], space_key, page["body"], parent_id,
+                                                           headers_content, api_base_url, row_logs.append,
+                                                           session=session)
+            if page_info:
+                page_info["action"] = "created"
+        if not page_info:
+            result["error"] = f"Could not publish page '{page['title']}'."
+            return
+        result.update(page_id=page_info["id"], action=page_info["action"])
+        filenames = list(dict.fromkeys(page["attachments"] + [os.path.basename(name)
+                                                              for name in storage_analysis["attachments"]]))
+        upload_jobs = []
+        for filename in filenames:
+            upload_job = _attachment_job(filename)
+            if upload_job:
+                upload_jobs.append(upload_job)
+            else:
+                row_logs.append(f"  SKIPPING: Attachment '{filename}' for page '{page['title']}' not found.")
+                result["attachments_failed"] += 1
+        if not upload_jobs:
+            return
+        # A page that already existed keeps its identical attachments, so re-running a dataset is cheap.
+        existing_attachments = list_page_attachments_api(page_info["id"], headers_attachment, api_base_url,
+                                                         row_logs.append, session=session) \
+            if page_info["action"] != "created" else None
+        succeeded, failed, unchanged = upload_attachments_parallel(
+            page_info["id"], upload_jobs, headers_attachment, api_base_url, row_logs.append,
+            max_workers=upload_workers, session=session, existing_attachments=existing_attachments,
+            hash_cache=hash_cache
+        )
+        result["attachments_succeeded"] += succeeded
+        result["attachments_failed"] += failed
+        result["attachments_unchanged"] += unchanged
+
+    max_in_flight = 2 * page_workers
+    row_iterator = enumerate(rows, start=1)
+    log_func(f"Publishing template pages with {page_workers} page worker(s)...")
+    with ThreadPoolExecutor(max_workers=page_workers) as executor:
+        pending = set()
+        rows_left = True
+        rows_read = 0
+        while pending or rows_left:
+            while rows_left and len(pending) < max_in_flight:
+                try:
+                    next_row = next(row_iterator, None)
+                except (ValueError, csv.Error) as e:
+                    # The dataset cannot be read any further; the rows already submitted still finish.
+                    summary["dataset_error"] = f"Could not read the dataset after row {rows_read}: {e}"
+                    log_func(f"ERROR: {summary['dataset_error']}")
+                    next_row = None
+                if next_row is None:
+                    rows_left = False
+                else:
+                    rows_read = next_row[0]
+                    pending.add(executor.submit(_publish_row, *next_row))
+            if not pending:
+                break
+            done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                result, row_logs = future.result()
+                for line in row_logs:
+                    log_func(line)
+                summary["rows"] += 1
+                if result["error"]:
+                    summary["pages_failed"] += 1
+                else:
+                    summary[f"pages_{result['action']}"] += 1
+                summary["attachments_succeeded"] += result["attachments_succeeded"]
+                summary["attachments_failed"] += result["attachments_failed"]
+                summary["attachments_unchanged"] += result["attachments_unchanged"]
+                if result_callback:
+                    result_callback(result)
+            if poll_callback:
+                poll_callback()
+
+    log_func(f"Template summary: {summary['rows']} row(s), {summary['pages_created']} page(s) created, "
+             f"{summary['pages_updated']} updated, {summary['pages_unchanged']} unchanged, "
+             f"{summary['pages_failed']} failed. Attachments: {summary['attachments_succeeded']} succeeded, "
+             f"{summary['attachments_unchanged']} unchanged, {summary['attachments_failed']} failed/skipped.")
+    return summary
+
+
+# --- Command Line ---
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Publish one Confluence page per row of a CSV/JSON dataset.")
+    parser.add_argument("--url", required=True, help="Confluence base URL, e.g. https://confluence.example.com/")
+    parser.add_argument("--space", required=True, help="Space key to publish into.")
+    parser.add_argument("--parent-id", default=None, help="Page ID or title of the parent page (default: space root).")
+    parser.add_argument("--template", required=True, help="Storage-format XML template file ($field placeholders).")
+    parser.add_argument("--title", required=True, help="Title template, e.g. '${name} Datasheet'.")
+    parser.add_argument("--data", required=True, help="Dataset file: .csv, .json or .jsonl.")
+    parser.add_argument("--attachments", default="",
+                        help="Attachment names template, e.g. '${sku}.png;${sku}.pdf' (separated by ; or ,).")
+    parser.add_argument("--attachments-dir", default=None, help="Directory the attachment files are taken from.")
+    parser.add_argument("--raw-field", action="append", default=[],
+                        help="Field inserted into the body without XML escaping, e.g. one holding storage XML "
+                             "(repeatable).")
+    parser.add_argument("--pat", default=os.environ.get("CONFLUENCE_PAT"),
+                        help="Confluence Personal Access Token (default: $CONFLUENCE_PAT).")
+    parser.add_argument("--page-workers", type=int, default=DEFAULT_PAGE_WORKERS,
+                        help="How many pages are published at the same time.")
+    parser.add_argument("--upload-workers", type=int, default=DEFAULT_UPLOAD_WORKERS,
+                        help="How many attachments are uploaded at the same time per page.")
+    parser.add_argument("--rate-limit", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help="Maximum Confluence API requests per second across all workers.")
+    parser.add_argument("--upsert", action="store_true",
+                        help="Update pages that already exist (matched by space and title) instead of failing.")
+    parser.add_argument("--results", default=None, help="Write one line per row (page ID, action, errors) to this CSV.")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if not args.pat:
+        print_log("ERROR: No PAT given. Use --pat or set CONFLUENCE_PAT.")
+        return 2
+    data_format = dataset_format(args.data)
+    if data_format not in DATASET_FORMATS:
+        print_log(f"ERROR: '{args.data}' is not a .csv, .json or .jsonl file.")
+        return 2
+    with open(args.template, 'r', encoding='utf-8') as f:
+        page_template = compile_page_template(f.read(), args.title, args.attachments, raw_fields=args.raw_field)
+    api_base_url = f"{args.url.rstrip('/')}/rest/api"
+    headers_content, headers_attachment = build_headers(args.pat)
+    page_workers = max(1, args.page_workers)
+    upload_workers = max(1, args.upload_workers)
+    configure_request_throttle(args.rate_limit, page_workers * upload_workers)
+    parent_id = resolve_page_reference_api(args.parent_id, args.space, headers_content, api_base_url, print_log)
+    if args.parent_id and not parent_id:
+        return 2
+
+    results_file = open(args.results, 'w', encoding='utf-8', newline='') if args.results else None
+    try:
+        results_writer = csv.DictWriter(results_file, fieldnames=RESULT_FIELDS) if results_file else None
+        if results_writer:
+            results_writer.writeheader()
+        with open(args.data, 'r', encoding='utf-8-sig', newline='') as data_file:
+            summary = publish_template_rows(
+                iter_dataset_rows(data_file, data_format), page_template, args.space, parent_id, headers_content,
+                headers_attachment, api_base_url, print_log, page_workers=page_workers,
+                upload_workers=upload_workers, upsert=args.upsert, attachments_dir=args.attachments_dir,
+                result_callback=results_writer.writerow if results_writer else None
+            )
+    finally:
+        if results_file:
+            results_file.close()
+    print_log(describe_request_stats())
+    print_log(describe_metrics_summary())
+    return 1 if summary["pages_failed"] or summary["attachments_failed"] or summary["dataset_error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())